@@ -1,34 +1,39 @@
-from gi.repository import Gtk, Gdk
-import cairo
-import utils
+from gi.repository import Gtk, Gdk, GLib
+import time
 
-from drawtask import TASK_HEIGHT
-from background import Background
+from geometry import Geometry
+from perf import counters
+from render import AllDayTasksRenderer
+from text_metrics import metrics
+from tracing import traced
 
+# wait this long (ms) after the last size-allocate before relayouting
+RELAYOUT_DELAY = 100
 
-class AllDayTasks(Gtk.DrawingArea):
+
+class AllDayTasks(Gtk.DrawingArea, AllDayTasksRenderer):
     def __init__(self, parent, rows=1, cols=7):
-        super(Gtk.DrawingArea, self).__init__()
+        Gtk.DrawingArea.__init__(self)
+        AllDayTasksRenderer.__init__(self, rows, cols)
 
         self.par = parent
-        self.num_rows = rows
-        self.num_columns = cols
-        self.background = Background(rows, cols)
-
-        self.padding = 1.5
-        self.font = "Courier"
-        self.font_size = 12
-        self.font_color = (0.35, 0.31, 0.24)
-        self.link_color = (0, 0, 255, 0.5)  # default blue link color
-        self.today_cell = (None, None)
-        self.selected_task = None
-        self.faded_cells = []
-        self.cells = []
-        self.labels = None
-        self.label_height = self.font_size
-        self.overflow_links = []
+
+        # what was on screen the last time a redraw was queued, so that only
+        # the regions that actually changed are invalidated
+        self._drawn_frame = None
+        self._drawn_tasks = {}
+        self._drawn_links = []
+
+        # called once interactive resizing settles down
+        self.relayout_callback = None
+        self._relayout_timeout = None
+
+        # performance overlay, see set_hud_visible()
+        self.hud_visible = False
+        self._hud_bounds = None
 
         self.connect("draw", self.draw)
+        self.connect("size-allocate", self.on_size_allocate)
 
         # drag-and-drop signals and events
         self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK
@@ -36,125 +41,221 @@ class AllDayTasks(Gtk.DrawingArea):
                         | Gdk.EventMask.BUTTON1_MOTION_MASK
                         | Gdk.EventMask.POINTER_MOTION_MASK)
 
-    def get_label_height(self):
-        if self.labels:
-          return self.label_height
-        return 0
-
-    def set_labels(self, labels):
-        self.labels = labels
-
     def set_num_rows(self, rows):
-        self.num_rows = rows
-        self.background.set_num_rows(rows)
-
-    def set_font(self, font):
-        self.font = font
+        AllDayTasksRenderer.set_num_rows(self, rows)
+        self.geometry = None
 
-    def set_font_size(self, size):
-        self.font_size = size
+    def get_geometry(self):
+        """
+        Returns the Geometry for the current allocation, computing it only
+        when the allocation or the number of rows/columns changed.
+        """
+        geometry = self.geometry
+        if geometry is None or geometry.num_rows != self.num_rows or \
+           geometry.num_cols != self.num_columns:
+            alloc = self.get_allocation()
+            geometry = Geometry(alloc.width, alloc.height,
+                                self.num_rows, self.num_columns)
+            self.geometry = geometry
+        return geometry
+
+    def set_hud_visible(self, visible):
+        """
+        Shows or hides an overlay with live performance counters: frame and
+        layout times, amount of layout work, cache hit rates and coalesced
+        motion events.
+        """
+        self.hud_visible = visible
+        self._hud_bounds = None
+        self.queue_draw()
+
+    def toggle_hud(self):
+        self.set_hud_visible(not self.hud_visible)
+
+    def get_hud_lines(self):
+        """ Returns the lines of text shown by the performance overlay. """
+        update = counters.last_update
+        lines = ["frame  %6.1f ms  p95 %6.1f ms"
+                 % (counters.get_last_frame() * 1000,
+                    counters.get_frame_percentile(95) * 1000),
+                 "layout %6.1f ms" % (update.get('time', 0) * 1000),
+                 "drawtasks %d" % update.get('drawtasks_built', 0),
+                 "grid rows %d  cells %d"
+                 % (update.get('grid_rows_scanned', 0),
+                    update.get('grid_cells_scanned', 0)),
+                 "text cache hits %3.0f%%" % (metrics.hit_rate() * 100)]
+        get_motion_stats = getattr(self.par, 'get_motion_stats', None)
+        if get_motion_stats is not None:
+            lines.append("motion coalesced %d"
+                         % get_motion_stats().get('dropped', 0))
+        return lines
+
+    def queue_draw_hud(self):
+        """ Invalidates the region of the performance overlay, if shown. """
+        if not self.hud_visible:
+            return
+        rects = [self.get_overlay_bounds(self.get_hud_lines())]
+        if self._hud_bounds is not None:
+            rects.append(self._hud_bounds)
+        self._hud_bounds = rects[0]
+        self.queue_draw_rects(rects)
+
+    def set_relayout_callback(self, callback):
+        """
+        Sets a function to be called once the widget was resized and
+        interactive resizing settled down, so that layout depending on the
+        allocation (e.g. how many tasks fit in a week) can be recomputed.
+        """
+        self.relayout_callback = callback
 
-    def set_font_color(self, color):
-        self.font_color = color
+    def on_size_allocate(self, widget, alloc):
+        """
+        Recomputes the geometry for the new allocation, and debounces the
+        relayout callback while the window is being resized.
+        """
+        geometry = self.geometry
+        if geometry is not None and geometry.matches(
+                alloc.width, alloc.height, self.num_rows, self.num_columns):
+            return
+        self.geometry = Geometry(alloc.width, alloc.height,
+                                 self.num_rows, self.num_columns)
+        if self.relayout_callback is None:
+            return
+        if self._relayout_timeout is not None:
+            GLib.source_remove(self._relayout_timeout)
+        self._relayout_timeout = GLib.timeout_add(RELAYOUT_DELAY,
+                                                  self._on_relayout_timeout)
+
+    def _on_relayout_timeout(self):
+        self._relayout_timeout = None
+        self.relayout_callback()
+        return False
+
+    def _get_frame_state(self):
+        """ Everything that, when changed, requires a full redraw. """
+        alloc = self.get_allocation()
+        return (alloc.width, alloc.height, self.num_rows, self.num_columns,
+                self.today_cell, self.labels, list(self.faded_cells))
 
-    def set_line_color(self, color):
-        self.background.set_line_color(color)
+    def _get_tasks_state(self):
+        tasks = {}
+        for dtask in self.drawtasks:
+            selected = self.is_selected(dtask.get_id())
+            tasks[(dtask.get_id(), dtask.get_week_num())] = \
+                (dtask, dtask.get_state(selected))
+        return tasks
 
-    def set_background_color(self, color):
-        self.background.set_background_color(color)
+    def queue_draw_rects(self, rects):
+        """
+        Invalidates only the given @rects, a list of (x, y, w, h) tuples.
+        A small margin is added to cover the stroke and antialiasing.
+        """
+        margin = 2
+        for (x, y, w, h) in rects:
+            if w <= 0 or h <= 0:
+                continue
+            self.queue_draw_area(int(x) - margin, int(y) - margin,
+                                 int(w) + 2*margin + 1, int(h) + 2*margin + 1)
 
-    def get_day_width(self):
-        return self.get_allocation().width / float(self.num_columns)
+    def queue_draw_changes(self):
+        """
+        Compares what is about to be drawn with what was drawn before, and
+        invalidates only the regions that changed: old and new bounds of
+        tasks that moved or changed appearance, and overflow links.
+        Changes that affect the whole widget (size, dates, labels) fall back
+        to a full redraw.
+        """
+        frame = self._get_frame_state()
+        tasks = self._get_tasks_state()
+        links = list(self.overflow_links)
 
-    def get_week_height(self):
-        return self.get_allocation().height / float(self.num_rows)
+        if frame != self._drawn_frame:
+            self.queue_draw()
+        else:
+            rects = []
+            for key, (dtask, state) in tasks.items():
+                old = self._drawn_tasks.get(key)
+                if old is None or old[1] != state:
+                    rects.append(self.get_task_bounds(dtask))
+                    if old is not None:
+                        rects.append(self.get_task_bounds(old[0]))
+            for key, (dtask, state) in self._drawn_tasks.items():
+                if key not in tasks:
+                    rects.append(self.get_task_bounds(dtask))
+            if links != self._drawn_links:
+                old_links = set(self._drawn_links)
+                new_links = set(links)
+                for link in old_links.symmetric_difference(new_links):
+                    rects.append(self.get_link_bounds(link))
+            self.queue_draw_rects(rects)
+
+        self._drawn_frame = frame
+        self._drawn_tasks = tasks
+        self._drawn_links = links
+        self.queue_draw_hud()
+
+    def set_cells(self, cells):
+        """
+        Sets the @cells being highlighted while dragging to create a new
+        task, invalidating only the cells that were added or removed.
+        """
+        changed = set(self.cells).symmetric_difference(cells)
+        self.cells = cells
+        self.queue_draw_rects([self.get_cell_bounds(row, col)
+                               for (row, col) in changed])
 
-    def set_tasks_to_draw(self, drawtasks):
-        self.drawtasks = drawtasks
+    @staticmethod
+    def is_extending_selection(event):
+        """
+        Returns True if the button @event was made with Ctrl or Shift held,
+        which adds tasks to the selection instead of replacing it.
+        """
+        return bool(event.state & (Gdk.ModifierType.CONTROL_MASK |
+                                   Gdk.ModifierType.SHIFT_MASK))
 
-    def highlight_cells(self, ctx, cells, color, alpha=0.5):
-        alloc = self.get_allocation()
-        for cell in cells:
-            row, col = cell
-            if 0 <= row < self.num_rows and 0 <= col < self.num_columns:
-                ctx.save()
-                self.background.highlight_cell(ctx, row, col, alloc,
-                                               color, alpha)
-                ctx.restore()
-
-    def set_today_cell(self, row, col):
-        if 0 <= row < self.num_rows and 0 <= col < self.num_columns:
-            self.today_cell = (row, col)
-        else:
-            self.today_cell = (None, None)
+    def set_drag_preview(self, offset):
+        """
+        Draws the selected tasks shifted by @offset, a (dx, dy) tuple, or
+        back in place if None. Only the regions of the selected tasks are
+        invalidated, so following the pointer needs no relayout.
+        """
+        self._set_preview('drag_preview', offset)
 
+    def set_resize_preview(self, resize):
+        """
+        Outlines the selected tasks as they will be once resized, @resize
+        being a (drag_action, dx) tuple, see AllDayTasksRenderer, or stops
+        outlining them if None.
+        """
+        self._set_preview('resize_preview', resize)
+
+    def _set_preview(self, name, value):
+        rects = []
+        selected = [dtask for dtask in self.drawtasks
+                    if self.is_selected(dtask.get_id())]
+        for dtask in selected:
+            rects.append(self.get_task_bounds(dtask))
+            rects.append(self.get_preview_bounds(dtask))
+        setattr(self, name, value)
+        for dtask in selected:
+            rects.append(self.get_preview_bounds(dtask))
+        self.queue_draw_rects(rects)
+
+    def set_rubber_band(self, rect):
+        """ Shows the selection rubber band at @rect, or hides it if None. """
+        rects = [r for r in (self.rubber_band, rect) if r is not None]
+        self.rubber_band = rect
+        self.queue_draw_rects(rects)
+
+    @traced('draw')
     def draw(self, widget, ctx):
-        ctx.set_line_width(0.8)
-        ctx.set_font_size(self.font_size)
-        ctx.select_font_face(self.font, cairo.FONT_SLANT_NORMAL,
-                             cairo.FONT_WEIGHT_NORMAL)
-
-        # first draw background
-        ctx.save()
-        alloc = self.get_allocation()
-        self.set_line_color(color=(0.35, 0.31, 0.24, 0.15))
-        row, col = self.today_cell
-        if row is not None and col is not None and row >= 0 and col >= 0:
-            self.background.highlight_cell(ctx, row, col, alloc)
-        self.background.draw(ctx, alloc, vgrid=True, hgrid=True)
-        ctx.restore()
-
-        # then draw labels, if any (used only on month_view)
-        if self.labels:
-            ctx.save()
-            color = self.font_color
-            ctx.set_source_rgb(color[0], color[1], color[2])
-            for j, week in enumerate(self.labels):
-                for i, day in enumerate(week):
-                    base_x = i * self.get_day_width() + self.padding
-                    base_y = j * self.get_week_height() + self.label_height
-                    ctx.move_to(base_x, base_y)
-                    ctx.text_path(day)
-                    ctx.stroke()
-            ctx.restore()
-
-        # fade days not in current month
-        if self.faded_cells:
-            self.highlight_cells(ctx, self.faded_cells, color=(0.8, 0.8, 0.8))
-
-        # then draw links when there is overflowing tasks (only in month_view)
-        if self.overflow_links:
-            ctx.save()
-            color = self.link_color
-            ctx.set_source_rgba(color[0], color[1], color[2], color[3])
-            for link in self.overflow_links:
-                (text, row, col) = link
-                w = ctx.text_extents(text)[2]
-                base_x = (col+1) * self.get_day_width() - w - 3*self.padding
-                base_y = row * self.get_week_height() + self.label_height
-                ctx.move_to(base_x, base_y)
-                ctx.text_path(text)
-                # underline
-                y = base_y + 2
-                ctx.move_to(base_x, y)
-                ctx.line_to(base_x + w, y)
-                ctx.stroke()
-            ctx.restore()
-
-        # then draw all tasks
-        for dtask in self.drawtasks:
-            selected = self.selected_task and \
-                (dtask.get_id() == self.selected_task)
-            ctx.save()
-            dtask.draw(ctx, self.get_day_width(), self.padding, selected,
-                       self.get_week_height())
-            ctx.restore()
-
-        # if dragging cells to create new task, highlight them now
-        if self.cells:
-            self.highlight_cells(ctx, self.cells, color=(0.8, 0.8, 0),
-                alpha=0.1)
+        start = time.perf_counter()
+        self.render(ctx, self.get_allocation())
+        counters.add_frame(time.perf_counter() - start)
+        if self.hud_visible:
+            self.render_overlay(ctx, self.get_hud_lines())
 
+    @traced('draw')
     def identify_pointed_object(self, event, clicked=False):
         """
         Identify the object inside drawing area that is being pointed by the
@@ -164,49 +265,18 @@ class AllDayTasks(Gtk.DrawingArea):
         @param clicked: bool, indicates whether or not the user clicked on the
         object being pointed
         """
-        expand_border = 10
-        cursor = Gdk.Cursor.new(Gdk.CursorType.ARROW)
-        drag_action = None
-
-        if clicked:
-            cursor = Gdk.Cursor.new(Gdk.CursorType.HAND1)
-
-        if self.overflow_links:
-            for link in self.overflow_links:
-                (text, row, col) = link
-                # h, w = ctx.text_extents(text)[1:3]
-                # FIXME: more generic values for h and w
-                h = self.font_size
-                w = self.font_size/2 * len(text)
-                base_x = (col+1) * self.get_day_width() - w - 3*self.padding
-                base_y = row * self.get_week_height() + self.label_height
-                if base_x <= event.x <= base_x + w and \
-                   base_y - h <= event.y <= base_y:
-                    drag_action = "click_link"
-                    cursor = Gdk.Cursor.new(Gdk.CursorType.HAND1)
-
-        for task in self.drawtasks:
-            (x, y, w, h) = utils.convert_grid_to_screen_coord(
-                self.get_day_width(), TASK_HEIGHT, *task.get_position(),
-                padding=self.padding)
-
-            # calculating week position when in month view
-            if task.get_week_num() is not None:
-                y += task.get_week_num() * self.get_week_height() + 15
-
-            if not y < event.y < (y + h):
-                continue
-            if x <= event.x <= x + expand_border:
-                drag_action = "expand_left"
-                cursor = Gdk.Cursor.new(Gdk.CursorType.LEFT_SIDE)
-            elif (x + w) - expand_border <= event.x <= (x + w):
-                drag_action = "expand_right"
-                cursor = Gdk.Cursor.new(Gdk.CursorType.RIGHT_SIDE)
-            elif x <= event.x <= (x + w):
-                drag_action = "move"
-                if clicked:
-                    cursor = Gdk.Cursor.new(Gdk.CursorType.FLEUR)
-            else:
-                continue
-            return task.get_id(), drag_action, cursor
-        return None, drag_action, cursor
+        task_id, drag_action = self.find_pointed_object(event.x, event.y)
+
+        if drag_action == "click_link":
+            cursor_type = Gdk.CursorType.HAND1
+        elif drag_action == "expand_left":
+            cursor_type = Gdk.CursorType.LEFT_SIDE
+        elif drag_action == "expand_right":
+            cursor_type = Gdk.CursorType.RIGHT_SIDE
+        elif drag_action == "move" and clicked:
+            cursor_type = Gdk.CursorType.FLEUR
+        elif clicked:
+            cursor_type = Gdk.CursorType.HAND1
+        else:
+            cursor_type = Gdk.CursorType.ARROW
+        return task_id, drag_action, Gdk.Cursor.new(cursor_type)
@@ -1,14 +1,14 @@
-from gi.repository import Gtk
+class Background(object):
+    """
+    Draws the grid lines and highlighted cells of a calendar area. It is not
+    a widget itself: it draws on whatever Cairo context it is given.
+    """
 
-
-class Background(Gtk.DrawingArea):
     def __init__(self, rows=1, cols=7):
-        super(Background, self).__init__()
         self.num_rows = rows
         self.num_columns = cols
         self.bg_color = None
         self.line_color = (0.35, 0.31, 0.24, 1)
-        self.connect("draw", self.draw)
 
     def set_num_rows(self, rows):
         self.num_rows = rows
@@ -0,0 +1,238 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import layout
+import synthetic
+from dates import Date
+from datastore import DataStore
+from grid import Grid
+from week import WeekSpan
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+# Grid.add_to_grid is quadratic: cap the number of spans placed in one grid
+MAX_GRID_SPANS = 2000
+
+
+def timeit(func, repeat=5, number=1):
+    """
+    Times @func, calling it @number times per run for @repeat runs.
+
+    @return stats: dictionary with the min, median and max seconds per call.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {'min': min(times),
+            'median': statistics.median(times),
+            'max': max(times),
+            'repeat': repeat,
+            'number': number}
+
+
+def bench_layout(ds, first_day, repeat):
+    """
+    Times the layout done by update_drawtasks() for each view type,
+    including fetching the tasks from the requester like the views do.
+    """
+    req = ds.get_requester()
+    results = {}
+    for name, numweeks in (('week', 1), ('two_weeks', 2)):
+        span = WeekSpan(numweeks)
+        span.week_containing_day(first_day)
+        grid = Grid(1, 7 * numweeks)
+
+        def run():
+            tasks = [req.get_task(t) for t in req.get_tasks_tree()]
+            layout.layout_week(tasks, span.start_date, span.end_date, grid)
+        results['layout_' + name] = timeit(run, repeat)
+
+    def run_month():
+        weeks = layout.month_weeks(first_day.year, first_day.month)
+        tasks = [req.get_task(t) for t in req.get_tasks_tree()]
+        tasks.sort(key=layout.task_duration, reverse=True)
+        layout.layout_month(tasks, weeks, visible_rows=4)
+    results['layout_month'] = timeit(run_month, repeat)
+    return results
+
+
+def bench_grid(count, repeat, seed=7):
+    """
+    Times Grid.add_to_grid for @count random spans in one week (at most
+    MAX_GRID_SPANS of them).
+    """
+    count = min(count, MAX_GRID_SPANS)
+    rng = random.Random(seed)
+    spans = []
+    for i in range(count):
+        x = rng.randrange(7)
+        spans.append((x, rng.randint(1, 7 - x)))
+
+    def run():
+        grid = Grid(1, 7)
+        for x, w in spans:
+            grid.add_to_grid(x, w)
+    stats = timeit(run, repeat)
+    stats['spans'] = count
+    return {'grid_add_to_grid': stats}
+
+
+def bench_dates(count, repeat):
+    """ Times parsing @count dates in ISO format, and fuzzy dates. """
+    day = datetime.date.today()
+    iso = [(day + datetime.timedelta(days=i % 3650)).isoformat()
+           for i in range(count)]
+    fuzzy = ['now', 'soon', 'someday', ''] * (count // 4)
+    return {'date_parse_iso': timeit(lambda: [Date(v) for v in iso], repeat),
+            'date_parse_fuzzy': timeit(lambda: [Date(v) for v in fuzzy],
+                                       repeat)}
+
+
+def bench_filter(ds, first_day, repeat):
+    """ Times filtering all the tasks shown in a month, as in
+    is_in_days_range(). """
+    weeks = layout.month_weeks(first_day.year, first_day.month)
+    start, end = weeks[0]['dates'].start_date, weeks[-1]['dates'].end_date
+    tasks = [ds.get_task(t) for t in ds.get_all_tasks()]
+
+    def run():
+        return [t for t in tasks if layout.is_in_range(t, start, end)]
+    return {'is_in_days_range': timeit(run, repeat)}
+
+
+def bench_datastore(ds, repeat, lookups=10000, seed=7):
+    """ Times the most common datastore queries. """
+    rng = random.Random(seed)
+    ids = ds.get_all_tasks()
+    sample = [rng.choice(ids) for i in range(lookups)]
+    return {
+        'ds_get_all_tasks': timeit(ds.get_all_tasks, repeat),
+        'ds_get_task_x%d' % lookups: timeit(
+            lambda: [ds.get_task(t) for t in sample], repeat),
+        'ds_has_task_x%d' % lookups: timeit(
+            lambda: [ds.has_task(t) for t in sample], repeat),
+        'ds_get_random_task': timeit(ds.get_random_task, repeat, 100),
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=5, **generator_args):
+    """
+    Runs every benchmark for each one of the dataset @sizes.
+
+    @param sizes: list of integers, number of tasks in each dataset.
+    @param repeat: integer, number of runs of each benchmark.
+    @param generator_args: passed on to synthetic.generate_records().
+    @return results: dictionary ready to be dumped as JSON.
+    """
+    first_day = generator_args.get('start') or datetime.date.today()
+    runs = []
+    for size in sizes:
+        start = time.perf_counter()
+        ds = synthetic.populate(DataStore(), size, **generator_args)
+        populate_time = time.perf_counter() - start
+
+        timings = {'populate': {'min': populate_time,
+                                'median': populate_time,
+                                'max': populate_time,
+                                'repeat': 1, 'number': 1}}
+        timings.update(bench_layout(ds, first_day, repeat))
+        timings.update(bench_grid(size, repeat))
+        timings.update(bench_dates(size, repeat))
+        timings.update(bench_filter(ds, first_day, repeat))
+        timings.update(bench_datastore(ds, repeat))
+        runs.append({'size': size, 'timings': timings})
+
+    params = dict(generator_args)
+    if params.get('start'):
+        params['start'] = params['start'].isoformat()
+    return {'created': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'generator': params,
+            'repeat': repeat,
+            'runs': runs}
+
+
+def compare(old, new, threshold=0.2):
+    """
+    Compares two benchmark results, as returned by run_benchmarks.
+
+    @param threshold: float, relative slowdown of the median above which a
+                      benchmark is reported as a regression.
+    @return regressions: list of (size, name, old_median, new_median).
+    """
+    old_runs = dict((run['size'], run['timings']) for run in old['runs'])
+    regressions = []
+    for run in new['runs']:
+        old_timings = old_runs.get(run['size'], {})
+        for name, stats in sorted(run['timings'].items()):
+            if name not in old_timings:
+                continue
+            before = old_timings[name]['median']
+            after = stats['median']
+            if before > 0 and (after - before) / before > threshold:
+                regressions.append((run['size'], name, before, after))
+    return regressions
+
+
+def add_arguments(parser):
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma separated number of tasks "
+                             "(default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--mean-span', type=float, default=2)
+    parser.add_argument('--span-distribution', default='geometric',
+                        choices=synthetic.SPAN_DISTRIBUTIONS)
+    parser.add_argument('--clustering', type=float, default=0.0)
+    parser.add_argument('--done-ratio', type=float, default=0.3)
+    parser.add_argument('--output', '-o', help="write JSON results here")
+    parser.add_argument('--compare', help="previous JSON results to compare "
+                                          "against; exits 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=0.2)
+
+
+def run(args):
+    sizes = [int(s) for s in args.sizes.split(',')]
+    results = run_benchmarks(sizes, args.repeat, seed=args.seed,
+                             mean_span=args.mean_span,
+                             span_distribution=args.span_distribution,
+                             clustering=args.clustering,
+                             done_ratio=args.done_ratio)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        regressions = compare(old, results, args.threshold)
+        for size, name, before, after in regressions:
+            print("REGRESSION %s (%d tasks): %.6fs -> %.6fs"
+                  % (name, size, before, after), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks layout, queries and date handling.")
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+
+import cairo
+
+import layout
+import synthetic
+from background import Background
+from drawtask import TASK_HEIGHT
+from grid import Grid, Rect
+from render import AllDayTasksRenderer, HeaderRenderer
+from text_metrics import metrics
+from week import WeekSpan
+
+DEFAULT_TASK_COUNTS = (10, 100, 1000)
+DEFAULT_SURFACE_SIZES = ((640, 480), (1920, 1080), (3840, 2160))
+DEFAULT_LABEL_LENGTHS = (5, 20, 80)
+
+
+class CountingContext(object):
+    """
+    Wraps a cairo.Context and counts how many times each one of its methods
+    is called, so that draw paths can be compared by the amount of work
+    they ask from Cairo, not only by their run time.
+    """
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self.counts = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._ctx, name)
+        if not callable(attr):
+            return attr
+        counts = self.counts
+
+        def counted(*args, **kwargs):
+            counts[name] = counts.get(name, 0) + 1
+            return attr(*args, **kwargs)
+        return counted
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def percentile(values, pct):
+    """ Returns the @pct percentile (0-100) of a list of @values. """
+    values = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def make_tasks(count, label_length, first_day, seed=7):
+    """
+    Creates @count synthetic tasks spread over the month of @first_day, with
+    titles @label_length characters long.
+    """
+    tasks = []
+    records = synthetic.generate_records(count, seed=seed, start=first_day,
+                                         days=28)
+    for record in records:
+        task = synthetic.record_to_task(record)
+        title = (task.get_title() + ' ') * (label_length // 4 + 1)
+        task.set_title(title[:label_length])
+        tasks.append(task)
+    tasks.sort(key=layout.task_duration, reverse=True)
+    return tasks
+
+
+def month_renderer(tasks, first_day, width, height):
+    """ Builds an AllDayTasksRenderer laid out as the month view. """
+    weeks = layout.month_weeks(first_day.year, first_day.month)
+    renderer = AllDayTasksRenderer(len(weeks), 7)
+    renderer.set_size(width, height)
+    renderer.set_labels([week['dates'].label("%d") for week in weeks])
+    renderer.faded_cells = layout.faded_cells(weeks, first_day.month)
+    visible_rows = renderer.get_geometry().visible_rows(
+        TASK_HEIGHT, renderer.get_label_height(), minimum=4)
+    dtasks, renderer.overflow_links = layout.layout_month(tasks, weeks,
+                                                          visible_rows)
+    renderer.set_tasks_to_draw(dtasks)
+    return renderer
+
+
+def week_renderer(tasks, first_day, width, height):
+    """ Builds an AllDayTasksRenderer laid out as the week view. """
+    span = WeekSpan()
+    span.week_containing_day(first_day)
+    renderer = AllDayTasksRenderer(1, 7)
+    renderer.set_size(width, height)
+    renderer.set_tasks_to_draw(layout.layout_week(
+        tasks, span.start_date, span.end_date, Grid(1, 7)))
+    return renderer
+
+
+def measure(draw, width, height, frames, cold=False):
+    """
+    Calls @draw(ctx, area) for @frames frames on a fresh ImageSurface.
+
+    @param cold: bool, whether text measurements are forgotten every frame.
+    @return stats: dictionary with per-frame time percentiles (in seconds)
+                   and the number of Cairo calls made per frame.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    area = Rect(0, 0, width, height)
+    times = []
+    counts = {}
+    for i in range(frames):
+        if cold:
+            metrics.clear()
+        ctx = CountingContext(cairo.Context(surface))
+        start = time.perf_counter()
+        draw(ctx, area)
+        surface.flush()
+        times.append(time.perf_counter() - start)
+        counts = ctx.counts
+    return {'p50': percentile(times, 50),
+            'p95': percentile(times, 95),
+            'p99': percentile(times, 99),
+            'max': max(times),
+            'frames': frames,
+            'cairo_calls': sum(counts.values()),
+            'cairo_calls_by_name': counts}
+
+
+def bench_case(count, size, label_length, frames, cold, first_day):
+    """ Measures every draw path for one combination of parameters. """
+    width, height = size
+    tasks = make_tasks(count, label_length, first_day)
+    results = {}
+
+    month = month_renderer(tasks, first_day, width, height)
+    results['all_day_tasks_month'] = measure(month.render, width, height,
+                                             frames, cold)
+
+    week = week_renderer(tasks, first_day, width, height)
+    results['all_day_tasks_week'] = measure(week.render, width, height,
+                                            frames, cold)
+
+    # DrawTask.draw on its own, for every task of the week view
+    def draw_tasks(ctx, area):
+        day_width = week.get_day_width()
+        for dtask in week.drawtasks:
+            ctx.save()
+            dtask.draw(ctx, day_width, week.padding)
+            ctx.restore()
+    results['drawtask'] = measure(draw_tasks, width, height, frames, cold)
+
+    header = HeaderRenderer(7)
+    span = WeekSpan()
+    span.week_containing_day(first_day)
+    header.set_labels([d.split() for d in span.label("%a %m/%d")])
+    results['header'] = measure(header.render, width, 35, frames, cold)
+
+    background = Background(len(month.labels), 7)
+
+    def draw_background(ctx, area):
+        background.draw(ctx, area, vgrid=True, hgrid=True)
+    results['background'] = measure(draw_background, width, height,
+                                    frames, cold)
+    return results
+
+
+def run_benchmarks(task_counts=DEFAULT_TASK_COUNTS,
+                   surface_sizes=DEFAULT_SURFACE_SIZES,
+                   label_lengths=DEFAULT_LABEL_LENGTHS, frames=30,
+                   cold=False, first_day=None):
+    """
+    Sweeps task counts, surface sizes and label lengths, measuring each
+    draw path on an offscreen surface.
+
+    @return results: dictionary ready to be dumped as JSON.
+    """
+    if first_day is None:
+        first_day = datetime.date.today().replace(day=1)
+    cases = []
+    for count in task_counts:
+        for size in surface_sizes:
+            for label_length in label_lengths:
+                cases.append({
+                    'tasks': count,
+                    'width': size[0],
+                    'height': size[1],
+                    'label_length': label_length,
+                    'timings': bench_case(count, size, label_length, frames,
+                                          cold, first_day)})
+    return {'created': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'cairo': cairo.cairo_version_string(),
+            'frames': frames,
+            'cold': cold,
+            'cases': cases}
+
+
+def parse_sizes(value):
+    return [tuple(int(v) for v in size.split('x'))
+            for size in value.split(',')]
+
+
+def add_arguments(parser):
+    parser.add_argument('--tasks', default=','.join(
+        map(str, DEFAULT_TASK_COUNTS)))
+    parser.add_argument('--sizes', default=','.join(
+        '%dx%d' % s for s in DEFAULT_SURFACE_SIZES))
+    parser.add_argument('--labels', default=','.join(
+        map(str, DEFAULT_LABEL_LENGTHS)), help="label lengths")
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--cold', action='store_true',
+                        help="clear text measurement caches every frame")
+    parser.add_argument('--output', '-o', help="write JSON results here")
+
+
+def run(args):
+    results = run_benchmarks([int(v) for v in args.tasks.split(',')],
+                             parse_sizes(args.sizes),
+                             [int(v) for v in args.labels.split(',')],
+                             args.frames, args.cold)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the draw paths on offscreen surfaces.")
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
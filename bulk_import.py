@@ -0,0 +1,250 @@
+import concurrent.futures
+import csv
+import datetime
+import io
+import json
+import os
+
+from dates import Date
+from tasks import Task
+
+CSV, JSON_LINES, ICAL = 'csv', 'jsonl', 'ics'
+FORMATS = (CSV, JSON_LINES, ICAL)
+# approximate number of bytes of input parsed by each worker job
+SHARD_SIZE = 4 * 1024 * 1024
+# lines starting a new task record in an iCalendar file
+ICAL_BOUNDARIES = (b'BEGIN:VTODO', b'BEGIN:VEVENT')
+STATUSES = (Task.STA_ACTIVE, Task.STA_DISMISSED, Task.STA_DONE)
+# columns expected in CSV files, when they have no header naming them
+CSV_FIELDS = ('id', 'title', 'start', 'due', 'status', 'color')
+
+
+def guess_format(path):
+    """ Returns the format of the file at @path, from its extension. """
+    ext = os.path.splitext(path)[1][1:].lower()
+    if ext in FORMATS:
+        return ext
+    if ext in ('ndjson', 'jsonlines'):
+        return JSON_LINES
+    if ext == 'ical':
+        return ICAL
+    raise ValueError("Unknown import format: '%s'" % path)
+
+
+def is_supported(path):
+    try:
+        guess_format(path)
+    except ValueError:
+        return False
+    return True
+
+
+def _ordinal(value):
+    """ Returns the ordinal of an ISO date string, None if empty. """
+    if not value:
+        return None
+    return datetime.date.fromisoformat(value[:10]).toordinal()
+
+
+def _color(value):
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.replace(';', ',').split(',')
+    return tuple(float(v) for v in value)
+
+
+def make_record(tid, title, start, due, status, color=None, tags=(),
+                closed=None):
+    """
+    Normalizes the fields of a task into a small picklable tuple, which is
+    what the workers send back: dates are ordinals (or None), the status is
+    an index in STATUSES.
+    """
+    status = STATUSES.index(status) if status in STATUSES else 0
+    return (str(tid), title or '', start, due, status, color, tuple(tags),
+            closed)
+
+
+def task_to_record(task):
+    """ Converts a @task, as read by ical.py, into a record. """
+    def ordinal(date):
+        return None if date.is_fuzzy() else date.date().toordinal()
+    return make_record(task.get_id(), task.get_title(),
+                       ordinal(task.get_start_date()),
+                       ordinal(task.get_due_date()), task.get_status(),
+                       task.get_color(), task.tags,
+                       ordinal(task.get_closed_date()))
+
+
+def record_to_task(record):
+    """ Builds a Task from a @record, without parsing any date string. """
+    tid, title, start, due, status, color, tags, closed = record
+    if start is None:
+        start = due
+    if due is None:
+        due = start
+    task = Task(tid)
+    task.set_title(title)
+    if start is not None:
+        task.start_date = Date(datetime.date.fromordinal(start))
+        task.due_date = Date(datetime.date.fromordinal(due))
+    task.status = STATUSES[status]
+    if closed is not None:
+        task.closed_date = Date(datetime.date.fromordinal(closed))
+    elif status:
+        task.closed_date = Date.today()
+    task.color = color
+    task.tags = list(tags)
+    return task
+
+
+def _parse_csv(text, fieldnames):
+    records = []
+    for row in csv.DictReader(io.StringIO(text), fieldnames):
+        if not row.get('id'):
+            continue
+        tags = row.get('tags') or ''
+        records.append(make_record(
+            row['id'], row.get('title'), _ordinal(row.get('start')),
+            _ordinal(row.get('due')), row.get('status'),
+            _color(row.get('color')),
+            [t.strip() for t in tags.split(',') if t.strip()],
+            _ordinal(row.get('closed'))))
+    return records
+
+
+def _parse_json_lines(text):
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        records.append(make_record(
+            data['id'], data.get('title'), _ordinal(data.get('start')),
+            _ordinal(data.get('due')), data.get('status'),
+            _color(data.get('color')), data.get('tags') or (),
+            _ordinal(data.get('closed'))))
+    return records
+
+
+def _parse_ical(text, start):
+    import ical
+    records = []
+    lines = text.splitlines(True)
+    for batch in ical.iter_task_batches(lines, id_prefix='ical-%d-' % start):
+        records.extend(task_to_record(t) for t in batch)
+    return records
+
+
+def parse_shard(fmt, path, start, end, fieldnames=None):
+    """
+    Parses the bytes of the file at @path from @start to @end, which hold
+    whole records, into a list of records (see make_record). This runs in
+    the worker processes.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    if fmt == CSV:
+        return _parse_csv(text, fieldnames)
+    elif fmt == JSON_LINES:
+        return _parse_json_lines(text)
+    else:
+        return _parse_ical(text, start)
+
+
+def _csv_fieldnames(f):
+    """
+    Reads the header of a CSV file, if it has one.
+
+    @return fieldnames, offset: the column names, and where the data starts.
+    """
+    line = f.readline()
+    names = [n.strip().lower() for n in next(csv.reader([line.decode()]), [])]
+    if 'id' in names:
+        return names, f.tell()
+    return list(CSV_FIELDS), 0
+
+
+def find_shards(path, fmt, shard_size=SHARD_SIZE):
+    """
+    Splits the file at @path into byte ranges of about @shard_size bytes,
+    each made of whole records: lines for CSV and JSON lines (so fields
+    must not contain line breaks), components for iCalendar.
+
+    @return shards, fieldnames: list of (start, end) tuples, and the CSV
+                                column names (None for other formats).
+    """
+    size = os.path.getsize(path)
+    fieldnames = None
+    with open(path, 'rb') as f:
+        start = 0
+        if fmt == CSV:
+            fieldnames, start = _csv_fieldnames(f)
+        shards = []
+        while start < size:
+            f.seek(min(start + shard_size, size))
+            f.readline()  # skip to the next line start
+            while fmt == ICAL and f.tell() < size:
+                offset = f.tell()
+                if f.readline().startswith(ICAL_BOUNDARIES):
+                    f.seek(offset)
+                    break
+            end = min(f.tell(), size)
+            shards.append((start, end))
+            start = end
+    return shards, fieldnames
+
+
+def bulk_import(path, datastore, fmt=None, processes=None,
+                shard_size=SHARD_SIZE, progress=None):
+    """
+    Imports the tasks of a CSV, JSON lines or iCalendar file into
+    @datastore, parsing it in parallel.
+
+    The file is split into shards that a process pool parses into compact
+    records. The records are then turned into tasks here and all added to
+    @datastore at once, which indexes them by date in one go. When the same
+    id appears several times, the first one is kept.
+
+    @param fmt: one of FORMATS, guessed from the extension if None.
+    @param processes: integer, number of worker processes. Defaults to the
+                      number of CPUs; 1 parses everything in this process.
+    @param progress: function called as progress(done, total) after each
+                     shard, with both in bytes. It is called from this
+                     thread.
+    @return count: integer, the number of tasks added.
+    """
+    fmt = fmt or guess_format(path)
+    shards, fieldnames = find_shards(path, fmt, shard_size)
+    total = sum(end - start for start, end in shards)
+    done = 0
+    records = []
+
+    def add_shard(shard, result):
+        nonlocal done
+        records.extend(result)
+        done += shard[1] - shard[0]
+        if progress is not None:
+            progress(done, total)
+
+    if processes == 1 or len(shards) <= 1:
+        for shard in shards:
+            add_shard(shard, parse_shard(fmt, path, shard[0], shard[1],
+                                         fieldnames))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(parse_shard, fmt, path, start, end,
+                                       fieldnames)
+                       for start, end in shards]
+            # in file order, so that duplicates resolve as in a serial load
+            for shard, future in zip(shards, futures):
+                add_shard(shard, future.result())
+
+    tasks = datastore.get_tasks_tree()
+    fresh = {}
+    for record in records:
+        if record[0] not in fresh and record[0] not in tasks:
+            fresh[record[0]] = record
+    return datastore.push_tasks(record_to_task(r) for r in fresh.values())
@@ -1,15 +1,29 @@
 #!/usr/bin/python3
-from gi.repository import Gtk, GObject
+import time
+START_TIME = time.perf_counter()  # as early as possible, for startup times
+
+from gi.repository import Gtk, Gdk, GLib, GObject
 import datetime
+import itertools
+import os
 import random
+import threading
 
 from datastore import DataStore
+from tasks import Task
 from requester import Requester
 from utils import random_color
 from controller import Controller
 from taskview import TaskView
+from stall_watchdog import Watchdog
+from perf import StartupTimes
+from journal import Journal
+import dataset
+import bulk_import
 
 tests = True
+# number of tasks added to the datastore per main loop iteration while loading
+LOAD_CHUNK = 500
 
 
 class CalendarPlugin(GObject.GObject):
@@ -20,6 +34,7 @@ class CalendarPlugin(GObject.GObject):
     def __init__(self):
         super(CalendarPlugin, self).__init__()
         self.first_day = self.last_day = self.numdays = None
+        self.startup = StartupTimes(START_TIME)
 
         builder = Gtk.Builder()
         builder.add_from_file("calendar_view.glade")
@@ -39,11 +54,17 @@ class CalendarPlugin(GObject.GObject):
         self.window.__init__()
         self.window.set_title("GTG - Calendar View")
         self.window.connect("destroy", Gtk.main_quit)
+        self.window.connect("key-press-event", self.on_key_press)
 
-        # DataStore object
+        # DataStore object, starts empty: tasks are loaded once the window
+        # is shown, see load_datastore()
         self.ds = DataStore()
         self.req = Requester(self.ds)
-        self.ds.populate()  # hard-coded tasks
+        # other threads queue their changes, applied from the main loop
+        self.write_queue = self.ds.enable_concurrency(GLib.idle_add, self.req)
+        self.journal = Journal(os.environ.get('CALENDAR_DATA_DIR') or
+                               os.path.join(GLib.get_user_data_dir(),
+                                            'calendar-plugin'))
 
         self.today_button = builder.get_object("today")
         self.header = builder.get_object("header")
@@ -59,7 +80,90 @@ class CalendarPlugin(GObject.GObject):
 
         self.statusbar = builder.get_object("statusbar")
 
+        # changes are recorded from the start, even while tasks are still
+        # being loaded; they are written once the journal was loaded
+        self.persistent = not os.environ.get('CALENDAR_DATA')
+        if self.persistent:
+            self.journal.attach(self.req, start=False)
+
+        self.window.connect_after("draw", self.on_first_draw)
         self.window.show_all()
+        self.startup.mark('window_shown')
+        self.load_datastore()
+
+        # logs the main thread stack whenever the UI freezes
+        self.watchdog = Watchdog(os.environ.get('CALENDAR_STALL_LOG'),
+                                 context=self.describe_state)
+        self.watchdog.start()
+
+    def load_datastore(self):
+        """
+        Loads the tasks in a background thread, into a separate DataStore.
+        Tasks are then moved into ours from the main loop, a few at a time,
+        and the visible view is updated once all of them are there.
+
+        Tasks are read from the journal, and changes are saved to it (those
+        made while loading are queued meanwhile). A JSON dataset (or a CSV, JSON lines or iCalendar file,
+        imported in parallel with its progress in the statusbar) can be shown
+        instead with CALENDAR_DATA, in which case nothing is saved. The first
+        time, hard-coded tasks are used.
+        """
+        path = os.environ.get('CALENDAR_DATA')
+
+        def progress(done, total):
+            GLib.idle_add(self.statusbar.push, 0, "Importing %s: %d%%"
+                          % (os.path.basename(path),
+                             done * 100 // max(total, 1)))
+
+        def load():
+            loaded = DataStore()
+            if path and bulk_import.is_supported(path):
+                bulk_import.bulk_import(path, loaded, progress=progress)
+            elif path:
+                dataset.load_dataset(path, loaded)
+            elif self.journal.exists():
+                self.journal.load(loaded)
+            else:
+                loaded.populate()  # hard-coded tasks
+            GLib.idle_add(self._push_loaded_tasks, loaded.iter_tasks())
+
+        thread = threading.Thread(target=load, name='datastore-loader')
+        thread.daemon = True
+        thread.start()
+
+    def _push_loaded_tasks(self, tasks):
+        chunk = list(itertools.islice(tasks, LOAD_CHUNK))
+        with self.ds.writing():
+            # indexed by dates in one go, see DataStore.push_tasks
+            self.ds.push_tasks(chunk)
+        if len(chunk) == LOAD_CHUNK:
+            return True  # there may be more, go on in the next iteration
+
+        self.startup.mark('datastore_loaded')
+        if self.persistent:
+            is_new = not self.journal.exists()
+            self.journal.start()
+            if is_new:
+                self.journal.compact()
+        self.content_update()
+        # runs after the view was redrawn with its tasks
+        GLib.idle_add(self.on_interactive, priority=GLib.PRIORITY_LOW)
+        return False
+
+    def on_first_draw(self, widget, ctx):
+        self.startup.mark('first_frame')
+        self.window.disconnect_by_func(self.on_first_draw)
+        return False
+
+    def on_interactive(self):
+        interactive = self.startup.mark('interactive')
+        self.statusbar.push(0, "Ready in %.0f ms (first frame in %.0f ms)"
+                            % (interactive * 1000,
+                               self.startup.get('first_frame') * 1000))
+        path = os.environ.get('CALENDAR_STARTUP_LOG') or os.path.join(
+            GLib.get_user_cache_dir(), 'calendar-plugin', 'startup.log')
+        self.startup.save(path)
+        return False
 
     def on_add_clicked(self, button=None, start_date=None, due_date=None):
         """
@@ -166,6 +270,39 @@ class CalendarPlugin(GObject.GObject):
 
         self.content_update()
 
+    def describe_state(self):
+        """ Returns which view and dates are being shown, for stall logs """
+        view = self.current_view
+        if view is None:
+            return 'no view'
+        return '%s %s - %s' % (type(view).__name__, view.first_day(),
+                               view.last_day())
+
+    def on_key_press(self, widget, event):
+        """
+        F12 toggles the performance overlay of the current view, Ctrl+D
+        marks the selected tasks as done (or active, if all of them were).
+        """
+        if event.keyval == Gdk.KEY_F12 and self.current_view:
+            self.current_view.all_day_tasks.toggle_hud()
+            return True
+        if event.keyval in (Gdk.KEY_d, Gdk.KEY_D) and self.current_view and \
+                event.state & Gdk.ModifierType.CONTROL_MASK:
+            selected = [self.req.get_task(t)
+                        for t in self.current_view.get_selected_tasks()]
+            selected = [t for t in selected if t is not None]
+            if not selected:
+                return False
+            if all(t.get_status() == Task.STA_DONE for t in selected):
+                status = Task.STA_ACTIVE
+            else:
+                status = Task.STA_DONE
+            self.current_view.set_selected_tasks_status(status)
+            self.statusbar.push(0, "Marked %d tasks as %s"
+                                % (len(selected), status))
+            return True
+        return False
+
     def on_dates_changed(self, widget=None):
         """ Callback to update date-related objects in main window """
         self.header.set_text(self.current_view.get_current_year())
@@ -195,5 +332,7 @@ class CalendarPlugin(GObject.GObject):
         self.current_view.disconnect_by_func(self.on_add_clicked)
         self.current_view.disconnect_by_func(self.on_dates_changed)
 
-CalendarPlugin()
-Gtk.main()
+if __name__ == '__main__':
+    plugin = CalendarPlugin()
+    Gtk.main()
+    plugin.journal.close()
@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+import layout
+from dataset import load_dataset, save_dataset, task_to_dict
+from datastore import DataStore
+from tasks import Task
+
+# maximum time (s) importing this module may take, see check_import_time()
+IMPORT_TIME_BUDGET = 0.15
+# datasets with this extension are binary snapshots, see snapshot.py
+SNAPSHOT_SUFFIX = '.snap'
+# datasets with this extension are GTG task files, see gtg_backend.py
+GTG_SUFFIX = '.xml'
+# datasets with this extension are iCalendar files, see ical.py
+ICAL_SUFFIX = '.ics'
+# extensions of the files save_file() can write
+SAVE_SUFFIXES = ('.json', SNAPSHOT_SUFFIX, ICAL_SUFFIX)
+# modules that must not be imported unless a command really needs them
+HEAVY_MODULES = ('gi', 'cairo')
+
+
+def is_snapshot(path):
+    return path.endswith(SNAPSHOT_SUFFIX)
+
+
+def load_file(path, datastore, processes=None, progress=None):
+    """
+    Adds the tasks of a JSON dataset, binary snapshot, GTG task file, or
+    CSV, JSON lines or iCalendar file to @datastore. The last three are
+    parsed by @processes worker processes, see bulk_import.py.
+    """
+    import bulk_import
+    if bulk_import.is_supported(path):
+        bulk_import.bulk_import(path, datastore, processes=processes,
+                                progress=progress)
+    elif path.endswith(GTG_SUFFIX):
+        import gtg_backend
+        gtg_backend.load_gtg(path, datastore)
+    elif is_snapshot(path):
+        import snapshot
+        tasks = snapshot.SnapshotTasks(snapshot.Snapshot(path))
+        for tid in tasks:
+            datastore.push_task(tasks[tid])
+    else:
+        load_dataset(path, datastore)
+
+
+def save_file(datastore, path):
+    """
+    Writes @datastore as a JSON dataset, binary snapshot or iCalendar file to
+    @path, depending on its extension (see SAVE_SUFFIXES).
+    """
+    if not path.endswith(SAVE_SUFFIXES):
+        raise ValueError("Cannot save tasks to '%s': use one of %s"
+                         % (path, ', '.join(SAVE_SUFFIXES)))
+    if path.endswith(ICAL_SUFFIX):
+        import ical
+        ical.write_ical(datastore.iter_tasks(), path)
+    elif is_snapshot(path):
+        import snapshot
+        snapshot.write_snapshot(datastore.iter_tasks(), path)
+    else:
+        save_dataset(datastore, path)
+
+
+def open_datastore(args):
+    """ Creates the DataStore selected by the global command line options. """
+    paths = list(args.data)
+    if paths and is_snapshot(paths[0]):
+        # tasks are only read from the snapshot when used
+        import snapshot
+        datastore = snapshot.load_snapshot(paths.pop(0))
+    else:
+        datastore = DataStore()
+    for path in paths:
+        load_file(path, datastore)
+    if args.synthetic:
+        import synthetic
+        synthetic.populate(datastore, args.synthetic, seed=args.seed)
+    return datastore
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not a YYYY-MM-DD date"
+                                         % value)
+
+
+def output_path(value):
+    """ Checks that tasks can be saved to @value, see save_file(). """
+    if not value.endswith(SAVE_SUFFIXES):
+        raise argparse.ArgumentTypeError("'%s' should end with one of %s"
+                                         % (value, ', '.join(SAVE_SUFFIXES)))
+    return value
+
+
+def cmd_query(args):
+    """ Lists the tasks shown between two dates. """
+    ds = open_datastore(args)
+    start = args.start or datetime.date.today()
+    end = args.end or start
+    tasks = list(ds.iter_tasks_in_range(start, end))
+    if args.status:
+        tasks = [t for t in tasks if t.get_status() == args.status]
+    tasks.sort(key=lambda t: (t.get_start_date().date(), t.get_title()))
+    if args.json:
+        json.dump([task_to_dict(t) for t in tasks], sys.stdout, indent=1)
+        print()
+    else:
+        for task in tasks:
+            print("%s  %s  %-7s %s" % (task.get_start_date().date(),
+                                        task.get_due_date().date(),
+                                        task.get_status(), task.get_title()))
+    return 0
+
+
+def cmd_export(args):
+    """
+    Renders the tasks between two dates to PNG, SVG or PDF, or writes them
+    to an iCalendar file.
+    """
+    fmt = args.format or os.path.splitext(args.path)[1][1:] or 'pdf'
+    ds = open_datastore(args)
+    if fmt == 'ics':
+        import ical
+        count = ical.write_ical(ds.iter_tasks(), args.path, args.start,
+                                args.end)
+        print("%d tasks written to %s" % (count, args.path))
+        return 0
+    import export
+    tasks = list(ds.iter_tasks())
+    views = {'week': export.WEEK, '2weeks': export.TWO_WEEKS,
+             'month': export.MONTH}
+    paths = export.export_range(tasks, args.start, args.end, args.path,
+                                views[args.view], fmt,
+                                processes=args.processes)
+    for path in paths:
+        print(path)
+    return 0
+
+
+def cmd_bench(args):
+    """ Runs the benchmarks, or checks the start up time of this tool. """
+    if args.startup:
+        return check_import_time(args.budget)
+    import bench
+    return bench.run(args)
+
+
+def cmd_import(args):
+    """ Merges datasets (and synthetic tasks) into a single dataset file. """
+    ds = open_datastore(args)
+    before = ds.count()
+    for path in args.sources:
+        def progress(done, total, path=path):
+            print("\r%s: %3d%%" % (path, done * 100 // max(total, 1)),
+                  end='', file=sys.stderr, flush=True)
+        load_file(path, ds, args.processes, progress)
+        print(file=sys.stderr)
+    save_file(ds, args.output)
+    print("%d tasks written to %s (%d imported)"
+          % (ds.count(), args.output, ds.count() - before))
+    return 0
+
+
+def cmd_stats(args):
+    """ Prints a summary of the tasks in the datastore. """
+    start = time.perf_counter()
+    ds = open_datastore(args)
+    print("opened in %.1f ms" % ((time.perf_counter() - start) * 1000))
+    tasks = list(ds.iter_tasks())
+    print("tasks: %d" % len(tasks))
+    if not tasks:
+        return 0
+    statuses = {}
+    for task in tasks:
+        statuses[task.get_status()] = statuses.get(task.get_status(), 0) + 1
+    for status, count in sorted(statuses.items()):
+        print("  %-8s %d" % (status, count))
+    durations = [layout.task_duration(t) + 1 for t in tasks]
+    starts = [t.get_start_date().date() for t in tasks]
+    dues = [t.get_due_date().date() for t in tasks]
+    print("first day: %s" % min(starts))
+    print("last day: %s" % max(dues))
+    print("days per task: mean %.1f, max %d"
+          % (sum(durations) / float(len(durations)), max(durations)))
+    per_month = {}
+    for day in starts:
+        key = day.strftime('%Y-%m')
+        per_month[key] = per_month.get(key, 0) + 1
+    print("busiest month: %s (%d tasks starting)"
+          % max(per_month.items(), key=lambda item: item[1]))
+    return 0
+
+
+def measure_import_time(module='cli'):
+    """
+    Measures, in a fresh interpreter, how long importing @module takes and
+    which of the HEAVY_MODULES it pulled in.
+
+    @return seconds, heavy: float, and list of module names.
+    """
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import %s\n"
+            "print(time.perf_counter() - start)\n"
+            "print(' '.join(m for m in %r if m in sys.modules))\n"
+            % (module, HEAVY_MODULES))
+    output = subprocess.check_output(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        universal_newlines=True)
+    lines = output.splitlines()
+    return float(lines[0]), lines[1].split() if len(lines) > 1 else []
+
+
+def check_import_time(budget=IMPORT_TIME_BUDGET):
+    """ Returns 1 if importing the CLI is over @budget or loads GTK/cairo. """
+    seconds, heavy = measure_import_time()
+    print("import time: %.1f ms (budget %.1f ms)"
+          % (seconds * 1000, budget * 1000))
+    status = 0
+    if seconds > budget:
+        print("OVER BUDGET", file=sys.stderr)
+        status = 1
+    if heavy:
+        print("heavy modules imported: %s" % ', '.join(heavy),
+              file=sys.stderr)
+        status = 1
+    return status
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Works with calendar tasks without a display.")
+    parser.add_argument('--data', action='append', default=[],
+                        metavar='FILE', help="JSON dataset, %s snapshot, GTG "
+                                             "%s, CSV, JSON lines or "
+                                             "iCalendar %s file to load; "
+                                             "can be given several times"
+                                             % (SNAPSHOT_SUFFIX, GTG_SUFFIX,
+                                                ICAL_SUFFIX))
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help="also load N synthetic tasks")
+    parser.add_argument('--seed', type=int, default=7)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    query = commands.add_parser('query', help=cmd_query.__doc__)
+    query.add_argument('start', type=parse_date, nargs='?')
+    query.add_argument('end', type=parse_date, nargs='?')
+    query.add_argument('--status', choices=(Task.STA_ACTIVE, Task.STA_DONE,
+                                            Task.STA_DISMISSED))
+    query.add_argument('--json', action='store_true')
+    query.set_defaults(func=cmd_query)
+
+    export = commands.add_parser('export', help=cmd_export.__doc__)
+    export.add_argument('start', type=parse_date)
+    export.add_argument('end', type=parse_date)
+    export.add_argument('path', help="output file, or pattern with {start} "
+                                     "or {index} for one file per page")
+    export.add_argument('--view', default='month',
+                        choices=('week', '2weeks', 'month'))
+    export.add_argument('--format', choices=('png', 'svg', 'pdf', 'ics'))
+    export.add_argument('--processes', type=int)
+    export.set_defaults(func=cmd_export)
+
+    bench = commands.add_parser('bench', help=cmd_bench.__doc__)
+    bench.add_argument('--startup', action='store_true',
+                       help="only check the import time of this tool")
+    bench.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET,
+                       help="import time budget, in seconds")
+    import bench as bench_module
+    bench_module.add_arguments(bench)
+    bench.set_defaults(func=cmd_bench)
+
+    import_ = commands.add_parser('import', help=cmd_import.__doc__)
+    import_.add_argument('sources', nargs='*', metavar='FILE')
+    import_.add_argument('--output', '-o', required=True, type=output_path,
+                         help="JSON dataset, %s snapshot or iCalendar %s "
+                              "file to write" % (SNAPSHOT_SUFFIX, ICAL_SUFFIX))
+    import_.add_argument('--processes', type=int,
+                         help="number of processes parsing CSV, JSON lines "
+                              "and iCalendar files")
+    import_.set_defaults(func=cmd_import)
+
+    stats = commands.add_parser('stats', help=cmd_stats.__doc__)
+    stats.set_defaults(func=cmd_stats)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import collections
+import concurrent.futures
+import contextlib
+import threading
+import time
+
+# time (s) the writer may spend applying queued writes before letting the
+# main loop redraw: half a frame at 60 Hz
+WRITE_BUDGET = 0.008
+
+
+class RWLock(object):
+    """
+    A reader-writer lock: any number of readers, or a single writer. Waiting
+    writers go first, so that a stream of readers cannot starve them. The
+    thread holding the write lock may take it again, or take the read lock.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writer = None
+        # how many times the writer took the write lock
+        self.write_depth = 0
+        # thread whose non-blocking write failed and will try again: other
+        # readers wait until it got the lock
+        self.write_requested = None
+
+    def is_writing(self):
+        """ Returns True if the calling thread holds the write lock. """
+        return self.writer == threading.get_ident()
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer == me:
+                pass
+            elif self.write_requested == me:
+                # it does not wait for itself, only for other writers
+                self.cond.wait_for(lambda: self.writer is None)
+            else:
+                self.cond.wait_for(lambda: self.writer is None and
+                                   not self.writers_waiting)
+            self.readers += 1
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if not self.readers:
+                self.cond.notify_all()
+
+    def acquire_write(self, blocking=True):
+        """
+        @param blocking: if False, give up at once when readers are in;
+                         new readers then wait until the lock was taken.
+        @return bool: True if the lock was acquired.
+        """
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer == me:
+                self.write_depth += 1
+                return True
+            if self.writer is not None or self.readers:
+                if not blocking:
+                    if self.write_requested is None:
+                        # keep new readers out until the writer is back
+                        self.write_requested = me
+                        self.writers_waiting += 1
+                    return False
+                self.writers_waiting += 1
+                self.cond.wait_for(lambda: self.writer is None and
+                                   not self.readers)
+                self.writers_waiting -= 1
+            if self.write_requested == me:
+                self.write_requested = None
+                self.writers_waiting -= 1
+            self.writer = me
+            self.write_depth = 1
+            return True
+
+    def release_write(self):
+        with self.cond:
+            self.write_depth -= 1
+            if not self.write_depth:
+                self.writer = None
+                self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class WriteQueue(object):
+    """
+    Lets any thread change the tasks of a DataStore, while only one thread,
+    the writer (the GTK main loop), actually changes them.
+
+    Writes are queued with submit() and applied by the writer in batches:
+    each drain takes the write lock and applies queued writes inside one
+    Requester batch, so observers, and so the views, are notified once per
+    batch and always from the writer thread. A drain stops after
+    WRITE_BUDGET seconds and lets the main loop redraw before going on, and
+    never waits for background readers: if they hold the lock, it simply
+    tries again later.
+    """
+
+    def __init__(self, requester, lock, dispatch, budget=WRITE_BUDGET):
+        """
+        @param requester: the Requester changes are batched by.
+        @param lock: the RWLock background readers of the DataStore take.
+        @param dispatch: function scheduling a call of its argument on the
+                         writer thread, again as long as it returns True,
+                         like GLib.idle_add.
+        @param budget: float, seconds each drain may last.
+        """
+        self.requester = requester
+        self.lock = lock
+        self.dispatch = dispatch
+        self.budget = budget
+        self.writer = threading.get_ident()
+        self.pending = collections.deque()
+        self.scheduled = False
+        self.mutex = threading.Lock()
+        self.drains = 0
+        self.applied = 0
+
+    def is_writer_thread(self):
+        return threading.get_ident() == self.writer
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues a call of @func, e.g. requester.update_task, to be made by
+        the writer thread. Can be called from any thread.
+
+        @return future: a concurrent.futures.Future for the result of the
+                        call.
+        """
+        future = concurrent.futures.Future()
+        with self.mutex:
+            self.pending.append((future, func, args, kwargs))
+            schedule = not self.scheduled
+            self.scheduled = True
+        if schedule:
+            self.dispatch(self.drain)
+        return future
+
+    def drain(self):
+        """
+        Applies queued writes, for at most the time budget. Must be called
+        from the writer thread.
+
+        @return bool: True if writes are left, so it should be called again.
+        """
+        if not self.lock.acquire_write(blocking=False):
+            return True  # background readers are in: try again later
+        deadline = time.perf_counter() + self.budget
+        done = []
+        try:
+            with self.requester.batch():
+                while time.perf_counter() < deadline:
+                    try:
+                        future, func, args, kwargs = self.pending.popleft()
+                    except IndexError:
+                        break
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        done.append((future, func(*args, **kwargs), None))
+                    except Exception as e:
+                        done.append((future, None, e))
+        finally:
+            self.lock.release_write()
+            self.drains += 1
+            self.applied += len(done)
+        # only now that observers were notified of the whole batch
+        for future, result, error in done:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self.mutex:
+            self.scheduled = bool(self.pending)
+            return self.scheduled
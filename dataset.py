@@ -0,0 +1,123 @@
+import json
+
+from dates import Date
+from tasks import Task
+
+# setter used for each one of the fields of a task dictionary
+FIELD_SETTERS = {
+    'title': 'set_title',
+    'start': 'set_start_date',
+    'due': 'set_due_date',
+    'status': 'set_status',
+    'color': 'set_color',
+}
+# other fields of a task dictionary, which are not set through the
+# requester: the done date, the tags and the content
+EXTRA_FIELDS = ('closed', 'tags', 'content')
+
+
+def date_to_str(date):
+    """ Returns @date, a Date object, as an ISO string; '' if fuzzy. """
+    if date.is_fuzzy():
+        return ''
+    return date.date().isoformat()
+
+
+def task_to_dict(task, fields=None):
+    """
+    Converts a @task into a dictionary that can be dumped as JSON.
+
+    @param fields: list of field names (keys of FIELD_SETTERS) to include,
+                   all of them (and EXTRA_FIELDS) by default. The id is
+                   always included, and the closed date with the status.
+    """
+    data = {'id': task.get_id()}
+    if fields is None or 'title' in fields:
+        data['title'] = task.get_title()
+    if fields is None or 'start' in fields:
+        data['start'] = date_to_str(task.get_start_date())
+    if fields is None or 'due' in fields:
+        data['due'] = date_to_str(task.get_due_date())
+    if fields is None or 'status' in fields:
+        data['status'] = task.get_status()
+        data['closed'] = date_to_str(task.get_closed_date())
+    if fields is None or 'color' in fields:
+        data['color'] = task.get_color()
+    if fields is None:
+        data['tags'] = list(task.tags)
+        data['content'] = task.content
+    return data
+
+
+def apply_fields(task, data):
+    """
+    Sets the fields of @task found in @data, a dictionary as made by
+    task_to_dict (missing fields are left untouched).
+    """
+    for field, setter in FIELD_SETTERS.items():
+        if field not in data:
+            continue
+        value = data[field]
+        if field == 'color' and value is not None:
+            value = tuple(value)
+        elif field in ('start', 'due'):
+            value = Date(value or '')
+        getattr(task, setter)(value)
+    _apply_extra_fields(task, data)
+
+
+def _apply_extra_fields(task, data):
+    # after the status, which sets the closed date to today
+    if 'closed' in data:
+        task.set_closed_date(Date(data['closed'] or ''))
+    if 'tags' in data:
+        task.tags = list(data['tags'])
+    if 'content' in data:
+        task.content = data['content'] or ''
+
+
+def dict_to_task(data):
+    """ Builds a Task object back from a dictionary made by task_to_dict. """
+    task = Task(data['id'])
+    task.set_title(data.get('title', ''))
+    task.set_start_date(Date(data.get('start') or ''))
+    task.set_due_date(Date(data.get('due') or ''))
+    task.set_status(data.get('status', Task.STA_ACTIVE))
+    color = data.get('color')
+    task.set_color(tuple(color) if color else None)
+    _apply_extra_fields(task, data)
+    return task
+
+
+def load_dataset(path, datastore=None):
+    """
+    Loads the tasks of a JSON dataset at @path into @datastore (a new one if
+    none is given). Tasks already in the datastore are kept.
+
+    @return datastore: the DataStore object the tasks were loaded into.
+    """
+    if datastore is None:
+        from datastore import DataStore
+        datastore = DataStore()
+    with open(path) as f:
+        for data in json.load(f):
+            datastore.push_task(dict_to_task(data))
+    return datastore
+
+
+def write_dataset(tasks, f):
+    """ Writes the Task objects in @tasks as a JSON dataset to file @f. """
+    f.write('[')
+    for i, task in enumerate(tasks):
+        if i:
+            f.write(',')
+        f.write('\n')
+        json.dump(task_to_dict(task), f, separators=(',', ':'))
+    f.write('\n]\n')
+
+
+def save_dataset(datastore, path):
+    """ Writes every task of @datastore as a JSON dataset to @path. """
+    with open(path, 'w') as f:
+        write_dataset([datastore.get_task(t)
+                       for t in sorted(datastore.get_all_tasks())], f)
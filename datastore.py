@@ -1,16 +1,96 @@
 import uuid
 import random
 import datetime
+import contextlib
+import threading
 
+from date_index import DateIndex
 from tasks import Task
 from requester import Requester
 from utils import random_color
+from tracing import traced
+from versioned_tasks import TasksView, VersionedTasks
 
 
 class DataStore(object):
-    def __init__(self):
-        self._tasks = {}
+    def __init__(self, tasks=None):
+        """
+        @param tasks: dictionary-like object of id -> Task to start from,
+                      e.g. snapshot.SnapshotTasks. Defaults to an empty
+                      VersionedTasks.
+        """
+        self._tasks = VersionedTasks() if tasks is None else tasks
+        # tasks by the days they span, for iter_tasks_in_range()
+        self.index = DateIndex()
+        # ids of the tasks whose dates may have changed since they were
+        # indexed, or None to index all of them again
+        self._unindexed = set() if tasks is None else None
+        self._index_lock = threading.Lock()
         self.requester = Requester(self)
+        # set by enable_concurrency()
+        self.lock = None
+        self.write_queue = None
+
+    def enable_concurrency(self, dispatch, requester=None):
+        """
+        Lets other threads use this datastore. From then on, the calling
+        thread is the only one changing tasks, and only within writing():
+        other threads queue their changes with write_queue.submit(), and
+        read tasks inside reading() (or from a snapshot(), taken by the
+        writer).
+
+        @param dispatch: function scheduling calls on this thread, like
+                         GLib.idle_add, see concurrency.WriteQueue.
+        @param requester: the Requester changes are batched and notified
+                          by; defaults to the one of this datastore.
+        @return write_queue: the WriteQueue writes are submitted to.
+        """
+        from concurrency import RWLock, WriteQueue
+        self.lock = RWLock()
+        self.write_queue = WriteQueue(requester or self.requester, self.lock,
+                                      dispatch)
+        return self.write_queue
+
+    def reading(self):
+        """
+        Returns a context manager within which other threads can safely
+        read tasks: all changes are made within writing(), so none is made
+        meanwhile. Reads should be short, as they hold back the writer. The
+        writer thread itself can read tasks without it.
+        """
+        if self.lock is None:
+            return contextlib.nullcontext()
+        return self.lock.read()
+
+    def writing(self):
+        """
+        Returns a context manager holding the write lock, within which the
+        writer thread can change tasks. It waits for the readers to be done
+        and can be nested, e.g. in observers of a write queue batch.
+        """
+        if self.lock is None:
+            return contextlib.nullcontext()
+        self.check_writer_thread()
+        return self.lock.write()
+
+    def check_writer_thread(self):
+        """ Raises RuntimeError if called from another thread. """
+        if self.write_queue is not None and \
+                not self.write_queue.is_writer_thread():
+            raise RuntimeError("Tasks can only be changed from the writer "
+                               "thread, use write_queue.submit()")
+
+    def check_writer(self):
+        """
+        Raises RuntimeError if tasks are changed from another thread, or
+        without the write lock held (see writing()).
+        """
+        if self.lock is None:
+            return
+        self.check_writer_thread()
+        if not self.lock.is_writing():
+            raise RuntimeError("Tasks can only be changed within "
+                               "DataStore.writing()")
 
     def has_task(self, tid):
         if tid in self._tasks:
@@ -23,25 +103,129 @@ class DataStore(object):
     def get_tasks_tree(self):
         return self._tasks
 
+    @traced('datastore')
     def get_all_tasks(self):
-        """ Returns a list of strings: tasks ids """
+        """
+        Returns a list of strings: tasks ids. This copies every id, prefer
+        iter_tasks() or count() when that is not needed.
+        """
         return list(self._tasks.keys())
 
+    def count(self):
+        """ Returns the number of tasks. """
+        return len(self._tasks)
+
+    def iter_tasks(self):
+        """
+        Iterates over the Task objects, without building any list. Tasks
+        must not be added or removed while iterating.
+        """
+        iter_values = getattr(self._tasks, 'iter_values', None)
+        if iter_values is not None:
+            return iter_values()
+        return iter(self._tasks.values())
+
+    def iter_tasks_in_range(self, first_day, last_day):
+        """
+        Iterates over the tasks shown between @first_day and @last_day,
+        both datetime.date objects, looking only at the ones the index
+        gives for these days.
+        """
+        self._update_index()
+        with self._index_lock:
+            tids = self.index.query(first_day, last_day)
+        for tid in tids:
+            task = self._tasks.get(tid)
+            if task is not None and task.get_due_date().date() >= first_day \
+                    and task.get_start_date().date() <= last_day:
+                yield task
+
+    @staticmethod
+    def _span(task):
+        return (task.get_id(), task.get_start_date().date().toordinal(),
+                task.get_due_date().date().toordinal())
+
+    def _touch(self, tid):
+        """ Marks the dates of task @tid as possibly changed. """
+        with self._index_lock:
+            if self._unindexed is not None:
+                self._unindexed.add(tid)
+
+    def _update_index(self):
+        """ Indexes again the tasks marked by _touch() or reindex(). """
+        with self._index_lock:
+            if self._unindexed is None:
+                self.index = DateIndex()
+                # e.g. snapshot.SnapshotTasks, which reads the dates of
+                # its tasks without loading them
+                iter_spans = getattr(self._tasks, 'iter_spans', None)
+                if iter_spans is not None:
+                    self.index.add_spans(iter_spans())
+                else:
+                    self.index.add_spans(self._span(t)
+                                         for t in self.iter_tasks())
+            elif self._unindexed:
+                for tid in self._unindexed:
+                    task = self._tasks.get(tid)
+                    if task is None:
+                        self.index.remove(tid)
+                    else:
+                        self.index.add(task)
+            self._unindexed = set()
+
+    def reindex(self):
+        """
+        Indexes all the tasks again, the next time the index is used. This
+        must be called after changing the tasks tree directly, rather than
+        through this datastore.
+        """
+        with self._index_lock:
+            self._unindexed = None
+
+    @traced('datastore')
     def get_task(self, tid):
-        if self.has_task(tid):
-            return self._tasks[tid]
-        else:
-            return None
+        return self._tasks.get(tid)
+
+    def get_task_for_write(self, tid):
+        """
+        Returns the task @tid to be changed in place, without the change
+        showing in the snapshots taken before (see snapshot()).
+        """
+        self.check_writer()
+        self._touch(tid)
+        if isinstance(self._tasks, VersionedTasks):
+            return self._tasks.get_for_write(tid)
+        return self.get_task(tid)
+
+    def snapshot(self):
+        """
+        Returns an immutable TasksView of the tasks as they are now, which
+        background threads can read while tasks keep being changed. It is
+        cheap to take, as it shares its storage with the datastore, but
+        must be taken from the thread changing the tasks.
+        """
+        if isinstance(self._tasks, VersionedTasks):
+            return self._tasks.snapshot()
+        # e.g. a memory-mapped snapshot file: no sharing, copy everything
+        return TasksView.copy_of(self._tasks)
 
+    @traced('datastore')
     def new_task(self):
+        self.check_writer()
         tid = str(uuid.uuid4())
         task = Task(tid, True)
         self._tasks[tid] = task
+        # its dates are set once it was returned
+        self._touch(tid)
         return task
 
+    @traced('datastore')
     def push_task(self, task):
+        self.check_writer()
         def adding(task):
             self._tasks[task.get_id()] = task
+            with self._index_lock:
+                self.index.add(task)
 
         if self.has_task(task.get_id()):
             return False
@@ -49,6 +233,41 @@ class DataStore(object):
             adding(task)
             return True
 
+    @traced('datastore')
+    def push_tasks(self, tasks):
+        """
+        Adds many tasks at once. Like push_task(), a task whose id is already
+        used is not added.
+
+        @param tasks: an iterable of Task objects.
+        @return count: integer, the number of tasks added.
+        """
+        self.check_writer()
+        added = {}
+        for task in tasks:
+            tid = task.get_id()
+            if tid not in added and tid not in self._tasks:
+                added[tid] = task
+        self._tasks.update(added)
+        with self._index_lock:
+            self.index.add_spans(self._span(t) for t in added.values())
+        return len(added)
+
+    def remove_task(self, tid):
+        """
+        Removes the task @tid.
+
+        @return task: the Task removed, or None if there was no task @tid.
+        """
+        self.check_writer()
+        task = self._tasks.pop(tid, None)
+        if task is not None:
+            with self._index_lock:
+                self.index.remove(tid)
+                if self._unindexed is not None:
+                    self._unindexed.discard(tid)
+        return task
+
     def request_task_deletion(self, tid):
         self.requester.delete_task(tid)
         # if self.has_task(tid):
@@ -86,7 +305,11 @@ class DataStore(object):
                 new_task.set_status(Task.STA_DONE)
             new_task.set_color(ex_tasks[i][4])
 
+    @traced('datastore')
     def get_random_task(self):
+        random_id = getattr(self._tasks, 'random_id', None)
+        if random_id is not None:
+            return random_id()
         if self._tasks:
             return random.choice(list(self._tasks.keys()))
         return None
@@ -0,0 +1,82 @@
+# tasks are indexed by the weeks they span, up to this many weeks; longer
+# tasks are kept apart and always checked
+MAX_INDEXED_WEEKS = 8
+
+
+class DateIndex(object):
+    """
+    Finds which tasks are shown between two days without looking at every
+    task. Each task is put in a bucket for every week it spans (weeks being
+    counted from date.min, so that they do not depend on the locale).
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.long_tasks = set()
+        self.spans = {}
+
+    def __len__(self):
+        return len(self.spans)
+
+    @staticmethod
+    def _week(day):
+        return day.toordinal() // 7
+
+    def add(self, task):
+        """ Indexes @task by its start and due dates. """
+        self.add_spans([(task.get_id(),
+                         task.get_start_date().date().toordinal(),
+                         task.get_due_date().date().toordinal())])
+
+    def add_spans(self, spans):
+        """
+        Indexes many tasks at once, without going through their Date
+        objects.
+
+        @param spans: an iterable of (id, start, due) tuples, with the days
+                      given as ordinals.
+        """
+        buckets = self.buckets
+        for tid, start, due in spans:
+            if tid in self.spans:
+                self.remove(tid)
+            if due < start:
+                start, due = due, start
+            first, last = start // 7, due // 7
+            self.spans[tid] = (start, due, first, last)
+            if last - first >= MAX_INDEXED_WEEKS:
+                self.long_tasks.add(tid)
+                continue
+            for week in range(first, last + 1):
+                bucket = buckets.get(week)
+                if bucket is None:
+                    bucket = buckets[week] = set()
+                bucket.add(tid)
+
+    def remove(self, tid):
+        span = self.spans.pop(tid, None)
+        if span is None:
+            return
+        first, last = span[2], span[3]
+        if last - first >= MAX_INDEXED_WEEKS:
+            self.long_tasks.discard(tid)
+            return
+        for week in range(first, last + 1):
+            bucket = self.buckets.get(week)
+            if bucket is not None:
+                bucket.discard(tid)
+                if not bucket:
+                    del self.buckets[week]
+
+    def query(self, first_day, last_day):
+        """
+        Returns the set of ids of the tasks shown between @first_day and
+        @last_day, both datetime.date objects.
+        """
+        first, last = first_day.toordinal(), last_day.toordinal()
+        candidates = set(self.long_tasks)
+        for week in range(self._week(first_day), self._week(last_day) + 1):
+            candidates.update(self.buckets.get(week, ()))
+        spans = self.spans
+        return set(tid for tid in candidates
+                   if spans[tid][1] >= first and spans[tid][0] <= last)
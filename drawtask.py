@@ -54,17 +54,40 @@ class DrawTask:
     def is_done(self):
         return self.task.get_status() == Task.STA_DONE
 
-    def draw(self, ctx, grid_width, padding=0,
-             selected=False, week_height=None):
-        task_x, task_y, task_w, task_h = self.get_position()
-        pos = self.get_position()
-
+    def is_visible(self):
+        """ Returns False if the task was hidden from its cell. """
+        return self.position[2] is not None and self.position[2] > 0
+
+    def get_bounds(self, grid_width, padding=0, week_height=None):
+        """
+        Returns the rectangle (x, y, w, h), in pixels, where this task is
+        drawn.
+
+        @param grid_width: float, the day/column width in pixels.
+        @param padding: float, space left around the task.
+        @param week_height: float, the week/row height (only in month view).
+        """
         base_x, base_y, width, height = utils.convert_grid_to_screen_coord(
-            grid_width, TASK_HEIGHT, task_x, task_y, task_w, task_h, padding)
+            grid_width, TASK_HEIGHT, *self.get_position(), padding=padding)
 
         # calculating week position when in month view
         if self.week_num is not None:
             base_y += self.week_num * week_height + 15
+        return base_x, base_y, width, height
+
+    def get_state(self, selected=False):
+        """
+        Returns everything that affects how this task looks on screen, so
+        that callers can tell whether it needs to be redrawn.
+        """
+        return (self.position, self.week_num, self.get_label(),
+                self.get_color(selected), self.is_done(),
+                self.overflow_L, self.overflow_R)
+
+    def draw(self, ctx, grid_width, padding=0,
+             selected=False, week_height=None):
+        base_x, base_y, width, height = self.get_bounds(grid_width, padding,
+                                                        week_height)
 
         # restrict drawing to exposed area: no unnecessary drawing is done
         ctx.rectangle(base_x, base_y, width, height)
@@ -0,0 +1,273 @@
+import concurrent.futures
+import datetime
+import string
+
+import cairo
+
+import layout
+import utils
+from drawtask import TASK_HEIGHT
+from grid import Grid, Rect
+from render import AllDayTasksRenderer, HeaderRenderer
+from tasks import Task
+from week import WeekSpan
+
+WEEK, TWO_WEEKS, MONTH = ["Week", "2 Weeks", "Month"]
+FORMATS = ('png', 'svg', 'pdf')
+# fields a path pattern may use, one file being written per page
+PATH_FIELDS = ('start', 'index')
+
+# A4 landscape, in points (or pixels, for PNG)
+PAGE_WIDTH = 842
+PAGE_HEIGHT = 595
+TITLE_HEIGHT = 30
+HEADER_HEIGHT = 35
+
+
+def task_to_record(task):
+    """
+    Converts a @task into a small picklable tuple, so that it can be cheaply
+    sent to the worker processes.
+    """
+    return (task.get_id(), task.get_title(),
+            task.get_start_date().date().toordinal(),
+            task.get_due_date().date().toordinal(),
+            task.get_status(), task.get_color())
+
+
+def record_to_task(record):
+    """ Builds back a Task object from a @record made by task_to_record. """
+    tid, title, start, due, status, color = record
+    task = Task(tid)
+    task.set_title(title)
+    task.set_start_date(datetime.date.fromordinal(start))
+    task.set_due_date(datetime.date.fromordinal(due))
+    task.set_status(status)
+    task.set_color(color or (0.5, 0.5, 0.5))
+    return task
+
+
+def iter_pages(start, end, view=MONTH):
+    """
+    Generates the first day of each page needed to cover the dates from
+    @start to @end with the given @view: one page per week, per two weeks or
+    per month.
+
+    @param start: datetime.date object, first day to be exported.
+    @param end: datetime.date object, last day to be exported.
+    @param view: string, either WEEK, TWO_WEEKS or MONTH.
+    """
+    if view == MONTH:
+        year, month = start.year, start.month
+        while datetime.date(year, month, 1) <= end:
+            yield datetime.date(year, month, 1)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    elif view in (WEEK, TWO_WEEKS):
+        numdays = 7 if view == WEEK else 14
+        day = start - datetime.timedelta(days=start.weekday())
+        while day <= end:
+            yield day
+            day += datetime.timedelta(days=numdays)
+    else:
+        raise ValueError("\'%s\' is not a valid value for View Type." % view)
+
+
+def page_span(view, first_day):
+    """ Returns the first and last day shown in the page of @first_day. """
+    if view == MONTH:
+        weeks = layout.month_weeks(first_day.year, first_day.month)
+        return weeks[0]['dates'].start_date, weeks[-1]['dates'].end_date
+    numweeks = 1 if view == WEEK else 2
+    return first_day, first_day + datetime.timedelta(days=7*numweeks - 1)
+
+
+def draw_page(ctx, view, first_day, tasks, width=PAGE_WIDTH,
+              height=PAGE_HEIGHT):
+    """
+    Draws a whole calendar page on @ctx: title, header and tasks. This uses
+    the same renderers as the views, without needing a display.
+
+    @param ctx: a Cairo context
+    @param view: string, either WEEK, TWO_WEEKS or MONTH.
+    @param first_day: datetime.date object, as given by iter_pages().
+    @param tasks: list of Task objects, only the ones in range are drawn.
+    """
+    numdays = 7
+    body_height = height - TITLE_HEIGHT - HEADER_HEIGHT
+    tasks = sorted(tasks, key=layout.task_duration, reverse=True)
+
+    if view == MONTH:
+        weeks = layout.month_weeks(first_day.year, first_day.month, numdays)
+        title = first_day.strftime("%B / %Y")
+        labels = weeks[0]['dates'].label("%A")
+        body = AllDayTasksRenderer(len(weeks), numdays)
+        body.set_size(width, body_height)
+        body.set_labels([week['dates'].label("%d") for week in weeks])
+        body.faded_cells = layout.faded_cells(weeks, first_day.month, numdays)
+        visible_rows = body.get_geometry().visible_rows(
+            TASK_HEIGHT, body.get_label_height(), minimum=1)
+        dtasks, body.overflow_links = layout.layout_month(
+            tasks, weeks, visible_rows, numdays)
+    else:
+        span = WeekSpan(1 if view == WEEK else 2)
+        span.week_containing_day(first_day)
+        numdays = len(span.days)
+        title = "%s - %s" % (span.start_date.strftime("%b %d"),
+                             span.end_date.strftime("%b %d / %Y"))
+        labels = span.label("%a %m/%d")
+        body = AllDayTasksRenderer(1, numdays)
+        body.set_size(width, body_height)
+        dtasks = layout.layout_week(tasks, span.start_date, span.end_date,
+                                    Grid(1, numdays))
+    body.set_tasks_to_draw(dtasks)
+
+    ctx.set_source_rgb(1, 1, 1)
+    ctx.paint()
+
+    # title
+    ctx.save()
+    ctx.select_font_face(body.font, cairo.FONT_SLANT_NORMAL,
+                         cairo.FONT_WEIGHT_BOLD)
+    ctx.set_font_size(16)
+    color = body.font_color
+    ctx.set_source_rgb(color[0], color[1], color[2])
+    text, x, y = utils.center_text_on_rect(ctx, title, 0, 0,
+                                           width, TITLE_HEIGHT)
+    ctx.move_to(x, y)
+    ctx.show_text(text)
+    ctx.restore()
+
+    # header
+    header = HeaderRenderer(numdays)
+    header.set_labels([label.split() for label in labels])
+    ctx.save()
+    ctx.translate(0, TITLE_HEIGHT)
+    header.render(ctx, Rect(0, 0, width, HEADER_HEIGHT))
+    ctx.restore()
+
+    # tasks
+    ctx.save()
+    ctx.translate(0, TITLE_HEIGHT + HEADER_HEIGHT)
+    ctx.rectangle(0, 0, width, body_height)
+    ctx.clip()
+    body.render(ctx, Rect(0, 0, width, body_height))
+    ctx.restore()
+
+
+def create_surface(fmt, path, width, height):
+    """ Creates a Cairo surface for format @fmt, writing to @path. """
+    if fmt == 'png':
+        return cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    elif fmt == 'svg':
+        return cairo.SVGSurface(path, width, height)
+    elif fmt == 'pdf':
+        return cairo.PDFSurface(path, width, height)
+    raise ValueError("\'%s\' is not a valid export format." % fmt)
+
+
+def finish_surface(surface, fmt, path):
+    if fmt == 'png':
+        surface.write_to_png(path)
+    surface.finish()
+
+
+def render_page(view, first_day, records, fmt, path,
+                width=PAGE_WIDTH, height=PAGE_HEIGHT):
+    """
+    Renders a single page into the file @path. Runs in the worker
+    processes, so it only receives plain data.
+
+    @param records: list of task records, see task_to_record().
+    @return path: string, the file that was written.
+    """
+    tasks = [record_to_task(r) for r in records]
+    surface = create_surface(fmt, path, width, height)
+    ctx = cairo.Context(surface)
+    draw_page(ctx, view, first_day, tasks, width, height)
+    finish_surface(surface, fmt, path)
+    return path
+
+
+def records_in_range(records, first_day, last_day):
+    """ Filters the @records that show up between the two given days. """
+    first, last = first_day.toordinal(), last_day.toordinal()
+    return [r for r in records if r[3] >= first and r[2] <= last]
+
+
+def path_fields(path):
+    """
+    Returns the set of fields in the file name pattern @path, e.g.
+    {'start'} for 'week-{start}.png'.
+
+    @raise ValueError: if @path has fields other than PATH_FIELDS, or
+                       unbalanced braces ('{{' and '}}' stand for braces).
+    """
+    try:
+        fields = set(name for _, name, _, _ in string.Formatter().parse(path)
+                     if name is not None)
+    except ValueError as e:
+        raise ValueError("Invalid path pattern '%s': %s" % (path, e))
+    unknown = fields.difference(PATH_FIELDS)
+    if unknown:
+        names = ', '.join("{%s}" % f for f in sorted(unknown))
+        raise ValueError("Invalid path pattern '%s': only {start} and "
+                         "{index} can be used, not %s" % (path, names))
+    return fields
+
+
+def export_range(tasks, start, end, path, view=MONTH, fmt='pdf',
+                 width=PAGE_WIDTH, height=PAGE_HEIGHT, processes=None):
+    """
+    Exports the calendar from @start to @end, using the layout of @view, to
+    PNG, SVG or PDF files.
+
+    If @path contains '{start}' and/or '{index}' fields, one file is written
+    per page (any other field is a ValueError, see path_fields()), and
+    pages are rendered in parallel across a process pool.
+    Otherwise, for PDF, a single multi-page document is written.
+
+    @param tasks: an iterable of Task objects.
+    @param start: datetime.date object, first day to be exported.
+    @param end: datetime.date object, last day to be exported.
+    @param path: string, output file name or pattern.
+    @param view: string, either WEEK, TWO_WEEKS or MONTH.
+    @param fmt: string, one of FORMATS.
+    @param processes: integer, number of worker processes. Defaults to the
+                      number of CPUs; 1 renders everything in this process.
+    @return paths: list of strings, the files that were written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("\'%s\' is not a valid export format." % fmt)
+    records = [task_to_record(t) for t in tasks]
+    pages = list(iter_pages(start, end, view))
+
+    if not path_fields(path):
+        path = path.format()  # '{{' and '}}' stand for braces
+        if fmt != 'pdf' and len(pages) > 1:
+            raise ValueError("Exporting %d pages to %s needs a path pattern "
+                             "with {start} or {index}." % (len(pages), fmt))
+        surface = create_surface(fmt, path, width, height)
+        ctx = cairo.Context(surface)
+        for first_day in pages:
+            page_records = records_in_range(records,
+                                            *page_span(view, first_day))
+            draw_page(ctx, view, first_day,
+                      [record_to_task(r) for r in page_records],
+                      width, height)
+            if fmt == 'pdf':
+                ctx.show_page()
+        finish_surface(surface, fmt, path)
+        return [path]
+
+    jobs = []
+    for i, first_day in enumerate(pages):
+        page_path = path.format(start=first_day.isoformat(), index=i)
+        page_records = records_in_range(records, *page_span(view, first_day))
+        jobs.append((view, first_day, page_records, fmt, page_path,
+                     width, height))
+
+    if processes == 1:
+        return [render_page(*job) for job in jobs]
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(render_page, *job) for job in jobs]
+        return [f.result() for f in futures]
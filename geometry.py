@@ -0,0 +1,58 @@
+class Geometry(object):
+    """
+    Everything in a calendar drawing area that depends only on its allocated
+    size: column and row sizes and offsets. It is computed once per
+    size-allocate and then shared by drawing and hit-testing, instead of
+    being derived from the allocation over and over on every frame.
+    """
+
+    def __init__(self, width, height, num_rows=1, num_cols=7):
+        """
+        @param width: integer, allocated width in pixels.
+        @param height: integer, allocated height in pixels.
+        @param num_rows: integer, number of rows (weeks) in the area.
+        @param num_cols: integer, number of columns (days) in the area.
+        """
+        self.width = width
+        self.height = height
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        if num_cols > 0:
+            self.day_width = width / float(num_cols)
+        else:
+            self.day_width = 0
+        if num_rows > 0:
+            self.week_height = height / float(num_rows)
+        else:
+            self.week_height = 0
+        self.col_x = [i * self.day_width for i in range(num_cols + 1)]
+        self.row_y = [i * self.week_height for i in range(num_rows + 1)]
+        self._visible_rows = {}
+
+    def matches(self, width, height, num_rows, num_cols):
+        """ Returns True if this geometry is still valid for these sizes. """
+        return (self.width == width and self.height == height and
+                self.num_rows == num_rows and self.num_cols == num_cols)
+
+    def cell_bounds(self, row, col):
+        """ Returns the rectangle (x, y, w, h) of the cell at @row, @col. """
+        return (col * self.day_width, row * self.week_height,
+                self.day_width, self.week_height)
+
+    def visible_rows(self, task_height, label_height=0, minimum=0):
+        """
+        Returns how many rows of tasks fit in a week, once the day labels
+        are accounted for.
+
+        @param task_height: integer, height of each task in pixels.
+        @param label_height: integer, height of the day labels in pixels.
+        @param minimum: integer, the smallest value that will be returned.
+        """
+        key = (task_height, label_height, minimum)
+        try:
+            return self._visible_rows[key]
+        except KeyError:
+            available = self.week_height - label_height
+            rows = max(int(available // task_height), minimum)
+            self._visible_rows[key] = rows
+            return rows
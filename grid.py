@@ -1,3 +1,7 @@
+from perf import counters
+from tracing import traced
+
+
 class Rect():
     def __init__(self, x, y, width, height, id=1):
         self.id = id
@@ -53,6 +57,7 @@ class Grid():
     def __getitem__(self, index):
         return self.grid[index]
 
+    @traced('grid')
     def add_row(self):
         self.grid.append([])
         i = self.num_rows
@@ -103,14 +108,17 @@ class Grid():
             last_row -= 1
         return last_row
 
+    @traced('grid')
     def clear_cols(self):
         while self.num_cols > 0:
             self.remove_col(0)
 
+    @traced('grid')
     def clear_rows(self):
         while self.num_rows > 0:
             self.remove_row(0)
 
+    @traced('grid')
     def remove_from_grid(self, x, y, w, h, remove_empty_rows=True,
                          remove_empty_cols=False):
         rect = Rect(x, y, w, h)
@@ -137,12 +145,15 @@ class Grid():
             for j in range(rect.x, rect.x + rect.width):
                 self.grid[i][j].release()
 
+    @traced('grid')
     def find_single_row_to_add(self, x, width):
         row = 0
         can_fit = False
+        cells_scanned = 0
         for i in range(self.num_rows):
             can_fit = True
             for j in range(x, x + width):
+                cells_scanned += 1
                 cell = self.grid[i][j]
                 if not cell.is_free():
                     # print "cannot fit row", i
@@ -153,9 +164,12 @@ class Grid():
                 break
         if not can_fit:
             row = self.num_rows
+        counters.grid_rows_scanned += min(row + 1, self.num_rows)
+        counters.grid_cells_scanned += cells_scanned
         # print "will be in row", row
         return row
 
+    @traced('grid')
     def add_to_grid(self, x, w, id=1):
         rect = Rect(x, 0, w, 1)
         rect.y = self.find_single_row_to_add(rect.x, rect.width)
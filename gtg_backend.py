@@ -0,0 +1,146 @@
+import queue
+import threading
+import xml.etree.ElementTree as ET
+
+from dates import Date
+from tasks import Task
+
+# number of tasks handed over from the parser to the loader at a time
+BATCH_SIZE = 1000
+# number of batches the parser may get ahead of the loader
+MAX_PENDING_BATCHES = 4
+
+# GTG files exist in two layouts: the old one keeps dates directly in the
+# task element, the newer one groups them in a <dates> element
+DATE_TAGS = {
+    'start': ('startdate', 'dates/start'),
+    'due': ('duedate', 'dates/due'),
+    'done': ('donedate', 'dates/done'),
+}
+
+
+def _find_text(elem, paths):
+    for path in paths:
+        child = elem.find(path)
+        if child is not None and child.text:
+            return child.text.strip()
+    return None
+
+
+def _parse_date(value):
+    try:
+        return Date(value or '')
+    except ValueError:
+        return Date.no_date()
+
+
+def element_to_task(elem):
+    """ Builds a Task from a GTG <task> element. """
+    task = Task(elem.get('id') or elem.get('uuid'))
+    title = elem.find('title')
+    task.set_title(title.text if title is not None else '')
+    task.set_start_date(_parse_date(_find_text(elem, DATE_TAGS['start'])))
+    task.set_due_date(_parse_date(_find_text(elem, DATE_TAGS['due'])))
+    status = elem.get('status', Task.STA_ACTIVE)
+    done = _find_text(elem, DATE_TAGS['done'])
+    if status in (Task.STA_DONE, Task.STA_DISMISSED) and done:
+        task.set_status(status, _parse_date(done))
+    else:
+        task.set_status(status)
+    tags = elem.get('tags')
+    if tags:
+        task.tags = [t.strip() for t in tags.split(',') if t.strip()]
+    else:
+        task.tags = [t.text.strip() for t in elem.findall('tags/tag')
+                     if t.text]
+    content = elem.find('content')
+    if content is not None and content.text:
+        task.content = content.text
+    return task
+
+
+def iter_task_batches(source, batch_size=BATCH_SIZE):
+    """
+    Parses a GTG XML file incrementally, yielding lists of at most
+    @batch_size Task objects. Each <task> element is dropped as soon as it
+    was converted, so memory use does not grow with the size of the file.
+
+    @param source: file name or file object.
+    """
+    batch = []
+    parents = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag != 'task':
+            continue
+        batch.append(element_to_task(elem))
+        # drop the element, and its parent's reference to it
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_gtg(source, datastore, batch_size=BATCH_SIZE):
+    """
+    Loads the tasks of a GTG XML file into @datastore.
+
+    Parsing runs in its own thread and hands batches of tasks over a bounded
+    queue, while this thread adds them to @datastore, which indexes them by
+    date. This way indexing overlaps with parsing, and at most
+    MAX_PENDING_BATCHES batches are held in memory at any time.
+
+    @param source: file name or file object.
+    @param datastore: the DataStore tasks are added to. It should not be
+                      used by other threads while loading.
+    @return count: integer, the number of tasks loaded.
+    """
+    batches = queue.Queue(MAX_PENDING_BATCHES)
+    errors = []
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        """ Waits for room in the queue, unless loading was given up. """
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def parse():
+        try:
+            for batch in iter_task_batches(source, batch_size):
+                if not put(batch):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(done)
+
+    parser = threading.Thread(target=parse, name='gtg-parser')
+    parser.daemon = True
+    parser.start()
+
+    count = 0
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            count += datastore.push_tasks(batch)
+    finally:
+        stop.set()
+        parser.join()
+    if errors:
+        raise errors[0]
+    return count
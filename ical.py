@@ -0,0 +1,315 @@
+import datetime
+
+from dates import Date
+from layout import is_in_range
+from tasks import Task
+
+# number of tasks handed to the DataStore at a time
+BATCH_SIZE = 1000
+# components read as tasks; any other component is skipped
+TASK_COMPONENTS = ('VTODO', 'VEVENT')
+# maximum length of a content line, in octets, before it is folded (RFC 5545)
+LINE_LENGTH = 75
+PRODID = '-//calendar-plugin//EN'
+
+STATUS_FROM_ICAL = {
+    'NEEDS-ACTION': Task.STA_ACTIVE,
+    'IN-PROCESS': Task.STA_ACTIVE,
+    'TENTATIVE': Task.STA_ACTIVE,
+    'CONFIRMED': Task.STA_ACTIVE,
+    'COMPLETED': Task.STA_DONE,
+    'CANCELLED': Task.STA_DISMISSED,
+}
+STATUS_TO_ICAL = {
+    Task.STA_ACTIVE: 'NEEDS-ACTION',
+    Task.STA_DONE: 'COMPLETED',
+    Task.STA_DISMISSED: 'CANCELLED',
+}
+
+
+def unfold_lines(lines):
+    """
+    Joins the folded lines of an iCalendar stream back into content lines,
+    keeping only one line in memory at a time.
+
+    @param lines: an iterable of strings, such as a text file.
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line):
+    """
+    Splits a content line into its name, parameters and value.
+
+    @return name, params, value: the upper-cased name, a dictionary of
+                                 upper-cased parameter names to values, and
+                                 the raw value.
+    """
+    # the value starts at the first colon that is not in a quoted parameter
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            break
+    else:
+        raise ValueError("Not an iCalendar content line: '%s'" % line)
+    parts = line[:i].split(';')
+    params = {}
+    for param in parts[1:]:
+        key, _, value = param.partition('=')
+        params[key.upper()] = value.strip('"')
+    return parts[0].upper(), params, line[i + 1:]
+
+
+def unescape(value):
+    """ Decodes an iCalendar TEXT value. """
+    if '\\' not in value:
+        return value
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            if char in ('n', 'N'):
+                char = '\n'
+        result.append(char)
+    return ''.join(result)
+
+
+def escape(value):
+    """ Encodes a string as an iCalendar TEXT value. """
+    return value.replace('\\', '\\\\').replace(';', '\\;') \
+        .replace(',', '\\,').replace('\n', '\\n')
+
+
+def split_list(value):
+    """ Splits a comma separated list of TEXT values. """
+    items = []
+    current = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            current.append(char + next(chars, ''))
+        elif char == ',':
+            items.append(unescape(''.join(current)))
+            current = []
+        else:
+            current.append(char)
+    items.append(unescape(''.join(current)))
+    return [item.strip() for item in items if item.strip()]
+
+
+def parse_date(value):
+    """
+    Parses a DATE or DATE-TIME value, ignoring the time of day.
+
+    @return datetime.date
+    """
+    return datetime.datetime.strptime(value[:8], '%Y%m%d').date()
+
+
+def _task_from_properties(component, properties):
+    uid = properties.get('UID')
+    task = Task(uid[1] if uid else '')
+    summary = properties.get('SUMMARY')
+    task.set_title(unescape(summary[1]) if summary else '')
+
+    start = properties.get('DTSTART')
+    due = properties.get('DUE') or properties.get('DTEND')
+    start_day = parse_date(start[1]) if start else None
+    due_day = parse_date(due[1]) if due else None
+    if due_day is not None and 'DUE' not in properties and \
+            (due[0].get('VALUE') == 'DATE' or len(due[1]) == 8) and \
+            start_day is not None and due_day > start_day:
+        # the DTEND of an all-day event is the day after it ends
+        due_day -= datetime.timedelta(1)
+    task.set_start_date(Date(start_day or due_day))
+    task.set_due_date(Date(due_day or start_day))
+
+    status = properties.get('STATUS')
+    status = STATUS_FROM_ICAL.get(status[1].upper() if status else '',
+                                  Task.STA_ACTIVE)
+    completed = properties.get('COMPLETED')
+    if completed and component == 'VTODO':
+        status = Task.STA_DONE
+    if status == Task.STA_ACTIVE:
+        task.set_status(status)
+    else:
+        task.set_status(status, Date(parse_date(completed[1]))
+                        if completed else None)
+    task.tags = properties.get('CATEGORIES', [])
+    return task
+
+
+def iter_task_batches(lines, batch_size=BATCH_SIZE, id_prefix='ical-'):
+    """
+    Reads the VTODO and VEVENT components of an iCalendar stream in a
+    single pass, yielding lists of at most @batch_size Task objects. Only
+    the properties of the component being read are kept in memory.
+
+    Components without an UID are given one from their position in the
+    stream (after @id_prefix), so that reading the same stream twice gives
+    the same ids. Malformed lines are skipped, and so are components with
+    malformed dates.
+
+    @param lines: an iterable of strings, such as a text file.
+    """
+    batch = []
+    component = None
+    properties = None
+    # depth of the components nested in the current one, such as VALARM
+    nested = 0
+    position = 0
+    for line in unfold_lines(lines):
+        if not line.strip():
+            continue
+        try:
+            name, params, value = parse_line(line)
+        except ValueError:
+            continue  # not a content line: skip it
+        if name == 'BEGIN':
+            value = value.upper()
+            if component is not None:
+                nested += 1
+            elif value in TASK_COMPONENTS:
+                component = value
+                properties = {}
+        elif name == 'END':
+            if nested:
+                nested -= 1
+            elif component is not None:
+                position += 1
+                if 'UID' not in properties:
+                    properties['UID'] = ({}, '%s%d' % (id_prefix, position))
+                try:
+                    batch.append(_task_from_properties(component, properties))
+                except ValueError:
+                    pass  # malformed dates: skip the component
+                component = None
+                properties = None
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        elif component is not None and not nested:
+            if name == 'CATEGORIES':
+                properties.setdefault(name, []).extend(split_list(value))
+            elif name not in properties:
+                properties[name] = (params, value)
+    if batch:
+        yield batch
+
+
+def load_ical(source, datastore, batch_size=BATCH_SIZE):
+    """
+    Imports the tasks of an iCalendar file into @datastore.
+
+    @param source: file name or text file object.
+    @return count: integer, the number of tasks added.
+    """
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', newline='') as f:
+            return load_ical(f, datastore, batch_size)
+    count = 0
+    for batch in iter_task_batches(source, batch_size):
+        for task in batch:
+            if datastore.push_task(task):
+                count += 1
+    return count
+
+
+def fold(line):
+    """ Splits a content line longer than LINE_LENGTH octets. """
+    data = line.encode('utf-8')
+    if len(data) <= LINE_LENGTH:
+        return line + '\r\n'
+    parts = []
+    start = 0
+    limit = LINE_LENGTH
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # never cut a multi-byte character in half
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode('utf-8'))
+        start = end
+        limit = LINE_LENGTH - 1  # room for the leading space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _format_date(day):
+    return day.strftime('%Y%m%d')
+
+
+def task_to_lines(task, stamp):
+    """ Returns the content lines of the VTODO component for @task. """
+    lines = ['BEGIN:VTODO',
+             'UID:%s' % task.get_id(),
+             'DTSTAMP:%s' % stamp,
+             'SUMMARY:%s' % escape(task.get_title())]
+    start, due = task.get_start_date(), task.get_due_date()
+    if not start.is_fuzzy():
+        lines.append('DTSTART;VALUE=DATE:%s' % _format_date(start.date()))
+    if not due.is_fuzzy():
+        lines.append('DUE;VALUE=DATE:%s' % _format_date(due.date()))
+    status = task.get_status()
+    lines.append('STATUS:%s' % STATUS_TO_ICAL.get(status, 'NEEDS-ACTION'))
+    closed = task.get_closed_date()
+    if status == Task.STA_DONE and not closed.is_fuzzy():
+        lines.append('COMPLETED:%sT000000Z' % _format_date(closed.date()))
+    if task.tags:
+        lines.append('CATEGORIES:%s' % ','.join(escape(t) for t in task.tags))
+    lines.append('END:VTODO')
+    return lines
+
+
+def iter_ical(tasks, first_day=None, last_day=None):
+    """
+    Generates an iCalendar stream of the tasks shown between @first_day and
+    @last_day (all of them if no days are given), as folded content lines.
+    Tasks are converted one at a time, so the stream can be written out
+    while it is produced, whatever its size.
+
+    @param tasks: an iterable of Task objects.
+    @param first_day: datetime.date object, or None.
+    @param last_day: datetime.date object, or None.
+    """
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime(
+        '%Y%m%dT%H%M%SZ')
+    first_day = first_day or datetime.date.min
+    last_day = last_day or datetime.date.max
+    yield 'BEGIN:VCALENDAR\r\n'
+    yield 'VERSION:2.0\r\n'
+    yield 'PRODID:%s\r\n' % PRODID
+    for task in tasks:
+        if is_in_range(task, first_day, last_day):
+            for line in task_to_lines(task, stamp):
+                yield fold(line)
+    yield 'END:VCALENDAR\r\n'
+
+
+def write_ical(tasks, path, first_day=None, last_day=None):
+    """
+    Writes the tasks shown between @first_day and @last_day to an iCalendar
+    file at @path, see iter_ical().
+
+    @return count: integer, the number of tasks written.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for line in iter_ical(tasks, first_day, last_day):
+            if line == 'END:VTODO\r\n':
+                count += 1
+            f.write(line)
+    return count
@@ -0,0 +1,283 @@
+import json
+import os
+import threading
+
+from dataset import apply_fields, dict_to_task, load_dataset, task_to_dict
+from snapshot import Snapshot, write_snapshot
+
+JOURNAL_NAME = 'journal.log'
+# binary snapshot, see snapshot.py
+SNAPSHOT_NAME = 'snapshot.snap'
+# JSON snapshot written by older versions, read until the next compaction
+JSON_SNAPSHOT_NAME = 'snapshot.json'
+# time (s) the writer waits after a commit, gathering records for the next
+COMMIT_INTERVAL = 0.2
+# size (bytes) of the journal above which it is compacted into the snapshot
+COMPACT_SIZE = 4 * 1024 * 1024
+
+
+class _Compaction(object):
+    """ Queued in place of a record to ask the writer for a compaction. """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+
+class Journal(object):
+    """
+    Persists the changes made to a DataStore through its Requester. Each
+    change is appended as a small JSON record to a journal file; on load the
+    journal is replayed over the last snapshot.
+
+    Records are written by a background thread: all the records queued
+    while it was busy are written at once and made durable with a single
+    fsync (group commit), so changing tasks never waits for the disk. Once
+    the journal grows past a threshold, the writer rewrites the snapshot and
+    starts a new journal, also in the background.
+    """
+
+    def __init__(self, directory, commit_interval=COMMIT_INTERVAL,
+                 compact_size=COMPACT_SIZE):
+        """
+        @param directory: string, where the journal and snapshot are kept.
+        @param commit_interval: float, seconds the writer waits after each
+                                commit, so that records are batched.
+        @param compact_size: integer, journal size in bytes which triggers a
+                             compaction.
+        """
+        self.directory = directory
+        self.journal_path = os.path.join(directory, JOURNAL_NAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self.json_snapshot_path = os.path.join(directory, JSON_SNAPSHOT_NAME)
+        self.commit_interval = commit_interval
+        self.compact_size = compact_size
+        self.requester = None
+
+        self.pending = []
+        self.queued = 0
+        self.written = 0
+        self.commits = 0
+        self.compactions = 0
+        self.journal_size = 0
+        self.compacting = False
+        self.closed = False
+        self.error = None
+        self.cond = threading.Condition()
+        self._thread = None
+
+    def exists(self):
+        """ Returns True if anything was persisted before. """
+        return os.path.exists(self.snapshot_path) or \
+            os.path.exists(self.json_snapshot_path) or \
+            os.path.exists(self.journal_path)
+
+    def load(self, datastore):
+        """
+        Loads the last snapshot into @datastore, and replays the journal over
+        it. The snapshot is memory-mapped: its tasks only read their fields
+        from it when they are first used (see snapshot.MappedTask). A record cut short by a crash, at the end of the journal, is
+        ignored and cut off the file, so that new records are not appended
+        to it.
+
+        @return count: integer, the number of journal records replayed.
+        """
+        if os.path.exists(self.snapshot_path):
+            snapshot = Snapshot(self.snapshot_path)
+            datastore.push_tasks(snapshot.task(row)
+                                 for row in range(len(snapshot)))
+        elif os.path.exists(self.json_snapshot_path):
+            load_dataset(self.json_snapshot_path, datastore)
+        count = 0
+        if not os.path.exists(self.journal_path):
+            return count
+        tasks = datastore.get_tasks_tree()
+        # where the last whole record ends
+        offset = 0
+        with open(self.journal_path, 'r+b') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn write at the end of the journal
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                self.replay(tasks, record)
+                count += 1
+                offset += len(line)
+            f.seek(0, os.SEEK_END)
+            if f.tell() > offset:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+        self.journal_size = offset
+        if count:
+            datastore.reindex()  # tasks were changed behind its back
+        return count
+
+    @staticmethod
+    def replay(tasks, record):
+        """
+        Applies a journal @record to @tasks, a dictionary of id -> Task.
+        Replaying a record twice has no further effect, so records that made
+        it into a snapshot can safely be replayed again after a crash.
+        """
+        op = record['op']
+        data = record['task']
+        tid = data['id']
+        if op == 'delete':
+            tasks.pop(tid, None)
+        elif tid in tasks:
+            apply_fields(tasks[tid], data)
+        else:
+            tasks[tid] = dict_to_task(data)
+
+    def attach(self, requester, start=True):
+        """
+        Starts recording every change made through @requester, and starts
+        the writer thread.
+
+        @param start: if False, records are only queued until start() is
+                      called, so that changes can be recorded while the
+                      journal is still being loaded. They are lost if the
+                      journal is closed before.
+        """
+        self.requester = requester
+        requester.add_observer(self.on_change)
+        if start:
+            self.start()
+
+    def start(self):
+        """ Starts the writer thread, once the journal was loaded. """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._thread = threading.Thread(target=self._run,
+                                        name='journal-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def on_change(self, op, task, fields):
+        """ Requester observer: queues a record describing the change. """
+        if op == 'delete':
+            data = {'id': task.get_id()}
+        else:
+            data = task_to_dict(task, fields)
+        line = json.dumps({'op': op, 'task': data}, separators=(',', ':'))
+        self.append((line + '\n').encode('utf-8'))
+        if self.journal_size >= self.compact_size and not self.compacting:
+            self.compact()
+
+    def append(self, record):
+        """ Queues @record (bytes) to be written to the journal. """
+        with self.cond:
+            self.pending.append(record)
+            self.queued += 1
+            self.cond.notify()
+
+    def compact(self):
+        """
+        Asks the writer to rewrite the snapshot with the current tasks and to
+        start a new journal. Only an immutable view of the tasks is taken
+        here (see DataStore.snapshot): converting and writing them happens
+        in the writer thread. Changes made meanwhile are queued after the
+        compaction, so they end up in the new journal and are replayed over
+        the snapshot anyway.
+        """
+        tasks = self.requester.snapshot()
+        with self.cond:
+            self.compacting = True
+            self.pending.append(_Compaction(tasks))
+            self.queued += 1
+            self.cond.notify()
+
+    def sync(self, timeout=None):
+        """
+        Waits until every record queued so far is on disk.
+
+        @return bool: False if @timeout (seconds) expired before.
+        """
+        with self.cond:
+            target = self.queued
+            return self.cond.wait_for(lambda: self.written >= target or
+                                      self.error is not None, timeout)
+
+    def close(self):
+        """ Writes whatever is still queued and stops the writer thread. """
+        if self._thread is None:
+            if self.requester is not None:
+                self.requester.remove_observer(self.on_change)
+                self.requester = None
+            return
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self._thread.join()
+        self._thread = None
+        if self.requester is not None:
+            self.requester.remove_observer(self.on_change)
+            self.requester = None
+
+    def _run(self):
+        journal = open(self.journal_path, 'ab')
+        self.journal_size = journal.tell()
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.pending or self.closed)
+                    if not self.pending:
+                        break
+                    batch, self.pending = self.pending, []
+                journal = self._write_batch(journal, batch)
+                with self.cond:
+                    self.written += len(batch)
+                    self.cond.notify_all()
+                    if self.closed:
+                        continue
+                    # gather records for the next commit meanwhile
+                    self.cond.wait(self.commit_interval)
+        except (IOError, OSError) as e:
+            with self.cond:
+                self.error = e
+                self.cond.notify_all()
+            raise
+        finally:
+            journal.close()
+
+    def _write_batch(self, journal, batch):
+        records = []
+        for item in batch:
+            if isinstance(item, _Compaction):
+                self._commit(journal, records)
+                records = []
+                journal = self._compact(journal, item.tasks)
+            else:
+                records.append(item)
+        self._commit(journal, records)
+        return journal
+
+    def _commit(self, journal, records):
+        if not records:
+            return
+        data = b''.join(records)
+        journal.write(data)
+        journal.flush()
+        os.fsync(journal.fileno())
+        self.journal_size += len(data)
+        self.commits += 1
+
+    def _compact(self, journal, tasks):
+        temp_path = self.snapshot_path + '.tmp'
+        write_snapshot(tasks.values(), temp_path)
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        # tasks mapped from the previous snapshot keep reading it, as it
+        # stays open until they are all gone
+        os.replace(temp_path, self.snapshot_path)
+        if os.path.exists(self.json_snapshot_path):
+            os.remove(self.json_snapshot_path)
+        # the snapshot now holds everything in the journal: start a new one
+        journal.close()
+        journal = open(self.journal_path, 'wb')
+        os.fsync(journal.fileno())
+        self.journal_size = 0
+        self.compactions += 1
+        self.compacting = False
+        return journal
@@ -0,0 +1,194 @@
+import calendar
+import datetime
+
+from drawtask import DrawTask
+from grid import Grid
+from week import WeekSpan
+import utils
+from perf import counters
+from tracing import traced
+
+
+def is_in_range(task, first_day, last_day):
+    """
+    Returns true if the given @task have either the start or due days
+    between @first_day and @last_day.
+
+    @param task: a Task object
+    @param first_day: datetime.date object
+    @param last_day: datetime.date object
+    """
+    return (task.get_due_date().date() >= first_day) and \
+           (task.get_start_date().date() <= last_day)
+
+
+def task_duration(task):
+    """ Returns the number of days between start and due date of @task. """
+    return (task.get_due_date().date() - task.get_start_date().date()).days
+
+
+def place_task(dtask, grid, first_day, last_day, num_week=None):
+    """
+    Calculates and sets the position of a @dtask inside the week going from
+    @first_day to @last_day, using @grid as guidance.
+
+    @param dtask: a DrawTask object.
+    @param grid: a Grid object.
+    @param first_day: datetime.date object, first day of the week.
+    @param last_day: datetime.date object, last day of the week.
+    @param num_week: integer, which week of the month the task is in, if any.
+    """
+    task = dtask.task
+    start = max(task.get_start_date().date(), first_day)
+    end = min(task.get_due_date().date(), last_day)
+    duration = (end - start).days + 1
+
+    x = utils.date_to_col_coord(start, first_day)
+    w = duration
+    x, y, w, h = grid.add_to_grid(x, w, id=dtask.get_id())
+
+    dtask.set_position(x, y, w, h)  # position inside this grid
+    dtask.set_week_num(num_week)  # which week this task is in
+    dtask.set_overflowing_L(first_day)
+    dtask.set_overflowing_R(last_day)
+
+
+@traced('layout')
+def layout_week(tasks, first_day, last_day, grid):
+    """
+    Creates a DrawTask for each one of @tasks shown between @first_day and
+    @last_day, and places them on @grid (which is cleared first).
+
+    @param tasks: an iterable of Task objects.
+    @param grid: a Grid object with one column per day.
+    @return dtasks: list of positioned DrawTask objects.
+    """
+    dtasks = [DrawTask(t) for t in tasks
+              if is_in_range(t, first_day, last_day)]
+    counters.drawtasks_built += len(dtasks)
+    grid.clear_rows()
+    for dtask in dtasks:
+        place_task(dtask, grid, first_day, last_day)
+    return dtasks
+
+
+def number_of_weeks(year, month):
+    """
+    Calculates the number of weeks the given @month of a @year has.
+
+    @param year: integer, a valid year in the format YYYY.
+    @param month: integer, a month (should be between 1 and 12)
+    """
+    num_days_in_month = calendar.monthrange(year, month)[1]
+    first_day = datetime.date(year, month, 1)
+    last_day = datetime.date(year, month, num_days_in_month)
+    return utils.date_to_row_coord(last_day, first_day) + 1
+
+
+def month_weeks(year, month, numdays=7):
+    """
+    Creates the structure needed to manage dates, tasks and task positions
+    for each one of the weeks of a @month of a @year. It is a list where each
+    position is a dictionary with entries:
+        'grid': contains Grid object.
+        'dates': contains WeekSpan object.
+        'tasks': is an empty list, will keep track of list of DrawTask.
+    """
+    weeks = []
+    first_day = datetime.date(year, month, 1)
+    for i in range(number_of_weeks(year, month)):
+        dates = WeekSpan()
+        dates.week_containing_day(first_day + datetime.timedelta(days=i*7))
+        weeks.append({'grid': Grid(1, numdays), 'dates': dates, 'tasks': []})
+    return weeks
+
+
+def tasks_to_hide(grid, col, visible_rows, needed_rows):
+    """
+    Returns the ids of the tasks in column @col of @grid that are placed
+    beyond the @visible_rows, and thus can not be shown.
+    """
+    to_hide = []
+    if needed_rows >= visible_rows:
+        for i in range(visible_rows, needed_rows):
+            cell = grid[i][col]
+            if not cell.is_free():
+                to_hide.append(str(cell))
+    return to_hide
+
+
+@traced('layout')
+def layout_month(tasks, weeks, visible_rows, numdays=7):
+    """
+    Places @tasks on the grid of each one of the @weeks (as returned by
+    month_weeks), hiding the tasks that do not fit in @visible_rows rows and
+    creating links to them instead.
+
+    @param tasks: an iterable of Task objects, already sorted in the order
+                  they should be placed (longest first works best).
+    @param weeks: list of week dictionaries, see month_weeks().
+    @param visible_rows: integer, number of task rows that fit in a week.
+    @return dtasks, links: list of positioned DrawTask objects, and list of
+            (label, row, col) tuples for the cells with hidden tasks.
+    """
+    first_day = weeks[0]['dates'].start_date
+    last_day = weeks[-1]['dates'].end_date
+    tasks = [t for t in tasks if is_in_range(t, first_day, last_day)]
+
+    dtasks = []
+    for i, week in enumerate(weeks):
+        dates = week['dates']
+        week['tasks'] = [DrawTask(t) for t in tasks if
+                         is_in_range(t, dates.start_date, dates.end_date)]
+        dtasks += week['tasks']
+        counters.drawtasks_built += len(week['tasks'])
+
+        week['grid'].clear_rows()
+        for dtask in week['tasks']:
+            place_task(dtask, week['grid'], dates.start_date, dates.end_date,
+                       i)
+
+    # deals with when we have more tasks than available lines in a same day
+    links = []
+    for row, week in enumerate(weeks):
+        grid = week['grid']
+        if grid.num_rows > visible_rows:
+            for col in range(numdays):
+                needed_rows = grid.last_occupied_row_in_col(col) + 1
+                # if can't fit, hide last tasks and create link to them
+                if needed_rows > visible_rows:
+                    to_hide = tasks_to_hide(grid, col, visible_rows,
+                                            needed_rows)
+
+                    # hide overflowing tasks from cell
+                    for dtask in week['tasks']:
+                        if dtask.get_id() in to_hide:
+                            dtask.set_position(-1, -1, -1, -1)
+
+                    # create label to link to hidden tasks
+                    links.append(('+%d more' % len(to_hide), row, col))
+    return dtasks, links
+
+
+def faded_cells(weeks, month, numdays=7):
+    """
+    Returns the cells at the beginning and/or the end of @weeks that do not
+    belong to @month.
+    """
+    cells = []
+
+    # cells to fade from days in previous month
+    for col, day in enumerate(weeks[0]['dates'].days):
+        if day.month == month:
+            break
+        cells.append((0, col))
+
+    # cells to fade from days in next month
+    row = len(weeks) - 1
+    col = numdays - 1
+    for day in reversed(weeks[-1]['dates'].days):
+        if day.month == month:
+            break
+        cells.append((row, col))
+        col -= 1
+    return cells
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import gc
+import json
+import sys
+import tracemalloc
+
+import layout
+import synthetic
+from datastore import DataStore
+from grid import Grid, Rect
+from week import WeekSpan
+
+# types whose instances are counted, by class name
+TRACKED_TYPES = ('Task', 'Date', 'DrawTask', 'Cell', 'Grid', 'WeekSpan',
+                 'Context', 'ImageSurface')
+# number of frames kept by tracemalloc for each allocation
+TRACE_FRAMES = 8
+
+
+def instance_size(obj):
+    """ Returns the shallow size of @obj plus the size of its __dict__. """
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+    return size
+
+
+def count_objects(types=TRACKED_TYPES):
+    """
+    Counts the live instances of each one of @types, after a collection.
+
+    @return counts: dictionary of type name -> {'count', 'bytes'}, where
+                    'bytes' is the sum of their instance_size().
+    """
+    gc.collect()
+    counts = dict((name, {'count': 0, 'bytes': 0}) for name in types)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name]['count'] += 1
+            counts[name]['bytes'] += instance_size(obj)
+    return counts
+
+
+def take_snapshot():
+    """ Takes a tracemalloc snapshot, leaving out this tool's own memory. """
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__)))
+
+
+def allocations_by_file(snapshot, baseline, limit=15):
+    """
+    Groups the memory allocated between tracemalloc snapshots @baseline and
+    @snapshot, and still alive, by the source file that allocated it.
+
+    @return stats: list of (filename, bytes, blocks), largest first.
+    """
+    stats = snapshot.compare_to(baseline, 'filename')
+    return [(s.traceback[0].filename, s.size_diff, s.count_diff)
+            for s in stats[:limit] if s.size_diff > 0]
+
+
+def month_cycle(tasks, first_day, months, renderer_factory=None):
+    """
+    Walks through @months months starting on @first_day, laying out (and
+    drawing, with @renderer_factory) each one of them as the month view and
+    each one of their weeks as the week view would.
+
+    @return kept: the objects the views would keep alive afterwards, i.e.
+                  those of the last month shown.
+    """
+    day = first_day
+    kept = None
+    grid = Grid(1, 7)
+    span = WeekSpan()
+    for i in range(months):
+        weeks = layout.month_weeks(day.year, day.month)
+        dtasks, links = layout.layout_month(tasks, weeks, 4)
+        for week in weeks:
+            span.week_containing_day(week['dates'].start_date)
+            week_dtasks = layout.layout_week(tasks, span.start_date,
+                                             span.end_date, grid)
+        if renderer_factory is not None:
+            renderer_factory(weeks, dtasks, links)
+        kept = (weeks, dtasks, links, week_dtasks)
+        day = weeks[-1]['dates'].end_date + datetime.timedelta(days=1)
+    return kept
+
+
+def cairo_renderer_factory(width=1024, height=768):
+    """
+    Returns a function drawing a laid out month on an image surface, or None
+    if cairo is not available.
+    """
+    try:
+        import cairo
+        from render import AllDayTasksRenderer
+    except ImportError:
+        return None
+
+    def draw(weeks, dtasks, links):
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        ctx = cairo.Context(surface)
+        renderer = AllDayTasksRenderer(len(weeks), 7)
+        renderer.set_size(width, height)
+        renderer.set_labels([w['dates'].label("%d") for w in weeks])
+        renderer.set_tasks_to_draw(dtasks)
+        renderer.overflow_links = links
+        renderer.render(ctx, Rect(0, 0, width, height))
+        surface.flush()
+    return draw
+
+
+def run_report(num_tasks=10000, cycles=5, months=12, render=True, seed=7,
+               datastore=None):
+    """
+    Loads a dataset, then walks @cycles times through @months months,
+    measuring memory after loading and after each cycle.
+
+    @param datastore: a DataStore to measure, instead of @num_tasks
+                      synthetic tasks.
+    @return report: dictionary ready to be dumped as JSON.
+    """
+    first_day = datetime.date.today().replace(day=1)
+    tracemalloc.start(TRACE_FRAMES)
+    baseline = take_snapshot()
+
+    if datastore is None:
+        datastore = synthetic.populate(DataStore(), num_tasks, seed=seed,
+                                       start=first_day, days=months * 31)
+    tasks = [datastore.get_task(t) for t in datastore.get_all_tasks()]
+    tasks.sort(key=layout.task_duration, reverse=True)
+    loaded_counts = count_objects()
+    loaded = take_snapshot()
+    loaded_size = tracemalloc.get_traced_memory()[0]
+
+    renderer_factory = cairo_renderer_factory() if render else None
+    steps = []
+    kept = None
+    for i in range(cycles):
+        kept = month_cycle(tasks, first_day, months, renderer_factory)
+        counts = count_objects()
+        current, peak = tracemalloc.get_traced_memory()
+        steps.append({'cycle': i + 1,
+                      'traced_bytes': current,
+                      'peak_bytes': peak,
+                      'counts': counts})
+    final = take_snapshot()
+    tracemalloc.stop()
+    del kept
+
+    growth = [(str(s.traceback), s.size_diff, s.count_diff)
+              for s in final.compare_to(loaded, 'lineno')[:15]
+              if s.size_diff > 0]
+    per_task = {}
+    if tasks:
+        for name in ('Task', 'Date'):
+            per_task[name] = loaded_counts[name]['bytes'] / float(len(tasks))
+        per_task['dataset'] = loaded_size / float(len(tasks))
+
+    return {'created': datetime.datetime.now().isoformat(),
+            'tasks': len(tasks),
+            'cycles': cycles,
+            'months_per_cycle': months,
+            'rendered': renderer_factory is not None,
+            'loaded': {'traced_bytes': loaded_size,
+                       'counts': loaded_counts,
+                       'by_file': allocations_by_file(loaded, baseline)},
+            'bytes_per_task': per_task,
+            'cycles_detail': steps,
+            'growth_after_load': growth}
+
+
+def format_report(report):
+    """ Formats a report from run_report() as human readable text. """
+    lines = ["%d tasks, %d cycles of %d months%s"
+             % (report['tasks'], report['cycles'],
+                report['months_per_cycle'],
+                ", rendered" if report['rendered'] else "")]
+    loaded = report['loaded']
+    lines.append("after loading: %.1f KiB traced"
+                 % (loaded['traced_bytes'] / 1024.0))
+    for name, value in sorted(report['bytes_per_task'].items()):
+        lines.append("  %-10s %8.0f bytes/task" % (name, value))
+    for filename, size, count in loaded['by_file']:
+        lines.append("  %10d bytes %7d blocks  %s" % (size, count, filename))
+    lines.append("")
+    lines.append("%-14s" % "objects" + "".join(
+        "%14s" % name for name in TRACKED_TYPES))
+    rows = [('loaded', loaded['counts'])] + \
+           [('cycle %d' % s['cycle'], s['counts'])
+            for s in report['cycles_detail']]
+    for label, counts in rows:
+        lines.append("%-14s" % label + "".join(
+            "%14d" % counts[name]['count'] for name in TRACKED_TYPES))
+    lines.append("")
+    for s in report['cycles_detail']:
+        lines.append("cycle %d: %.1f KiB traced, peak %.1f KiB"
+                     % (s['cycle'], s['traced_bytes'] / 1024.0,
+                        s['peak_bytes'] / 1024.0))
+    steps = report['cycles_detail']
+    if len(steps) > 1:
+        growth = steps[-1]['traced_bytes'] - steps[0]['traced_bytes']
+        lines.append("growth from cycle 1 to %d: %+.1f KiB"
+                     % (steps[-1]['cycle'], growth / 1024.0))
+    lines.append("")
+    lines.append("largest allocations since loading:")
+    for where, size, count in report['growth_after_load']:
+        lines.append("  %+10d bytes %+7d blocks  %s" % (size, count, where))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reports memory used by tasks, layout and drawing while "
+                    "navigating through the views.")
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--no-render', action='store_true',
+                        help="only lay out, do not draw with cairo")
+    parser.add_argument('--json', help="also write the report as JSON here")
+    args = parser.parse_args(argv)
+
+    report = run_report(args.tasks, args.cycles, args.months,
+                        not args.no_render, args.seed)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
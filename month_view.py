@@ -1,14 +1,16 @@
 from gi.repository import Gtk, Gdk, GObject
 import datetime
-import calendar
 
-from week import WeekSpan
-from drawtask import DrawTask, TASK_HEIGHT
+from drawtask import TASK_HEIGHT
 from all_day_tasks import AllDayTasks
 from header import Header
-from grid import Grid
 import utils
+import layout
 from view import ViewBase
+from motion import MotionCoalescer
+from perf import counters
+import tracing
+from tracing import traced
 from day_cell import DayCell
 
 
@@ -30,6 +32,7 @@ class MonthView(ViewBase, Gtk.VBox):
         self.min_week_height = 80
         self.font_size = 7
         self.fixed = None
+        self.visible_rows = None
 
         # Header
         self.header = Header(self.numdays)
@@ -47,6 +50,7 @@ class MonthView(ViewBase, Gtk.VBox):
         self.all_day_tasks = AllDayTasks(self, cols=self.numdays)
         # self.pack_start(self.all_day_tasks, True, True, 0)
         self.scroll.add_with_viewport(self.all_day_tasks)
+        self.all_day_tasks.selected_tasks = self.selected_tasks
 
         # drag-and-drop support
         self.drag_offset = None
@@ -55,30 +59,11 @@ class MonthView(ViewBase, Gtk.VBox):
 
         # handle the AllDayTasks DnD events
         self.all_day_tasks.connect("button-press-event", self.dnd_start)
-        self.all_day_tasks.connect("motion-notify-event", self.motion_notify)
+        self.motion = MotionCoalescer(self.all_day_tasks, self.motion_notify)
+        self.all_day_tasks.connect("motion-notify-event",
+                                   self.motion.on_motion_event)
         self.all_day_tasks.connect("button-release-event", self.dnd_stop)
-
-    def init_weeks(self, numweeks):
-        """
-        Initializates the structure needed to manage dates, tasks and task
-        positions for each one of the @numweeks weeks of the month.
-        Structure self.weeks is a list of size @numweeks, where each position
-        manages the dates corresponding to a week, being actually a dictionary
-        with entries:
-            'grid': contains Grid object.
-            'dates': contains WeekSpan object.
-            'tasks': is an empty list, will keep track of list of DrawTask.
-
-        @param numweeks: integer, the number of weeks
-        """
-        self.weeks = []
-        for w in range(numweeks):
-            week = {}
-            week['grid'] = Grid(1, self.numdays)
-            week['dates'] = WeekSpan()
-            week['tasks'] = []
-            self.weeks.append(week)
-        self.all_day_tasks.set_num_rows(numweeks)
+        self.all_day_tasks.set_relayout_callback(self.on_size_allocate)
 
     def on_scroll(self, widget, event):
         """
@@ -97,8 +82,24 @@ class MonthView(ViewBase, Gtk.VBox):
     def unselect_task(self):
         """ Unselects the task that was selected before. """
         self.selected_task = None
+        self.selected_tasks.clear()
         self.all_day_tasks.selected_task = None
 
+    def is_shown(self):
+        """ Returns True if the view is on screen. """
+        return self.get_mapped()
+
+    def get_cell_at(self, x, y):
+        """ Returns the (row, col) of the grid cell at position (@x, @y). """
+        row, col = utils.convert_coordinates_to_grid(
+            x, y, self.get_day_width(), self.get_week_height())
+        return (min(max(row, 0), self.numweeks - 1),
+                min(max(col, 0), self.numdays - 1))
+
+    def days_between_cells(self, cell_a, cell_b):
+        """ Returns how many days are between two (row, col) cells. """
+        return self.total_days_between_cells(cell_a, cell_b)
+
     def first_day(self):
         """ Returns the first day of the view being displayed """
         return self.weeks[0]['dates'].start_date
@@ -127,21 +128,7 @@ class MonthView(ViewBase, Gtk.VBox):
         self.update_weeks(today.year, today.month)
         self.update()
 
-    def total_rows_needed_in_calendar_cell(self, row, col):
-        """
-        Gets the total number of rows needed to display the content in a
-        specific calendar cell given by @row and @col.
-
-        @param row: integer, the row index of the cell, corresponding to the
-                    week we are looking at.
-        @param col: integer, the col index of the cell.
-        @return: integer, the total number of rows needed in order to display
-                 all the content in this specific cell.
-        """
-        grid = self.weeks[row]['grid']  # grid correspondent to this week/row
-        last_row_index = grid.last_occupied_row_in_col(col)
-        return last_row_index + 1
-
+    @traced('view')
     def compute_size(self):
         """ Computes and requests the size needed to draw everything. """
         width = self.min_day_width * self.numdays
@@ -155,11 +142,7 @@ class MonthView(ViewBase, Gtk.VBox):
         @param year: integer, a valid year in the format YYYY.
         @param month: integer, a month (should be between 1 and 12)
         """
-        num_days_in_month = calendar.monthrange(year, month)[1]
-        first_day = datetime.date(year, month, 1)
-        last_day = datetime.date(year, month, num_days_in_month)
-        total_weeks = utils.date_to_row_coord(last_day, first_day) + 1
-        return total_weeks
+        return layout.number_of_weeks(year, month)
 
     def update_weeks(self, year, month):
         """
@@ -172,15 +155,11 @@ class MonthView(ViewBase, Gtk.VBox):
         """
         self.year = year
         self.month = month
-        self.numweeks = self.calculate_number_of_weeks(year, month)
-        self.init_weeks(self.numweeks)
-        first_day = datetime.date(year, month, 1)
-        for i, week in enumerate(self.weeks):
-            new_week = WeekSpan()
-            day = first_day + datetime.timedelta(days=i*7)
-            new_week.week_containing_day(day)
-            week['dates'] = new_week
+        self.weeks = layout.month_weeks(year, month, self.numdays)
+        self.numweeks = len(self.weeks)
+        self.all_day_tasks.set_num_rows(self.numweeks)
 
+    @traced('view')
     def update_header(self, format="%A"):
         """
         Updates the header label of the days to be drawn given a specific
@@ -195,7 +174,8 @@ class MonthView(ViewBase, Gtk.VBox):
         days = [d.split() for d in days]
         self.header.set_labels(days)
         self.header.queue_draw()
-        self.emit('dates-changed')
+        with tracing.span('dates-changed', 'view'):
+            self.emit('dates-changed')
 
     def update_days_label(self, format="%d"):
         """
@@ -210,30 +190,6 @@ class MonthView(ViewBase, Gtk.VBox):
             days.append(week['dates'].label(format))
         self.all_day_tasks.set_labels(days)
 
-    def set_task_drawing_position(self, dtask, week, grid, num_week=None):
-        """
-        Calculates and sets the position of a @dtask inside a specific @week
-        using @grid as guidance.
-
-        @param dtask: a DrawingTask object.
-        @param week: a WeekSpan object.
-        @param grid: a Grid object.
-        """
-        task = self.req.get_task(dtask.get_id())
-
-        start = max(task.get_start_date().date(), week.start_date)
-        end = min(task.get_due_date().date(), week.end_date)
-        duration = (end - start).days + 1
-
-        x = utils.date_to_col_coord(start, week.start_date)
-        w = duration
-        x, y, w, h = grid.add_to_grid(x, w, id=dtask.get_id())
-
-        dtask.set_position(x, y, w, h)  # position inside this grid
-        dtask.set_week_num(num_week)  # which week this task is in
-        dtask.set_overflowing_L(week.start_date)
-        dtask.set_overflowing_R(week.end_date)
-
     def get_current_year(self):
         """
         Gets the correspondent year of the days
@@ -242,28 +198,27 @@ class MonthView(ViewBase, Gtk.VBox):
         date_this_month = datetime.date(self.year, self.month, 1)
         return date_this_month.strftime("%B / %Y")
 
+    @traced('view')
     def update_tasks(self):
         """ Updates and redraws everything related to the tasks """
         self.update_drawtasks()
         self.compute_size()
-        self.all_day_tasks.queue_draw()
+        self.all_day_tasks.queue_draw_changes()
 
-    def is_in_week_range(self, task, week):
-        """
-        Returns true if the given @task have either the start or due days
-        between the start and end day of @week.
+    def get_maximum_tasks_per_week(self):
+        geometry = self.all_day_tasks.get_geometry()
+        # FIXME: remove minimum of 4
+        return geometry.visible_rows(self.get_task_height(),
+                                     self.all_day_tasks.get_label_height(),
+                                     minimum=4)
 
-        @param task: a Task object
-        @param week: a WeekSpan object
+    def on_size_allocate(self):
         """
-        return (task.get_due_date().date() >= week.start_date) and \
-               (task.get_start_date().date() <= week.end_date)
-
-    def get_maximum_tasks_per_week(self):
-        tasks_available_area = (self.get_week_height() -
-                                self.all_day_tasks.get_label_height())
-        # FIXME: remove max(4)
-        return max(int(tasks_available_area // self.get_task_height()), 4)
+        Called once resizing settled down: recomputes which tasks fit in
+        each week, if the number of visible rows changed.
+        """
+        if self.get_maximum_tasks_per_week() != self.visible_rows:
+            self.update_tasks()
 
     def on_show_more_tasks(self, day):
         appears_in_day = lambda t: \
@@ -281,20 +236,7 @@ class MonthView(ViewBase, Gtk.VBox):
         popup.destroy()
         return True
 
-    def create_label(self, row, col, count):
-        label = '+%d more' % count
-        self.overflow_links.append((label, row, col))
-
-    def tasks_to_hide(self, row, col, visible_rows, needed_rows):
-        grid = self.weeks[row]['grid']
-        to_hide = []
-        if needed_rows >= visible_rows:  # grid.num_rows:
-            for i in range(visible_rows, needed_rows):
-                cell = grid[i][col]
-                if not cell.is_free():
-                    to_hide.append(str(cell))
-        return to_hide
-
+    @traced('view')
     def update_drawtasks(self, tasks=None):
         """
         Updates the drawtasks and calculates the position of where each one of
@@ -303,47 +245,17 @@ class MonthView(ViewBase, Gtk.VBox):
         @param tasks: a Task list, containing the tasks to be drawn.
          If none is given, the tasks will be retrieved from the requester.
         """
-        def duration(task):
-            return (task.get_due_date().date() - task.get_start_date().date()).days
-
         if not tasks:
-            tasks = [self.req.get_task(t) for t in self.req.get_tasks_tree()]
-            tasks.sort(key=lambda t: duration(t), reverse=True)
-        self.tasks = [t for t in tasks if self.is_in_days_range(t)]
-
-        dtasks = []
-        for i, week in enumerate(self.weeks):
-            week['tasks'] = [DrawTask(t) for t in self.tasks if
-                             self.is_in_week_range(t, week['dates'])]
-            dtasks += week['tasks']
-
-            week['grid'].clear_rows()
-            for t in week['tasks']:
-                self.set_task_drawing_position(t, week['dates'],
-                                               week['grid'], i)
-        self.all_day_tasks.set_tasks_to_draw(dtasks)
+            tasks = sorted(self.req.iter_tasks_in_range(self.first_day(),
+                                                        self.last_day()),
+                           key=layout.task_duration, reverse=True)
 
-        # deals with when we have more tasks than available lines in a same day
-        self.overflow_links = []  # clear previous links, if any
         visible_rows = self.get_maximum_tasks_per_week()
-        for row, week in enumerate(self.weeks):
-            if week['grid'].num_rows > visible_rows:
-                for col in range(self.numdays):
-                    needed_rows = self.total_rows_needed_in_calendar_cell(
-                        row, col)
-                    # if can't fit, hide last tasks and create link to them
-                    if needed_rows > visible_rows:
-                        to_hide = self.tasks_to_hide(row, col, visible_rows,
-                                                     needed_rows)
-                        num_hidden_tasks = len(to_hide)
-
-                        # hide overflowing tasks from cell
-                        for dtask in week['tasks']:
-                            if dtask.get_id() in to_hide:
-                                dtask.set_position(-1, -1, -1, -1)
-
-                        # create label to link to hidden tasks
-                        self.create_label(row, col, num_hidden_tasks)
+        self.visible_rows = visible_rows
+        dtasks, self.overflow_links = layout.layout_month(
+            tasks, self.weeks, visible_rows, self.numdays)
+        self.tasks = dtasks
+        self.all_day_tasks.set_tasks_to_draw(dtasks)
         self.all_day_tasks.overflow_links = self.overflow_links
 
         # clears selected_task if it is not being showed
@@ -358,29 +270,10 @@ class MonthView(ViewBase, Gtk.VBox):
         Fade the days at beginnig and/or the end of the view that do not belong
         to the current month being displayed.
         """
-        cells = []
-
-        # cells to fade from days in previous month
-        row = 0
-        col = 0
-        for day in self.weeks[0]['dates'].days:
-            if day.month != self.month:
-                cells.append((row, col))
-                col += 1
-            else:
-                break
-
-        # cells to fade from days in next month
-        row = self.numweeks - 1
-        col = self.numdays - 1
-        for day in reversed(self.weeks[-1]['dates'].days):
-            if day.month != self.month:
-                cells.append((row, col))
-                col -= 1
-            else:
-                break
-        self.all_day_tasks.faded_cells = cells
+        self.all_day_tasks.faded_cells = layout.faded_cells(
+            self.weeks, self.month, self.numdays)
 
+    @traced('view')
     def highlight_today_cell(self):
         """ Highlights the cell equivalent to today."""
         if self.is_today_being_shown():
@@ -396,19 +289,23 @@ class MonthView(ViewBase, Gtk.VBox):
         self.all_day_tasks.set_today_cell(row, col)
         # self.header.set_highlight_cell(0, col)
 
+    @traced('view')
     def update(self):
         """
         Updates the header, the content to be drawn (tasks), recalculates the
         size needed and then redraws everything.
         """
+        counters.begin_update()
         self.update_drawtasks()
         self.compute_size()
         self.highlight_today_cell()
         self.fade_days_not_in_this_month()
         self.update_header()
         self.update_days_label()
-        self.all_day_tasks.queue_draw()
+        counters.end_update()
+        self.all_day_tasks.queue_draw_changes()
 
+    @traced('view')
     def next(self, months=1):
         """
         Advances the dates being displayed by a given number of @months.
@@ -419,6 +316,7 @@ class MonthView(ViewBase, Gtk.VBox):
         self.update_weeks(day_in_next_month.year, day_in_next_month.month)
         self.update()
 
+    @traced('view')
     def previous(self, months=1):
         """
         Regresses the dates being displayed by a given number of @months.
@@ -515,6 +413,9 @@ class MonthView(ViewBase, Gtk.VBox):
 
     def dnd_start(self, widget, event):
         """ User clicked the mouse button, starting drag and drop """
+        self.motion.flush()
+        if self.selection_press(widget, event):
+            return
         # find which task was clicked, if any
         self.selected_task, self.drag_action, cursor = \
             self.all_day_tasks.identify_pointed_object(event, clicked=True)
@@ -541,6 +442,8 @@ class MonthView(ViewBase, Gtk.VBox):
 
     def motion_notify(self, widget, event):
         """ User moved mouse over widget """
+        if self.selection_motion(event):
+            return
         # dragging with no task selected: new task will be created
         if not self.selected_task and self.drag_offset:
             self.is_dragging = True
@@ -568,8 +471,7 @@ class MonthView(ViewBase, Gtk.VBox):
                 total_days -= (self.numdays - start_col)
                 start_col = 0
 
-            self.all_day_tasks.cells = cells
-            self.all_day_tasks.queue_draw()
+            self.all_day_tasks.set_cells(cells)
             return
 
         if self.selected_task and self.drag_offset:  # a task was clicked
@@ -599,12 +501,12 @@ class MonthView(ViewBase, Gtk.VBox):
             if self.drag_action == "expand_left":
                 new_start_day = self.weeks[row]['dates'].days[col]
                 if new_start_day <= end_date:
-                    task.set_start_date(new_start_day)
+                    self.set_dragged_dates(task.get_id(), start=new_start_day)
 
             elif self.drag_action == "expand_right":
                 new_due_day = self.weeks[row]['dates'].days[col]
                 if new_due_day >= start_date:
-                    task.set_due_date(new_due_day)
+                    self.set_dragged_dates(task.get_id(), due=new_due_day)
 
             else:
                 offset_x = self.drag_offset[0]
@@ -617,8 +519,8 @@ class MonthView(ViewBase, Gtk.VBox):
                 if diff != 0:  # new_start_day != start_date:
                     new_start_day = start_date + datetime.timedelta(days=diff)
                     new_due_day = new_start_day + datetime.timedelta(days=duration)
-                    task.set_start_date(new_start_day)
-                    task.set_due_date(new_due_day)
+                    self.set_dragged_dates(task.get_id(), new_start_day,
+                                           new_due_day)
                     self.drag_offset = self.calculate_offset(self.selected_task, event)
 
             self.update()
@@ -633,6 +535,11 @@ class MonthView(ViewBase, Gtk.VBox):
         User released a button, stopping drag and drop.
         Selected task, if any, will still have the focus.
         """
+        self.motion.flush()
+        if self.selection_release(event):
+            widget.get_window().set_cursor(
+                Gdk.Cursor.new(Gdk.CursorType.ARROW))
+            return
         # dragging with no task selected: new task will be created
         if not self.selected_task and self.is_dragging:
             day_width = self.get_day_width()
@@ -656,14 +563,15 @@ class MonthView(ViewBase, Gtk.VBox):
             due_date = start_date + datetime.timedelta(days=total_days)
 
             GObject.idle_add(self.emit, 'on_add_task', start_date, due_date)
-            self.all_day_tasks.queue_draw()
-            self.all_day_tasks.cells = []
+            self.all_day_tasks.set_cells([])
 
         # user didn't click on a task or just finished dragging task
         # in both cases, redraw to 'unselect' task
         elif not self.selected_task or self.is_dragging:
+            if self.selected_task:
+                self.commit_dragged_task(self.selected_task)
             self.unselect_task()
-            self.all_day_tasks.queue_draw()
+            self.all_day_tasks.queue_draw_changes()
 
         # clicked on link to show hidden tasks
         if self.drag_action == 'click_link':
@@ -0,0 +1,75 @@
+class MotionCoalescer(object):
+    """
+    Coalesces pointer motion events so that they are applied at most once per
+    frame. Every motion-notify-event only records the latest pointer event;
+    the @handler is called with it from a tick callback of the widget's frame
+    clock. This way the cost of dragging is bounded by the display refresh
+    rate, and not by the polling rate of the input device.
+    """
+
+    def __init__(self, widget, handler):
+        """
+        @param widget: a Gtk.Widget, whose frame clock drives the updates.
+        @param handler: function(widget, event), called with the latest event.
+        """
+        self.widget = widget
+        self.handler = handler
+        self.pending = None
+        self.tick_id = None
+        self.received = 0
+        self.applied = 0
+
+    def on_motion_event(self, widget, event):
+        """
+        Callback for motion-notify-event: only records the event, and lets
+        it propagate as it did before coalescing.
+        """
+        self.received += 1
+        # events are only valid during emission, so keep our own copy
+        self.pending = event.copy()
+        if self.tick_id is None:
+            self.tick_id = widget.add_tick_callback(self._on_tick)
+        return False
+
+    def _on_tick(self, widget, frame_clock):
+        self.tick_id = None
+        self.flush()
+        return False  # removes the tick callback until next motion
+
+    def flush(self):
+        """
+        Applies the pending motion event right away, if any. Should be called
+        before handling button presses/releases, so that events are still
+        handled in the order they were delivered.
+        """
+        event = self.pending
+        if event is None:
+            return
+        self.pending = None
+        self.applied += 1
+        self.handler(self.widget, event)
+
+    def cancel(self):
+        """ Drops the pending motion event, if any. """
+        self.pending = None
+        if self.tick_id is not None:
+            self.widget.remove_tick_callback(self.tick_id)
+            self.tick_id = None
+
+    def get_dropped(self):
+        """ Returns the number of events that were coalesced away. """
+        return self.received - self.applied - (self.pending is not None)
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the number of motion events received,
+        applied and dropped (coalesced) so far.
+        """
+        return {'received': self.received,
+                'applied': self.applied,
+                'dropped': self.get_dropped()}
+
+    def reset_stats(self):
+        """ Clears the counters of received and applied events. """
+        self.received = int(self.pending is not None)
+        self.applied = 0
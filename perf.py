@@ -0,0 +1,109 @@
+import collections
+import datetime
+import json
+import os
+import time
+
+# number of recent frames kept to compute frame time percentiles
+FRAME_HISTORY = 120
+
+
+class PerfCounters(object):
+    """
+    Cheap counters updated from the hot paths (layout, grid, drawing), read
+    by the performance HUD. Counters are plain integer attributes so that
+    updating them costs no more than an addition.
+    """
+
+    def __init__(self, history=FRAME_HISTORY):
+        self.drawtasks_built = 0
+        self.grid_rows_scanned = 0
+        self.grid_cells_scanned = 0
+        self.frame_times = collections.deque(maxlen=history)
+        self.last_update = {}
+        self._update_start = None
+        self._update_counts = None
+
+    def _snapshot(self):
+        return (self.drawtasks_built, self.grid_rows_scanned,
+                self.grid_cells_scanned)
+
+    def begin_update(self):
+        """ Marks the start of a view update(). """
+        self._update_start = time.perf_counter()
+        self._update_counts = self._snapshot()
+
+    def end_update(self):
+        """
+        Marks the end of a view update(), keeping how long it took and how
+        much work was done meanwhile in self.last_update.
+        """
+        if self._update_start is None:
+            return
+        before = self._update_counts
+        after = self._snapshot()
+        self.last_update = {
+            'time': time.perf_counter() - self._update_start,
+            'drawtasks_built': after[0] - before[0],
+            'grid_rows_scanned': after[1] - before[1],
+            'grid_cells_scanned': after[2] - before[2],
+        }
+        self._update_start = None
+
+    def add_frame(self, seconds):
+        """ Records how long drawing a frame took. """
+        self.frame_times.append(seconds)
+
+    def get_last_frame(self):
+        if not self.frame_times:
+            return 0.0
+        return self.frame_times[-1]
+
+    def get_frame_percentile(self, pct):
+        """ Returns the @pct percentile (0-100) of the recent frame times. """
+        if not self.frame_times:
+            return 0.0
+        values = sorted(self.frame_times)
+        index = min(int(round(pct / 100.0 * (len(values) - 1))),
+                    len(values) - 1)
+        return values[index]
+
+    def reset(self):
+        self.__init__(self.frame_times.maxlen)
+
+
+class StartupTimes(object):
+    """
+    Records when the milestones of the application start up happen, relative
+    to when the process started, and appends them to a log so that start up
+    regressions can be noticed.
+    """
+
+    def __init__(self, start=None):
+        """
+        @param start: float, time.perf_counter() value at process start.
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.marks = collections.OrderedDict()
+
+    def mark(self, name):
+        """ Records that milestone @name was reached now, if not already. """
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+        return self.marks[name]
+
+    def get(self, name):
+        return self.marks.get(name)
+
+    def save(self, path):
+        """ Appends the milestones as one JSON line to the file at @path. """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        record = dict(self.marks)
+        record['created'] = datetime.datetime.now().isoformat()
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+counters = PerfCounters()
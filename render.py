@@ -0,0 +1,454 @@
+import cairo
+
+import utils
+from background import Background
+from geometry import Geometry
+from grid import Rect
+
+OVERLAY_FONT_SIZE = 11
+OVERLAY_LINE_HEIGHT = 14
+OVERLAY_MARGIN = 6
+
+
+class AllDayTasksRenderer(object):
+    """
+    Draws a grid of days (one or more weeks) with their tasks on any Cairo
+    context. It holds no reference to GTK, so the same drawing code is used
+    both by the AllDayTasks widget and for offscreen export.
+    """
+
+    def __init__(self, rows=1, cols=7):
+        self.num_rows = rows
+        self.num_columns = cols
+        self.background = Background(rows, cols)
+
+        self.padding = 1.5
+        self.font = "Courier"
+        self.font_size = 12
+        self.font_color = (0.35, 0.31, 0.24)
+        self.link_color = (0, 0, 255, 0.5)  # default blue link color
+        self.today_cell = (None, None)
+        self.selected_task = None
+        # ids of the other tasks selected along with selected_task
+        self.selected_tasks = set()
+        # (dx, dy) the selected tasks are drawn shifted by, while dragged
+        self.drag_preview = None
+        # (action, dx) while the selected tasks are resized: their outline
+        # is drawn with the edge given by action ("expand_left" or
+        # "expand_right") moved by dx
+        self.resize_preview = None
+        # (x, y, w, h) of the rubber band being dragged to select tasks
+        self.rubber_band = None
+        self.faded_cells = []
+        self.cells = []
+        self.labels = None
+        self.label_height = self.font_size
+        self.overflow_links = []
+        self.drawtasks = []
+        self.geometry = None
+
+    def get_label_height(self):
+        if self.labels:
+          return self.label_height
+        return 0
+
+    def set_labels(self, labels):
+        self.labels = labels
+
+    def set_num_rows(self, rows):
+        self.num_rows = rows
+        self.background.set_num_rows(rows)
+
+    def set_font(self, font):
+        self.font = font
+
+    def set_font_size(self, size):
+        self.font_size = size
+
+    def set_font_color(self, color):
+        self.font_color = color
+
+    def set_line_color(self, color):
+        self.background.set_line_color(color)
+
+    def set_background_color(self, color):
+        self.background.set_background_color(color)
+
+    def set_size(self, width, height):
+        """ Sets the size, in pixels, of the area being drawn. """
+        self.geometry = Geometry(width, height,
+                                 self.num_rows, self.num_columns)
+
+    def get_geometry(self):
+        """ Returns the Geometry of the area, as given to set_size(). """
+        geometry = self.geometry
+        if geometry.num_rows != self.num_rows or \
+           geometry.num_cols != self.num_columns:
+            self.set_size(geometry.width, geometry.height)
+        return self.geometry
+
+    def get_day_width(self):
+        return self.get_geometry().day_width
+
+    def get_week_height(self):
+        return self.get_geometry().week_height
+
+    def set_tasks_to_draw(self, drawtasks):
+        self.drawtasks = drawtasks
+
+    def get_cell_bounds(self, row, col):
+        """ Returns the rectangle (x, y, w, h) of the cell at @row, @col. """
+        return self.get_geometry().cell_bounds(row, col)
+
+    def get_link_bounds(self, link):
+        """ Returns the rectangle (x, y, w, h) around an overflow @link. """
+        (text, row, col) = link
+        # FIXME: more generic values for h and w (Courier advance is 0.6em)
+        h = self.font_size
+        w = 0.6 * self.font_size * len(text)
+        base_x = (col+1) * self.get_day_width() - w - 3*self.padding
+        base_y = row * self.get_week_height() + self.label_height
+        return base_x, base_y - h, w, h + 2
+
+    def get_task_bounds(self, dtask):
+        """ Returns the rectangle (x, y, w, h) where @dtask is drawn. """
+        return dtask.get_bounds(self.get_day_width(), self.padding,
+                                self.get_week_height())
+
+    def is_selected(self, tid):
+        return tid == self.selected_task or tid in self.selected_tasks
+
+    def get_preview_bounds(self, dtask):
+        """
+        Returns the rectangle where @dtask is drawn, taking into account the
+        drag preview if it is one of the selected tasks.
+        """
+        x, y, w, h = self.get_task_bounds(dtask)
+        if not self.is_selected(dtask.get_id()):
+            return x, y, w, h
+        if self.drag_preview is not None:
+            x += self.drag_preview[0]
+            y += self.drag_preview[1]
+        elif self.resize_preview is not None:
+            action, dx = self.resize_preview
+            # a task spans at least one day
+            min_w = self.get_day_width() - 2 * self.padding
+            if action == "expand_left":
+                right = x + w
+                x = min(x + dx, right - min_w)
+                w = right - x
+            else:
+                w = max(w + dx, min_w)
+        return x, y, w, h
+
+    def find_tasks_in_rect(self, rect):
+        """ Returns the ids of the tasks drawn across @rect, (x, y, w, h). """
+        x, y, w, h = rect
+        extents = (x, y, x + w, y + h)
+        return set(dtask.get_id() for dtask in self.drawtasks
+                   if dtask.is_visible() and utils.rect_intersects_extents(
+                       self.get_task_bounds(dtask), extents))
+
+    def highlight_cells(self, ctx, cells, color, alpha=0.5):
+        geometry = self.get_geometry()
+        area = Rect(0, 0, geometry.width, geometry.height)
+        clip = ctx.clip_extents()
+        for cell in cells:
+            row, col = cell
+            if 0 <= row < self.num_rows and 0 <= col < self.num_columns:
+                if not utils.rect_intersects_extents(
+                        self.get_cell_bounds(row, col), clip):
+                    continue
+                ctx.save()
+                self.background.highlight_cell(ctx, row, col, area,
+                                               color, alpha)
+                ctx.restore()
+
+    def set_today_cell(self, row, col):
+        if 0 <= row < self.num_rows and 0 <= col < self.num_columns:
+            self.today_cell = (row, col)
+        else:
+            self.today_cell = (None, None)
+
+    def get_overlay_bounds(self, lines):
+        """
+        Returns the rectangle (x, y, w, h) taken by an overlay showing
+        @lines of text, in the top right corner of the area.
+        """
+        geometry = self.get_geometry()
+        w = 0.6 * OVERLAY_FONT_SIZE * max([len(l) for l in lines] or [0]) \
+            + 2 * OVERLAY_MARGIN
+        h = OVERLAY_LINE_HEIGHT * len(lines) + 2 * OVERLAY_MARGIN
+        return geometry.width - w - OVERLAY_MARGIN, OVERLAY_MARGIN, w, h
+
+    def render_overlay(self, ctx, lines):
+        """
+        Draws @lines of text over a translucent box, on top of everything
+        else. Used to show live performance counters.
+        """
+        x, y, w, h = self.get_overlay_bounds(lines)
+        ctx.save()
+        ctx.rectangle(x, y, w, h)
+        ctx.set_source_rgba(0, 0, 0, 0.7)
+        ctx.fill()
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.select_font_face(self.font, cairo.FONT_SLANT_NORMAL,
+                             cairo.FONT_WEIGHT_NORMAL)
+        ctx.set_font_size(OVERLAY_FONT_SIZE)
+        for i, line in enumerate(lines):
+            ctx.move_to(x + OVERLAY_MARGIN,
+                        y + OVERLAY_MARGIN + (i + 1) * OVERLAY_LINE_HEIGHT - 3)
+            ctx.show_text(line)
+        ctx.restore()
+
+    def find_pointed_object(self, x, y):
+        """
+        Finds the object at position (@x, @y): a task or an overflow link, and
+        which drag action should be done on it.
+
+        @return task_id, drag_action: the id of the task pointed at, if any,
+                and either "expand_left", "expand_right", "move",
+                "click_link" or None.
+        """
+        expand_border = 10
+        drag_action = None
+
+        for link in self.overflow_links:
+            (lx, ly, lw, lh) = self.get_link_bounds(link)
+            if lx <= x <= lx + lw and ly <= y <= ly + lh:
+                drag_action = "click_link"
+
+        for task in self.drawtasks:
+            (tx, ty, tw, th) = self.get_task_bounds(task)
+            if not ty < y < (ty + th):
+                continue
+            if tx <= x <= tx + expand_border:
+                drag_action = "expand_left"
+            elif (tx + tw) - expand_border <= x <= (tx + tw):
+                drag_action = "expand_right"
+            elif tx <= x <= (tx + tw):
+                drag_action = "move"
+            else:
+                continue
+            return task.get_id(), drag_action
+        return None, drag_action
+
+    def render(self, ctx, area):
+        """
+        Draws background, day labels, overflow links, tasks and highlighted
+        cells. Only what lies inside the clip region of @ctx is drawn.
+
+        @param ctx: a Cairo context
+        @param area: the rectangle being drawn, with x, y, width and height
+        """
+        ctx.set_line_width(0.8)
+        ctx.set_font_size(self.font_size)
+        ctx.select_font_face(self.font, cairo.FONT_SLANT_NORMAL,
+                             cairo.FONT_WEIGHT_NORMAL)
+
+        # first draw background
+        ctx.save()
+        self.set_line_color(color=(0.35, 0.31, 0.24, 0.15))
+        row, col = self.today_cell
+        if row is not None and col is not None and row >= 0 and col >= 0:
+            self.background.highlight_cell(ctx, row, col, area)
+        self.background.draw(ctx, area, vgrid=True, hgrid=True)
+        ctx.restore()
+
+        # only repaint what lies inside the damaged region
+        clip = ctx.clip_extents()
+        geometry = self.get_geometry()
+        day_width = geometry.day_width
+        week_height = geometry.week_height
+
+        # then draw labels, if any (used only on month_view)
+        if self.labels:
+            ctx.save()
+            color = self.font_color
+            ctx.set_source_rgb(color[0], color[1], color[2])
+            for j, week in enumerate(self.labels):
+                for i, day in enumerate(week):
+                    if not utils.rect_intersects_extents(
+                            geometry.cell_bounds(j, i), clip):
+                        continue
+                    base_x = geometry.col_x[i] + self.padding
+                    base_y = geometry.row_y[j] + self.label_height
+                    ctx.move_to(base_x, base_y)
+                    ctx.text_path(day)
+                    ctx.stroke()
+            ctx.restore()
+
+        # fade days not in current month
+        if self.faded_cells:
+            self.highlight_cells(ctx, self.faded_cells, color=(0.8, 0.8, 0.8))
+
+        # then draw links when there is overflowing tasks (only in month_view)
+        if self.overflow_links:
+            ctx.save()
+            color = self.link_color
+            ctx.set_source_rgba(color[0], color[1], color[2], color[3])
+            for link in self.overflow_links:
+                if not utils.rect_intersects_extents(
+                        self.get_link_bounds(link), clip):
+                    continue
+                (text, row, col) = link
+                w = ctx.text_extents(text)[2]
+                base_x = (col+1) * day_width - w - 3*self.padding
+                base_y = row * week_height + self.label_height
+                ctx.move_to(base_x, base_y)
+                ctx.text_path(text)
+                # underline
+                y = base_y + 2
+                ctx.move_to(base_x, y)
+                ctx.line_to(base_x + w, y)
+                ctx.stroke()
+            ctx.restore()
+
+        # then draw all tasks, the ones being dragged on top
+        dragged = []
+        resized = []
+        for dtask in self.drawtasks:
+            if not dtask.is_visible():
+                continue
+            selected = self.is_selected(dtask.get_id())
+            if selected and self.drag_preview is not None:
+                dragged.append(dtask)
+                continue
+            if selected and self.resize_preview is not None:
+                resized.append(dtask)
+            if not utils.rect_intersects_extents(
+                    self.get_task_bounds(dtask), clip):
+                continue
+            ctx.save()
+            dtask.draw(ctx, day_width, self.padding, selected, week_height)
+            ctx.restore()
+        for dtask in dragged:
+            if not utils.rect_intersects_extents(
+                    self.get_preview_bounds(dtask), clip):
+                continue
+            ctx.save()
+            ctx.translate(*self.drag_preview)
+            dtask.draw(ctx, day_width, self.padding, True, week_height)
+            ctx.restore()
+        # and the outline the tasks being resized will have
+        for dtask in resized:
+            bounds = self.get_preview_bounds(dtask)
+            if not utils.rect_intersects_extents(bounds, clip):
+                continue
+            ctx.save()
+            ctx.rectangle(*bounds)
+            ctx.set_source_rgba(0.8, 0.8, 0, 0.8)
+            ctx.set_line_width(2)
+            ctx.stroke()
+            ctx.restore()
+
+        # if dragging cells to create new task, highlight them now
+        if self.cells:
+            self.highlight_cells(ctx, self.cells, color=(0.8, 0.8, 0),
+                alpha=0.1)
+
+        # and the rubber band, if selecting tasks with it
+        if self.rubber_band is not None:
+            ctx.save()
+            ctx.rectangle(*self.rubber_band)
+            ctx.set_source_rgba(0.8, 0.8, 0, 0.15)
+            ctx.fill_preserve()
+            ctx.set_source_rgba(0.8, 0.8, 0, 0.8)
+            ctx.stroke()
+            ctx.restore()
+
+
+class HeaderRenderer(object):
+    """
+    Draws the header of a calendar view: one column per day, each with a
+    label that may span multiple lines. Like AllDayTasksRenderer, it draws on
+    any Cairo context and does not depend on GTK.
+    """
+
+    def __init__(self, cols=7):
+        self.labels = []
+        self.background = Background(1, cols)
+        self.sidebar = 0
+        self.font = "Courier"
+        self.font_size = 12
+        self.font_color = (0.35, 0.31, 0.24)
+        self.highlight_cell = (None, None)
+
+    def set_sidebar_size(self, size):
+        self.sidebar = size
+
+    def set_labels(self, labels):
+        self.labels = labels
+
+    def set_font(self, font):
+        self.font = font
+
+    def set_font_size(self, size):
+        self.font_size = size
+
+    def set_font_color(self, color):
+        self.font_color = color
+
+    def set_line_color(self, color):
+        self.background.set_line_color(color)
+
+    def set_background_color(self, color):
+        self.background.set_background_color(color)
+
+    def get_line_height(self, area):
+        try:
+            line_height = area.height / len(self.labels[0])
+        except ZeroDivisionError:
+            print("List of labels in object Header not initialized!")
+            raise
+        else:
+            return line_height
+
+    def get_column_width(self, area):
+        try:
+            col_width = area.width / float(len(self.labels))
+        except ZeroDivisionError:
+            print("List of labels in object Header not initialized!")
+            raise
+        else:
+            return col_width
+
+    def set_highlight_cell(self, row, col):
+        if row == 0 and 0 <= col < len(self.labels):
+            self.highlight_cell = (row, col)
+        else:
+            self.highlight_cell = (None, None)
+
+    def render(self, ctx, area):
+        """
+        Draws the header according to the labels.
+
+        @param ctx: a Cairo context
+        @param area: the rectangle being drawn, sidebar already excluded
+        """
+        ctx.set_line_width(0.8)
+        row, col = self.highlight_cell
+        if row is not None and col is not None:
+            self.background.highlight_cell(ctx, row, col, area)
+
+        self.background.draw(ctx, area, vgrid=False, hgrid=True)
+
+        color = self.font_color
+        ctx.set_source_rgb(color[0], color[1], color[2])
+
+        ctx.set_font_size(self.font_size)
+        ctx.select_font_face(self.font, cairo.FONT_SLANT_NORMAL,
+                             cairo.FONT_WEIGHT_NORMAL)
+
+        # print labels: use multiple lines if necessary
+        col_width = self.get_column_width(area)
+        line_height = self.get_line_height(area)
+        for i in range(0, len(self.labels)):
+            for j in range(0, len(self.labels[i])):
+                label, base_x, base_y = utils.center_text_on_rect(
+                    ctx, self.labels[i][j],
+                    area.x + (i * col_width), area.y + (j * line_height),
+                    col_width, line_height)
+                ctx.move_to(base_x, base_y)
+                ctx.text_path(label)
+                ctx.stroke()
@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+
+import cairo
+from gi.repository import Gdk
+
+import synthetic
+from datastore import DataStore
+from geometry import Geometry
+from grid import Rect
+from month_view import MonthView
+from week_view import WeekView
+
+# names used in recordings for the Gdk event types we care about
+EVENT_TYPES = {
+    'press': Gdk.EventType.BUTTON_PRESS,
+    '2press': Gdk.EventType._2BUTTON_PRESS,
+    'release': Gdk.EventType.BUTTON_RELEASE,
+    'motion': Gdk.EventType.MOTION_NOTIFY,
+    'scroll': Gdk.EventType.SCROLL,
+}
+EVENT_NAMES = dict((v, k) for k, v in EVENT_TYPES.items())
+
+FRAME_INTERVAL = 1 / 60.0
+
+
+class Recorder(object):
+    """
+    Records the pointer and scroll events delivered to a view, so that they
+    can be replayed later. It listens to the generic 'event' signal, which
+    is emitted before the specific ones, so it sees every event even when a
+    handler stops its emission. Events are listened to on the scrolled
+    window too, which also gets the ones propagated from the tasks area:
+    those are only recorded from the tasks area.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.events = []
+        self.start = None
+        self.handlers = []
+
+    def start_recording(self):
+        self.events = []
+        self.start = time.perf_counter()
+        for target, widget in (('all_day_tasks', self.view.all_day_tasks),
+                               ('scroll', self.view.scroll)):
+            handler = widget.connect('event', self.on_event, target)
+            self.handlers.append((widget, handler))
+
+    def stop_recording(self):
+        for widget, handler in self.handlers:
+            widget.disconnect(handler)
+        self.handlers = []
+        return self.events
+
+    def on_event(self, widget, event, target):
+        name = EVENT_NAMES.get(event.type)
+        if name is None:
+            return False
+        if target == 'scroll' and \
+                event.window == self.view.all_day_tasks.get_window():
+            return False  # propagated from the tasks area, already recorded
+        record = {'t': time.perf_counter() - self.start,
+                  'target': target,
+                  'type': name,
+                  'x': event.x,
+                  'y': event.y,
+                  # modifiers, e.g. Ctrl to extend the selection
+                  'state': int(event.get_state()[1])}
+        if name == 'scroll':
+            record['dx'], record['dy'] = event.get_scroll_deltas()[1:]
+        self.events.append(record)
+        return False
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.events, f, indent=1)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class SyntheticEvent(object):
+    """ Stands for a Gdk.Event, with the attributes the views use. """
+
+    def __init__(self, record):
+        self.type = EVENT_TYPES[record['type']]
+        self.x = record.get('x', 0)
+        self.y = record.get('y', 0)
+        self.state = record.get('state', 0)
+        self.dx = record.get('dx', 0)
+        self.dy = record.get('dy', 0)
+
+    def get_scroll_deltas(self):
+        return (True, self.dx, self.dy)
+
+    def copy(self):
+        return self
+
+
+class _StubWindow(object):
+    def set_cursor(self, cursor):
+        pass
+
+
+class StubWidget(object):
+    """ Stands for the widget given to event handlers. """
+
+    def get_window(self):
+        return _StubWindow()
+
+
+class Replayer(object):
+    """
+    Feeds recorded events back to a view, without going through the GTK
+    main loop, and measures how long handling each one of them takes. Like
+    the application does, motion events closer than a frame interval are
+    coalesced into the last one.
+    """
+
+    def __init__(self, view, width=1024, height=768,
+                 frame_interval=FRAME_INTERVAL, redraw=True):
+        self.view = view
+        self.width = width
+        self.height = height
+        self.frame_interval = frame_interval
+        self.redraw = redraw
+        self.widget = StubWidget()
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        self.latencies = {}
+        self.relayout_time = 0.0
+        self.redraw_time = 0.0
+        self.total_time = 0.0
+        self.coalesced = 0
+        self._allocate()
+        self._instrument()
+
+    def _allocate(self):
+        """ Gives the view the size it would have on screen. """
+        alloc = Gdk.Rectangle()
+        alloc.x, alloc.y = 0, 0
+        alloc.width, alloc.height = self.width, self.height
+        self.view.get_preferred_size()
+        self.view.size_allocate(alloc)
+
+    def _instrument(self):
+        """ Wraps update_drawtasks so relayout time can be accounted. """
+        view = self.view
+        update_drawtasks = view.update_drawtasks
+
+        def timed_update_drawtasks(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return update_drawtasks(*args, **kwargs)
+            finally:
+                self.relayout_time += time.perf_counter() - start
+        view.update_drawtasks = timed_update_drawtasks
+
+    def _sync_geometry(self):
+        area = self.view.all_day_tasks
+        geometry = area.geometry
+        if geometry is None or not geometry.matches(
+                self.width, self.height, area.num_rows, area.num_columns):
+            area.geometry = Geometry(self.width, self.height,
+                                     area.num_rows, area.num_columns)
+
+    def _redraw(self):
+        self._sync_geometry()
+        start = time.perf_counter()
+        ctx = cairo.Context(self.surface)
+        self.view.all_day_tasks.render(ctx, Rect(0, 0, self.width,
+                                                 self.height))
+        self.surface.flush()
+        self.redraw_time += time.perf_counter() - start
+
+    def dispatch(self, record):
+        """ Delivers a single recorded event to the right handler. """
+        view = self.view
+        event = SyntheticEvent(record)
+        self._sync_geometry()
+        name = record['type']
+        start = time.perf_counter()
+        if name in ('press', '2press'):
+            view.dnd_start(self.widget, event)
+        elif name == 'release':
+            view.dnd_stop(self.widget, event)
+        elif name == 'motion':
+            view.motion_notify(self.widget, event)
+        elif name == 'scroll':
+            view.on_scroll(self.widget, event)
+        elapsed = time.perf_counter() - start
+        self.latencies.setdefault(name, []).append(elapsed)
+        if self.redraw:
+            self._redraw()
+
+    def replay(self, records):
+        """
+        Replays @records, coalescing motion events that happened within the
+        same frame.
+
+        @return stats: dictionary, see get_stats().
+        """
+        start = time.perf_counter()
+        pending = None
+        frame_end = None
+        for record in records:
+            if record['type'] == 'motion':
+                if pending is not None and record['t'] < frame_end:
+                    self.coalesced += 1
+                else:
+                    if pending is not None:
+                        self.dispatch(pending)
+                    frame_end = record['t'] + self.frame_interval
+                pending = record
+                continue
+            if pending is not None:
+                self.dispatch(pending)
+                pending = None
+            self.dispatch(record)
+        if pending is not None:
+            self.dispatch(pending)
+        self.total_time = time.perf_counter() - start
+        return self.get_stats()
+
+    def get_stats(self):
+        stats = {'total_time': self.total_time,
+                 'relayout_time': self.relayout_time,
+                 'redraw_time': self.redraw_time,
+                 'coalesced_motion_events': self.coalesced,
+                 'events': {}}
+        for name, values in self.latencies.items():
+            values = sorted(values)
+            stats['events'][name] = {
+                'count': len(values),
+                'median': statistics.median(values),
+                'p95': values[int(0.95 * (len(values) - 1))],
+                'max': values[-1]}
+        return stats
+
+
+def scenario_drag_task(view, width=1024, height=768, steps=120,
+                       duration=2.0):
+    """
+    Generates the events of dragging the first visible task of @view
+    diagonally across the whole area, over @duration seconds.
+    """
+    area = view.all_day_tasks
+    area.geometry = Geometry(width, height, area.num_rows, area.num_columns)
+    dtask = next(d for d in area.drawtasks if d.is_visible())
+    x, y, w, h = area.get_task_bounds(dtask)
+    x, y = x + w / 2.0, y + h / 2.0
+    events = [{'t': 0.0, 'type': 'press', 'x': x, 'y': y}]
+    for i in range(1, steps + 1):
+        events.append({'t': duration * i / steps, 'type': 'motion',
+                       'x': x + (width - x) * i / float(steps + 1),
+                       'y': y + (height - y) * i / float(steps + 1)})
+    last = events[-1]
+    events.append({'t': duration + 0.01, 'type': 'release',
+                   'x': last['x'], 'y': last['y']})
+    return events
+
+
+def scenario_scroll(count, interval=0.05):
+    """
+    Generates @count scroll events going forward in time, e.g. 12 for a
+    year in the month view, or 365 for a year in the week view.
+    """
+    return [{'t': i * interval, 'type': 'scroll', 'dx': 1, 'dy': 0}
+            for i in range(count)]
+
+
+def build_view(view_type, num_tasks, seed=7):
+    """ Creates a view of type @view_type over @num_tasks synthetic tasks. """
+    first_day = datetime.date.today().replace(day=1)
+    ds = synthetic.populate(DataStore(), num_tasks, seed=seed,
+                            start=first_day, days=28)
+    if view_type == 'month':
+        view = MonthView(None, ds.get_requester())
+    else:
+        view = WeekView(None, ds.get_requester(),
+                        numdays=7 if view_type == 'week' else 14)
+    view.show_today()
+    return view
+
+
+SCENARIOS = ('drag-month', 'scroll-year-month', 'scroll-year-week')
+
+
+def run_scenario(name, num_tasks=5000, width=1024, height=768):
+    """ Runs one of the scripted SCENARIOS and returns its stats. """
+    if name == 'drag-month':
+        view = build_view('month', num_tasks)
+        events = scenario_drag_task(view, width, height)
+    elif name == 'scroll-year-month':
+        view = build_view('month', num_tasks)
+        events = scenario_scroll(12)
+    elif name == 'scroll-year-week':
+        view = build_view('week', num_tasks)
+        events = scenario_scroll(365)
+    else:
+        raise ValueError("Unknown scenario: '%s'" % name)
+    return Replayer(view, width, height).replay(events)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replays recorded or scripted input on a view and "
+                    "measures handler latency.")
+    parser.add_argument('scenario', nargs='?', default='drag-month',
+                        help="one of %s, or a recording (.json)"
+                             % ', '.join(SCENARIOS))
+    parser.add_argument('--view', default='month',
+                        choices=('week', '2weeks', 'month'),
+                        help="view used to replay a recording")
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--size', default='1024x768')
+    parser.add_argument('--output', '-o', help="write JSON results here")
+    args = parser.parse_args(argv)
+    width, height = [int(v) for v in args.size.split('x')]
+
+    if args.scenario.endswith('.json'):
+        view = build_view(args.view, args.tasks)
+        stats = Replayer(view, width, height).replay(load(args.scenario))
+    else:
+        stats = run_scenario(args.scenario, args.tasks, width, height)
+
+    output = json.dumps(stats, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,10 @@
-from gi.repository import GObject
+import collections
+import contextlib
 
+from dataset import apply_fields
 
-class Requester(GObject.GObject):
+
+class Requester(object):
     """
     A view on a GTG datastore.
     L{Requester} is a stateless object that simply provides a nice
@@ -10,13 +13,104 @@ class Requester(GObject.GObject):
 
     def __init__(self, datastore):
         """Construct a L{Requester}."""
-        GObject.GObject.__init__(self)
         self.ds = datastore
         self.__basetree = self.ds.get_tasks_tree()
+        self.observers = []
+        self.batch_observers = []
+        self._batch_depth = 0
+        # id -> [op, task, fields], the changes made in the current batch
+        self._batch_changes = None
+
+    def add_observer(self, observer):
+        """
+        Registers a function called after every change made through this
+        requester, as observer(op, task, fields): @op is either 'create',
+        'update' or 'delete', and @fields the names of the fields that were
+        updated (None for 'create' and 'delete').
+        """
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def add_batch_observer(self, observer):
+        """
+        Registers a function called once at the end of every batch (see
+        batch()), as observer(changes): @changes is the list of the
+        (op, task, fields) changes made in the batch, one per task.
+        """
+        self.batch_observers.append(observer)
+
+    def remove_batch_observer(self, observer):
+        self.batch_observers.remove(observer)
+
+    def in_batch(self):
+        """ Returns True while changes are being batched, see batch(). """
+        return self._batch_depth > 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Groups the changes made in a with block. Observers are not called
+        for each change as it happens, but at the end of the block, once
+        per changed task (a task created then updated is reported as
+        created, one created then deleted not at all, and the fields of
+        several updates are merged). Batch observers are then called once
+        with all the changes, so views need to be updated only once.
+        Batches can be nested: changes are reported at the end of the
+        outermost one.
+        """
+        self._batch_depth += 1
+        if self._batch_depth == 1:
+            self._batch_changes = collections.OrderedDict()
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                changes = [tuple(c) for c in self._batch_changes.values()
+                           if c[0] is not None]
+                self._batch_changes = None
+                for op, task, fields in changes:
+                    for observer in self.observers:
+                        observer(op, task, fields)
+                for observer in self.batch_observers:
+                    observer(changes)
+
+    def _record(self, op, task, fields):
+        """ Merges a change into the changes of the current batch. """
+        change = self._batch_changes.get(task.get_id())
+        if change is None:
+            self._batch_changes[task.get_id()] = [op, task, fields]
+        elif op == 'delete':
+            # nothing to report for a task that did not exist before
+            change[:] = [None if change[0] == 'create' else op, task, None]
+        elif op == 'create' or change[0] != 'update':
+            change[:] = ['create', task, None]
+        else:
+            change[1:] = [task, sorted(set(change[2]) | set(fields))]
+
+    def _notify(self, op, task, fields=None):
+        if self._batch_depth:
+            self._record(op, task, fields)
+            return
+        for observer in self.observers:
+            observer(op, task, fields)
 
     def get_tasks_tree(self):
         return self.ds.get_all_tasks()
 
+    def count(self):
+        return self.ds.count()
+
+    def iter_tasks(self):
+        """ Iterates over all the Task objects, see DataStore.iter_tasks. """
+        return self.ds.iter_tasks()
+
+    def iter_tasks_in_range(self, first_day, last_day):
+        """ Iterates over the tasks shown between the two given days. """
+        return self.ds.iter_tasks_in_range(first_day, last_day)
+
     def get_basetree(self):
         return self.__basetree
 
@@ -27,18 +121,56 @@ class Requester(GObject.GObject):
         task = self.ds.get_task(tid)
         return task
 
+    def get_task_for_write(self, tid):
+        """
+        Returns the task @tid, to be changed in place (e.g. while dragging
+        it) without affecting the snapshots being read, see snapshot(). It
+        must be called, and the task changed, within writing().
+        """
+        return self.ds.get_task_for_write(tid)
+
+    def snapshot(self):
+        """
+        Returns an immutable view of the tasks as they are now, see
+        DataStore.snapshot().
+        """
+        return self.ds.snapshot()
+
+    def writing(self):
+        """
+        Returns a context manager holding the write lock of the datastore,
+        see DataStore.writing().
+        """
+        return self.ds.writing()
+
     def new_task(self):
         """Create a new task.
         Note: this modifies the datastore.
         """
-        task = self.ds.new_task()
+        with self.ds.writing():
+            task = self.ds.new_task()
+        self._notify('create', task)
         return task
 
+    def update_task(self, tid, **fields):
+        """Update fields of the task 'tid', given as keyword arguments named
+        after dataset.FIELD_SETTERS (title, start, due, status, color).
+        Note: this modifies the datastore."""
+        with self.ds.writing():
+            task = self.ds.get_task_for_write(tid)
+            if task is None:
+                return False
+            apply_fields(task, fields)
+        self._notify('update', task, sorted(fields))
+        return True
+
     def delete_task(self, tid):
         """Delete the task 'tid'.
         Note: this modifies the datastore."""
-        if self.has_task(tid):
-            del self.__basetree[tid]
+        with self.ds.writing():
+            task = self.ds.remove_task(tid)
+        if task is not None:
+            self._notify('delete', task)
             return True
         else:
             return False
@@ -0,0 +1,323 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import html
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import layout
+import synthetic
+from dates import Date
+from datastore import DataStore
+from grid import Grid
+from render import AllDayTasksRenderer
+from week import WeekSpan
+
+# maximum empirical complexity exponent accepted for each operation
+DEFAULT_BUDGETS = {
+    'layout_week': 1.2,
+    'layout_two_weeks': 1.2,
+    'layout_month': 1.2,
+    'hit_test': 1.2,
+    'navigate_month': 1.2,
+    'bulk_import': 1.2,
+    'date_parse': 1.1,
+    'grid_fill_and_clear': 1.2,
+}
+
+
+def fit_exponent(sizes, times):
+    """
+    Fits times = c * size^k by least squares on a log-log scale.
+
+    @return k, c: the empirical exponent and constant factor.
+    """
+    points = [(math.log(n), math.log(t)) for n, t in zip(sizes, times)
+              if n > 0 and t > 0]
+    if len(points) < 2:
+        return float('nan'), float('nan')
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, y in points)
+    if not var_x:
+        return float('nan'), float('nan')
+    k = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return k, math.exp(mean_y - k * mean_x)
+
+
+def best_of(func, repeat):
+    """ Returns the best time, in seconds, of @repeat calls to @func. """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def make_tasks(size, first_day, seed=7):
+    """ Creates @size synthetic tasks all within the month of @first_day. """
+    records = synthetic.generate_records(size, seed=seed, start=first_day,
+                                         days=28)
+    tasks = [synthetic.record_to_task(r) for r in records]
+    tasks.sort(key=layout.task_duration, reverse=True)
+    return tasks
+
+
+def operations(first_day):
+    """
+    Returns a dictionary of operation name -> setup function. Each setup
+    function receives an input size and returns the function to be timed,
+    so that building the input is not timed.
+    """
+    def setup_layout_week(numweeks):
+        def setup(size):
+            tasks = make_tasks(size, first_day)
+            span = WeekSpan(numweeks)
+            span.week_containing_day(first_day)
+            grid = Grid(1, 7 * numweeks)
+            return lambda: layout.layout_week(tasks, span.start_date,
+                                              span.end_date, grid)
+        return setup
+
+    def setup_layout_month(size):
+        tasks = make_tasks(size, first_day)
+        return lambda: layout.layout_month(
+            tasks, layout.month_weeks(first_day.year, first_day.month), 4)
+
+    def setup_hit_test(size):
+        tasks = make_tasks(size, first_day)
+        weeks = layout.month_weeks(first_day.year, first_day.month)
+        renderer = AllDayTasksRenderer(len(weeks), 7)
+        renderer.set_size(1024, 768)
+        dtasks, renderer.overflow_links = layout.layout_month(tasks, weeks, 4)
+        renderer.set_tasks_to_draw(dtasks)
+        rng = random.Random(7)
+        points = [(rng.uniform(0, 1024), rng.uniform(0, 768))
+                  for i in range(100)]
+        return lambda: [renderer.find_pointed_object(x, y)
+                        for (x, y) in points]
+
+    def setup_navigate_month(size):
+        tasks = make_tasks(size, first_day)
+
+        def navigate():
+            day = first_day
+            for i in range(3):
+                weeks = layout.month_weeks(day.year, day.month)
+                visible = [t for t in tasks if layout.is_in_range(
+                    t, weeks[0]['dates'].start_date,
+                    weeks[-1]['dates'].end_date)]
+                layout.layout_month(visible, weeks, 4)
+                day = weeks[-1]['dates'].end_date + datetime.timedelta(1)
+        return navigate
+
+    def setup_bulk_import(size):
+        records = list(synthetic.generate_records(size, start=first_day))
+
+        def bulk_import():
+            ds = DataStore()
+            for record in records:
+                ds.push_task(synthetic.record_to_task(record))
+        return bulk_import
+
+    def setup_date_parse(size):
+        values = [(first_day + datetime.timedelta(days=i % 3650)).isoformat()
+                  for i in range(size)]
+        return lambda: [Date(v) for v in values]
+
+    def setup_grid(size):
+        rng = random.Random(7)
+        spans = []
+        for i in range(size):
+            x = rng.randrange(7)
+            spans.append((x, rng.randint(1, 7 - x)))
+
+        def fill_and_clear():
+            grid = Grid(1, 7)
+            for x, w in spans:
+                grid.add_to_grid(x, w)
+            grid.clear_rows()
+        return fill_and_clear
+
+    return {
+        'layout_week': setup_layout_week(1),
+        'layout_two_weeks': setup_layout_week(2),
+        'layout_month': setup_layout_month,
+        'hit_test': setup_hit_test,
+        'navigate_month': setup_navigate_month,
+        'bulk_import': setup_bulk_import,
+        'date_parse': setup_date_parse,
+        'grid_fill_and_clear': setup_grid,
+    }
+
+
+def geometric_sizes(start, factor, count):
+    return [int(start * factor ** i) for i in range(count)]
+
+
+def measure(names=None, sizes=None, repeat=3, budgets=None, max_size=None,
+            first_day=None):
+    """
+    Times each operation over a geometric series of input sizes, and fits
+    its empirical complexity exponent.
+
+    @param names: list of operation names, defaults to all of them.
+    @param sizes: list of integers, input sizes.
+    @param budgets: dictionary of operation name -> maximum exponent.
+    @param max_size: dictionary of operation name -> largest size to try,
+                     for operations too slow to run at every size.
+    @return results: list of dictionaries, one per operation.
+    """
+    if first_day is None:
+        first_day = datetime.date.today().replace(day=1)
+    if sizes is None:
+        sizes = geometric_sizes(250, 2, 6)
+    budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+    max_size = max_size or {'grid_fill_and_clear': 4000}
+    ops = operations(first_day)
+
+    results = []
+    for name in names or sorted(ops):
+        op_sizes = [n for n in sizes if n <= max_size.get(name, n)]
+        times = [best_of(ops[name](n), repeat) for n in op_sizes]
+        exponent, constant = fit_exponent(op_sizes, times)
+        budget = budgets.get(name)
+        results.append({
+            'name': name,
+            'sizes': op_sizes,
+            'times': times,
+            'exponent': exponent,
+            'constant': constant,
+            'budget': budget,
+            'over_budget': budget is not None and exponent > budget,
+        })
+    return results
+
+
+def svg_plot(result, width=360, height=240, margin=40):
+    """ Draws times vs. sizes of a @result on log-log axes, as SVG. """
+    xs = [math.log10(n) for n in result['sizes']]
+    ys = [math.log10(max(t, 1e-9)) for t in result['times']]
+    min_x, max_x = min(xs), max(xs) or 1
+    min_y, max_y = min(ys), max(ys)
+    span_x = (max_x - min_x) or 1
+    span_y = (max_y - min_y) or 1
+
+    def point(x, y):
+        return (margin + (x - min_x) / span_x * (width - 2 * margin),
+                height - margin - (y - min_y) / span_y * (height - 2 * margin))
+
+    coords = [point(x, y) for x, y in zip(xs, ys)]
+    color = '#c0392b' if result['over_budget'] else '#2c3e50'
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d">'
+             % (width, height),
+             '<rect width="100%" height="100%" fill="white"/>',
+             '<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#999"/>'
+             % (margin, height - margin, width - margin, height - margin),
+             '<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#999"/>'
+             % (margin, margin, margin, height - margin),
+             '<polyline fill="none" stroke="%s" stroke-width="2" points="%s"/>'
+             % (color, ' '.join('%.1f,%.1f' % c for c in coords))]
+    for (x, y), n in zip(coords, result['sizes']):
+        parts.append('<circle cx="%.1f" cy="%.1f" r="3" fill="%s"/>'
+                     % (x, y, color))
+        parts.append('<text x="%.1f" y="%d" font-size="9" '
+                     'text-anchor="middle">%d</text>'
+                     % (x, height - margin + 12, n))
+    parts.append('<text x="%d" y="%d" font-size="12">%s: k = %.2f</text>'
+                 % (margin, margin - 10, html.escape(result['name']),
+                    result['exponent']))
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def markdown_report(results):
+    lines = ['# Scaling report', '',
+             'Generated on %s.' % datetime.datetime.now().isoformat(), '',
+             '| operation | sizes | time at largest (s) | exponent | budget '
+             '| status |',
+             '|---|---|---|---|---|---|']
+    for r in results:
+        status = 'OVER BUDGET' if r['over_budget'] else 'ok'
+        lines.append('| %s | %d - %d | %.6f | %.2f | %s | %s |'
+                     % (r['name'], r['sizes'][0], r['sizes'][-1],
+                        r['times'][-1], r['exponent'],
+                        r['budget'] if r['budget'] is not None else '-',
+                        status))
+    lines.append('')
+    for r in results:
+        lines.append('![%s](%s.svg)' % (r['name'], r['name']))
+    return '\n'.join(lines) + '\n'
+
+
+def html_report(results):
+    rows = []
+    for r in results:
+        rows.append('<tr class="%s"><td>%s</td><td>%.2f</td><td>%s</td>'
+                    '<td>%s</td></tr>'
+                    % ('over' if r['over_budget'] else 'ok',
+                       html.escape(r['name']), r['exponent'],
+                       r['budget'] if r['budget'] is not None else '-',
+                       'OVER BUDGET' if r['over_budget'] else 'ok'))
+    plots = '\n'.join(svg_plot(r) for r in results)
+    return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            '<title>Scaling report</title><style>'
+            'td, th {padding: 2px 8px} .over {color: #c0392b}'
+            '</style></head><body><h1>Scaling report</h1>'
+            '<table><tr><th>operation</th><th>exponent</th><th>budget</th>'
+            '<th>status</th></tr>%s</table>%s</body></html>\n'
+            % ('\n'.join(rows), plots))
+
+
+def write_report(results, directory):
+    """ Writes report.md, report.html, results.json and the plots. """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for r in results:
+        with open(os.path.join(directory, r['name'] + '.svg'), 'w') as f:
+            f.write(svg_plot(r))
+    with open(os.path.join(directory, 'report.md'), 'w') as f:
+        f.write(markdown_report(results))
+    with open(os.path.join(directory, 'report.html'), 'w') as f:
+        f.write(html_report(results))
+    with open(os.path.join(directory, 'results.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fits empirical complexity of the main operations.")
+    parser.add_argument('operations', nargs='*',
+                        help="operations to run (default: all)")
+    parser.add_argument('--start', type=int, default=250)
+    parser.add_argument('--factor', type=float, default=2)
+    parser.add_argument('--steps', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', action='append', default=[],
+                        metavar='NAME=EXPONENT')
+    parser.add_argument('--output', '-o', default='scaling-report')
+    args = parser.parse_args(argv)
+
+    budgets = {}
+    for item in args.budget:
+        name, value = item.split('=')
+        budgets[name] = float(value)
+    results = measure(args.operations or None,
+                      geometric_sizes(args.start, args.factor, args.steps),
+                      args.repeat, budgets)
+    write_report(results, args.output)
+    for r in results:
+        flag = ' OVER BUDGET' if r['over_budget'] else ''
+        print('%-20s k = %.2f%s' % (r['name'], r['exponent'], flag))
+    return 1 if any(r['over_budget'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
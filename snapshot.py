@@ -0,0 +1,350 @@
+import array
+import collections.abc
+import datetime
+import math
+import mmap
+import struct
+import sys
+
+from dates import Date
+from tasks import Task
+
+MAGIC = b'CALSNAP\0'
+VERSION = 2
+# magic, version, byte order (0 little, 1 big), task count, heap size
+HEADER = struct.Struct('<8sIIQQ')
+STATUSES = (Task.STA_ACTIVE, Task.STA_DISMISSED, Task.STA_DONE)
+# the columns following the header, in order: name, array typecode, width
+# (number of values per task)
+COLUMNS = (('start', 'i', 1),
+           ('due', 'i', 1),
+           ('closed', 'i', 1),
+           ('status', 'B', 1),
+           ('color', 'f', 3),
+           ('id_offset', 'Q', 1),
+           ('id_length', 'I', 1),
+           ('title_offset', 'Q', 1),
+           ('title_length', 'I', 1),
+           ('content_offset', 'Q', 1),
+           ('content_length', 'I', 1),
+           ('tags_offset', 'Q', 1),
+           ('tags_length', 'I', 1))
+ALIGNMENT = 8
+# dates are stored as ordinals; this one stands for no date (and the other
+# fuzzy dates, which are not kept)
+NO_DATE = 0
+# separates the tags of a task in the heap
+TAG_SEPARATOR = '\x1f'
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _ordinal(date):
+    return NO_DATE if date.is_fuzzy() else date.date().toordinal()
+
+
+def write_snapshot(tasks, path):
+    """
+    Writes @tasks to a binary snapshot file at @path. Tasks are sorted by id,
+    so that the reader can find them by binary search without an index.
+
+    The file is a header, then one fixed-width column per field (see
+    COLUMNS) and finally a heap with the UTF-8 encoded ids, titles, contents
+    and tags, which the columns point into.
+
+    @param tasks: an iterable of Task objects.
+    @return count: integer, the number of tasks written.
+    """
+    tasks = sorted(tasks, key=lambda t: t.get_id().encode('utf-8'))
+    columns = dict((name, array.array(code)) for name, code, w in COLUMNS)
+    heap = bytearray()
+
+    def add_string(name, value):
+        data = (value or '').encode('utf-8')
+        columns[name + '_offset'].append(len(heap))
+        columns[name + '_length'].append(len(data))
+        heap.extend(data)
+
+    for task in tasks:
+        columns['start'].append(_ordinal(task.get_start_date()))
+        columns['due'].append(_ordinal(task.get_due_date()))
+        columns['closed'].append(_ordinal(task.get_closed_date()))
+        columns['status'].append(STATUSES.index(task.get_status()))
+        color = task.get_color()
+        columns['color'].extend(color[:3] if color else (float('nan'),) * 3)
+        add_string('id', task.get_id())
+        add_string('title', task.get_title())
+        add_string('content', task.content)
+        add_string('tags', TAG_SEPARATOR.join(task.tags))
+
+    byteorder = 0 if sys.byteorder == 'little' else 1
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, byteorder, len(tasks), len(heap)))
+        for name, code, width in COLUMNS:
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            f.write(columns[name].tobytes())
+        f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        f.write(heap)
+    return len(tasks)
+
+
+class MappedTask(Task):
+    """
+    A Task backed by a row of a Snapshot. Its fields are only read from the
+    mapped file (and dates only parsed) the first time they are used; after
+    that, and once set, they are plain attributes like in any Task.
+    """
+
+    def __init__(self, snapshot, row):
+        self._snapshot = snapshot
+        self._row = row
+        self.tid = snapshot.get_id(row)
+
+    def __getattr__(self, name):
+        # only called for attributes not set yet
+        snapshot = self.__dict__.get('_snapshot')
+        if snapshot is None:
+            raise AttributeError(name)
+        row = self._row
+        if name == 'title':
+            value = str(snapshot.get_title(row), 'utf-8')
+        elif name == 'content':
+            value = str(snapshot.get_content(row), 'utf-8')
+        elif name == 'start_date':
+            value = Date(snapshot.get_start(row))
+        elif name == 'due_date':
+            value = Date(snapshot.get_due(row))
+        elif name == 'status':
+            value = snapshot.get_status(row)
+        elif name == 'color':
+            value = snapshot.get_color(row)
+        elif name == 'closed_date':
+            value = Date(snapshot.get_closed(row))
+        elif name == 'tags':
+            value = snapshot.get_tags(row)
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
+
+class Snapshot(object):
+    """
+    Read-only access to a snapshot file written by write_snapshot(). The file
+    is memory-mapped: opening it reads nothing but the header, and each field
+    of each task is read from the mapping only when asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.map)
+        magic, version, byteorder, count, heap_size = \
+            HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("'%s' is not a snapshot file" % path)
+        if version != VERSION:
+            self.close()
+            raise ValueError("Unsupported snapshot version: %d" % version)
+        if byteorder != (0 if sys.byteorder == 'little' else 1):
+            self.close()
+            raise ValueError("Snapshot written with another byte order")
+        self.count = count
+
+        offset = HEADER.size
+        self.columns = {}
+        for name, code, width in COLUMNS:
+            offset = _aligned(offset)
+            size = array.array(code).itemsize * width * count
+            self.columns[name] = self.buffer[offset:offset + size].cast(code)
+            offset += size
+        offset = _aligned(offset)
+        self.heap = self.buffer[offset:offset + heap_size]
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """ Releases the mapping. Tasks already materialized are kept. """
+        for column in getattr(self, 'columns', {}).values():
+            column.release()
+        self.columns = {}
+        if getattr(self, 'heap', None) is not None:
+            self.heap.release()
+        self.buffer.release()
+        self.map.close()
+
+    def _string(self, name, row):
+        offset = self.columns[name + '_offset'][row]
+        return self.heap[offset:offset + self.columns[name + '_length'][row]]
+
+    def get_id_bytes(self, row):
+        """ Returns the id of the task at @row as a memoryview, no copy. """
+        return self._string('id', row)
+
+    def get_id(self, row):
+        return str(self._string('id', row), 'utf-8')
+
+    def get_title(self, row):
+        """ Returns the title of the task at @row as a memoryview, no copy. """
+        return self._string('title', row)
+
+    def get_content(self, row):
+        return self._string('content', row)
+
+    def _date(self, name, row):
+        ordinal = self.columns[name][row]
+        if ordinal == NO_DATE:
+            return None
+        return datetime.date.fromordinal(ordinal)
+
+    def get_start(self, row):
+        """ Returns the start date at @row, a datetime.date, or None. """
+        return self._date('start', row)
+
+    def get_due(self, row):
+        return self._date('due', row)
+
+    def get_closed(self, row):
+        return self._date('closed', row)
+
+    def get_tags(self, row):
+        tags = str(self._string('tags', row), 'utf-8')
+        return tags.split(TAG_SEPARATOR) if tags else []
+
+    def get_status(self, row):
+        return STATUSES[self.columns['status'][row]]
+
+    def get_color(self, row):
+        color = tuple(self.columns['color'][3 * row:3 * row + 3])
+        if math.isnan(color[0]):
+            return None
+        return color
+
+    def find(self, tid):
+        """ Returns the row of the task with id @tid, or -1. """
+        key = tid.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_id_bytes(mid).tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.get_id_bytes(lo) == key:
+            return lo
+        return -1
+
+    def rows_in_range(self, first_day, last_day):
+        """
+        Returns the rows of the tasks shown between @first_day and
+        @last_day, looking only at the date columns.
+        """
+        first, last = first_day.toordinal(), last_day.toordinal()
+        starts, dues = self.columns['start'], self.columns['due']
+        # the day Task.get_start_date().date() gives for no date
+        no_date = Date.no_date().date().toordinal()
+        return [row for row in range(self.count)
+                if (dues[row] or no_date) >= first and
+                (starts[row] or no_date) <= last]
+
+    def task(self, row):
+        return MappedTask(self, row)
+
+
+class SnapshotTasks(collections.abc.MutableMapping):
+    """
+    A dictionary of id -> Task over a Snapshot, usable as the task tree of a
+    DataStore. Tasks are materialized the first time they are looked up;
+    tasks added, replaced or deleted afterwards are kept in memory, the
+    snapshot itself is never modified.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.materialized = {}
+        self.added = {}
+        # ids of the snapshot that were deleted or replaced since
+        self.shadowed = set()
+
+    def _in_snapshot(self, tid):
+        return self.snapshot.find(tid) >= 0
+
+    def __getitem__(self, tid):
+        task = self.added.get(tid)
+        if task is not None:
+            return task
+        task = self.materialized.get(tid)
+        if task is not None:
+            return task
+        if tid in self.shadowed:
+            raise KeyError(tid)
+        row = self.snapshot.find(tid)
+        if row < 0:
+            raise KeyError(tid)
+        task = self.snapshot.task(row)
+        self.materialized[tid] = task
+        return task
+
+    def __contains__(self, tid):
+        if tid in self.added or tid in self.materialized:
+            return True
+        return tid not in self.shadowed and self._in_snapshot(tid)
+
+    def __setitem__(self, tid, task):
+        if tid not in self.added and self._in_snapshot(tid):
+            self.shadowed.add(tid)
+        self.added[tid] = task
+        self.materialized.pop(tid, None)
+
+    def __delitem__(self, tid):
+        if tid not in self:
+            raise KeyError(tid)
+        if self.added.pop(tid, None) is None or self._in_snapshot(tid):
+            self.shadowed.add(tid)
+        self.materialized.pop(tid, None)
+
+    def __iter__(self):
+        snapshot = self.snapshot
+        shadowed = self.shadowed
+        for row in range(len(snapshot)):
+            tid = snapshot.get_id(row)
+            if tid not in shadowed:
+                yield tid
+        for tid in list(self.added):
+            yield tid
+
+    def __len__(self):
+        return len(self.snapshot) - len(self.shadowed) + len(self.added)
+
+    def iter_spans(self):
+        """
+        Iterates over the (id, start, due) of every task, with the days as
+        ordinals, for DataStore.index. Tasks are read from the date columns
+        of the snapshot, without being materialized, unless they already
+        were (they may have been changed since).
+        """
+        snapshot = self.snapshot
+        starts, dues = snapshot.columns['start'], snapshot.columns['due']
+        no_date = Date.no_date().date().toordinal()
+        skipped = self.shadowed.union(self.materialized)
+        for row in range(len(snapshot)):
+            tid = snapshot.get_id(row)
+            if tid not in skipped:
+                yield tid, starts[row] or no_date, dues[row] or no_date
+        for tasks in (self.materialized, self.added):
+            for tid, task in list(tasks.items()):
+                yield (tid, task.get_start_date().date().toordinal(),
+                       task.get_due_date().date().toordinal())
+
+
+def load_snapshot(path):
+    """
+    Opens the snapshot at @path as a DataStore, without reading its tasks.
+    """
+    from datastore import DataStore
+    return DataStore(SnapshotTasks(Snapshot(path)))
@@ -0,0 +1,129 @@
+from gi.repository import GLib
+import datetime
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+
+# how often (ms) the main loop is asked to beat
+HEARTBEAT_INTERVAL = 100
+# how long (s) without a beat before the main loop is considered stalled
+STALL_THRESHOLD = 1.0
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+
+def default_log_path():
+    return os.path.join(GLib.get_user_cache_dir(), 'calendar-plugin',
+                        'stalls.log')
+
+
+class Watchdog(object):
+    """
+    Detects when the GTK main loop stops servicing events for too long.
+    A GLib timeout updates a heartbeat from the main loop, while a separate
+    thread checks it: when the heartbeat is older than the threshold, the
+    current Python stack of the main thread is appended to a rotating log,
+    along with a description of what was being shown at the time.
+    """
+
+    def __init__(self, log_path=None, threshold=STALL_THRESHOLD,
+                 interval=HEARTBEAT_INTERVAL, context=None):
+        """
+        @param log_path: string, file the stalls are logged to.
+        @param threshold: float, seconds without heartbeat to report a stall.
+        @param interval: integer, milliseconds between heartbeats.
+        @param context: function returning a string describing the state of
+                        the application (e.g. active view and dates). It is
+                        called from the watchdog thread, so it should only
+                        read simple attributes.
+        """
+        self.log_path = log_path or default_log_path()
+        self.threshold = threshold
+        self.interval = interval
+        self.context = context
+        self.main_thread_id = threading.main_thread().ident
+        self.last_beat = time.monotonic()
+        self.stalled = False
+        self.stalls = 0
+        self._timeout_id = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.logger = self._create_logger()
+
+    def _create_logger(self):
+        directory = os.path.dirname(self.log_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        logger = logging.getLogger('calendar-plugin.watchdog.%d' % id(self))
+        logger.propagate = False
+        handler = logging.handlers.RotatingFileHandler(
+            self.log_path, maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        return logger
+
+    def start(self):
+        """ Starts beating from the main loop and watching from a thread. """
+        if self._thread is not None:
+            return
+        self.last_beat = time.monotonic()
+        self._stop.clear()
+        self._timeout_id = GLib.timeout_add(self.interval, self._beat)
+        self._thread = threading.Thread(target=self._watch,
+                                        name='main-loop-watchdog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        GLib.source_remove(self._timeout_id)
+        self._timeout_id = None
+        self._thread.join()
+        self._thread = None
+
+    def _beat(self):
+        now = time.monotonic()
+        if self.stalled:
+            self.logger.warning("%s main loop resumed after %.2fs\n"
+                                % (datetime.datetime.now().isoformat(),
+                                   now - self.last_beat))
+            self.stalled = False
+        self.last_beat = now
+        return True
+
+    def _watch(self):
+        check_interval = min(self.threshold / 4.0, self.interval / 1000.0)
+        while not self._stop.wait(check_interval):
+            elapsed = time.monotonic() - self.last_beat
+            if elapsed > self.threshold and not self.stalled:
+                # only the first sample of each stall is logged
+                self.stalled = True
+                self.stalls += 1
+                self.report(elapsed)
+
+    def get_main_stack(self):
+        """ Returns the current stack of the main thread, as a string. """
+        frame = sys._current_frames().get(self.main_thread_id)
+        if frame is None:
+            return ''
+        return ''.join(traceback.format_stack(frame))
+
+    def report(self, elapsed):
+        """ Logs the main thread stack, @elapsed seconds into a stall. """
+        context = ''
+        if self.context is not None:
+            try:
+                context = self.context()
+            except Exception as e:
+                context = 'unavailable (%s)' % e
+        self.logger.warning("%s main loop stalled for %.2fs\ncontext: %s\n%s"
+                            % (datetime.datetime.now().isoformat(), elapsed,
+                               context, self.get_main_stack()))
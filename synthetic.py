@@ -0,0 +1,91 @@
+import datetime
+import random
+
+from tasks import Task
+
+SPAN_DISTRIBUTIONS = ('fixed', 'uniform', 'geometric')
+
+
+def random_span(rng, distribution, mean_span):
+    """
+    Draws the number of days a task lasts (0 means a single-day task).
+
+    @param rng: a random.Random object.
+    @param distribution: string, one of SPAN_DISTRIBUTIONS.
+    @param mean_span: float, the average length of the tasks in days.
+    """
+    if distribution == 'fixed':
+        return int(mean_span)
+    elif distribution == 'uniform':
+        return rng.randint(0, int(2 * mean_span))
+    elif distribution == 'geometric':
+        # many short tasks, a few long ones
+        return int(rng.expovariate(1.0 / mean_span)) if mean_span else 0
+    raise ValueError("Unknown span distribution: '%s'" % distribution)
+
+
+def generate_records(count, seed=7, start=None, days=365, mean_span=2,
+                     span_distribution='geometric', clustering=0.0,
+                     num_clusters=12, done_ratio=0.3):
+    """
+    Generates @count synthetic task descriptions, always the same ones for
+    the same parameters.
+
+    @param count: integer, number of tasks to generate.
+    @param seed: integer, seed of the random generator.
+    @param start: datetime.date object, first day tasks can start on.
+                  Defaults to today.
+    @param days: integer, number of days over which tasks are spread.
+    @param mean_span: float, the average length of the tasks in days.
+    @param span_distribution: string, one of SPAN_DISTRIBUTIONS.
+    @param clustering: float between 0 and 1, the ratio of tasks that start
+                       around a few hot dates (e.g. sprint ends) instead of
+                       being spread uniformly.
+    @param num_clusters: integer, the number of hot dates.
+    @param done_ratio: float between 0 and 1, ratio of tasks marked as done.
+    @return records: generator of (tid, title, start, due, done, color).
+    """
+    rng = random.Random(seed)
+    if start is None:
+        start = datetime.date.today()
+    centers = [rng.randrange(days) for i in range(max(num_clusters, 1))]
+
+    for i in range(count):
+        if rng.random() < clustering:
+            offset = rng.choice(centers) + int(rng.gauss(0, 2))
+            offset = min(max(offset, 0), days - 1)
+        else:
+            offset = rng.randrange(days)
+        start_date = start + datetime.timedelta(days=offset)
+        span = random_span(rng, span_distribution, mean_span)
+        due_date = start_date + datetime.timedelta(days=span)
+        done = rng.random() < done_ratio
+        color = ((rng.random() + 0)/2, (rng.random() + 0.5)/2,
+                 (rng.random() + 0.5)/2)
+        yield ("synthetic-%d" % i, "task %d" % i, start_date, due_date,
+               done, color)
+
+
+def record_to_task(record):
+    """ Creates a Task object from a @record made by generate_records. """
+    tid, title, start_date, due_date, done, color = record
+    task = Task(tid)
+    task.set_title(title)
+    task.set_start_date(start_date)
+    task.set_due_date(due_date)
+    if done:
+        task.set_status(Task.STA_DONE)
+    task.set_color(color)
+    return task
+
+
+def populate(datastore, count, **kwargs):
+    """
+    Fills @datastore with @count synthetic tasks. The other keyword
+    arguments are the same as generate_records().
+
+    @return datastore: the same DataStore object, for convenience.
+    """
+    for record in generate_records(count, **kwargs):
+        datastore.push_task(record_to_task(record))
+    return datastore
@@ -1,5 +1,4 @@
-import cgi
-import xml.dom.minidom
+import html
 
 from dates import Date
 
@@ -93,6 +92,7 @@ class Task(object):  # TreeNode):
         """
         if self.content:
             txt = self.content
+            import xml.dom.minidom
             element = xml.dom.minidom.parseString(txt)
             txt = txt.strip()
             if char > 0:
@@ -106,7 +106,7 @@ class Task(object):  # TreeNode):
         if texte != "<content/>":
             # defensive programmation to filter bad formatted tasks
             if not texte.startswith("<content>"):
-                texte = cgi.escape(texte, quote=True)
+                texte = html.escape(texte, quote=True)
                 texte = "<content>%s" % texte
             if not texte.endswith("</content>"):
                 texte = "%s</content>" % texte
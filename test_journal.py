@@ -0,0 +1,104 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from datastore import DataStore
+from dates import Date
+from journal import JOURNAL_NAME, Journal
+from tasks import Task
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open_session(self):
+        """ Loads the journal into a new DataStore and attaches to it. """
+        journal = Journal(self.directory, commit_interval=0)
+        datastore = DataStore()
+        journal.load(datastore)
+        journal.attach(datastore.get_requester())
+        return journal, datastore
+
+    def test_append_after_torn_write(self):
+        journal, datastore = self.open_session()
+        req = datastore.get_requester()
+        first = req.new_task().get_id()
+        req.update_task(first, title="before the crash")
+        journal.sync()
+        journal.close()
+        # the crash: half a record at the end of the journal
+        with open(os.path.join(self.directory, JOURNAL_NAME), 'ab') as f:
+            f.write(b'{"op":"update","task":{"id":"')
+
+        journal, datastore = self.open_session()
+        req = datastore.get_requester()
+        self.assertEqual(req.get_task(first).get_title(), "before the crash")
+        second = req.new_task().get_id()
+        req.update_task(second, title="after the crash")
+        journal.sync()
+        journal.close()
+
+        journal = Journal(self.directory)
+        datastore = DataStore()
+        journal.load(datastore)
+        self.assertEqual(datastore.get_task(first).get_title(),
+                         "before the crash")
+        self.assertEqual(datastore.get_task(second).get_title(),
+                         "after the crash")
+
+    def test_changes_made_while_loading(self):
+        journal, datastore = self.open_session()
+        first = datastore.get_requester().new_task().get_id()
+        journal.sync()
+        journal.close()
+
+        # changes made before the journal was loaded are queued
+        journal = Journal(self.directory, commit_interval=0)
+        datastore = DataStore()
+        req = datastore.get_requester()
+        journal.attach(req, start=False)
+        second = req.new_task().get_id()
+        loaded = DataStore()
+        journal.load(loaded)
+        datastore.push_tasks(loaded.iter_tasks())
+        journal.start()
+        journal.sync()
+        journal.close()
+
+        datastore = DataStore()
+        Journal(self.directory).load(datastore)
+        self.assertTrue(datastore.has_task(first))
+        self.assertTrue(datastore.has_task(second))
+
+    def test_compaction_keeps_every_field(self):
+        journal, datastore = self.open_session()
+        req = datastore.get_requester()
+        done = req.new_task().get_id()
+        req.update_task(done, status=Task.STA_DONE)
+        task = datastore.get_task_for_write(done)
+        task.set_closed_date(Date(datetime.date(2020, 1, 2)))
+        task.tags = ['home', 'urgent']
+        undated = req.new_task().get_id()
+        journal.compact()
+        journal.sync()
+        journal.close()
+
+        datastore = DataStore()
+        self.assertEqual(Journal(self.directory).load(datastore), 0)
+        task = datastore.get_task(done)
+        self.assertEqual(task.get_status(), Task.STA_DONE)
+        self.assertEqual(task.get_closed_date().date(),
+                         datetime.date(2020, 1, 2))
+        self.assertEqual(task.tags, ['home', 'urgent'])
+        self.assertTrue(datastore.get_task(undated).get_due_date().is_fuzzy())
+
+
+if __name__ == '__main__':
+    unittest.main()
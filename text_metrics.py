@@ -0,0 +1,122 @@
+import bisect
+
+ELLIPSIS = "..."
+
+
+def font_key(ctx):
+    """
+    Builds a hashable key describing the font currently selected in a Cairo
+    context @ctx, so measurements can be shared between every context that
+    uses the same face and size.
+
+    @param ctx: a Cairo context
+    @return key: tuple (family, slant, weight, size)
+    """
+    face = ctx.get_font_face()
+    try:
+        face_key = (face.get_family(), int(face.get_slant()),
+                    int(face.get_weight()))
+    except AttributeError:
+        # not a toy font face: fall back to the face object identity
+        face_key = (id(face), None, None)
+    return face_key + (ctx.get_font_matrix().xx,)
+
+
+class TextMetrics(object):
+    """
+    Measures and crops text drawn with the Cairo toy text API, caching what it
+    learns: the advance width of each glyph per font, and the final result
+    of each (text, font, width) cropping request.
+    """
+
+    def __init__(self, max_layouts=4096):
+        self.advances = {}
+        self.layouts = {}
+        self.max_layouts = max_layouts
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """ Forgets everything that was measured so far. """
+        self.advances.clear()
+        self.layouts.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        """ Returns the ratio of layout requests served from cache. """
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+
+    def _advance(self, ctx, key, char):
+        advances = self.advances.setdefault(key, {})
+        try:
+            return advances[char]
+        except KeyError:
+            advance = ctx.text_extents(char)[4]
+            advances[char] = advance
+            return advance
+
+    def cumulative_widths(self, ctx, key, text):
+        """
+        Returns a list where the i-th entry is the width, in pixels, of the
+        first i characters of @text, using cached glyph advances.
+        """
+        widths = [0.0]
+        total = 0.0
+        for char in text:
+            total += self._advance(ctx, key, char)
+            widths.append(total)
+        return widths
+
+    def text_width(self, ctx, text):
+        """ Returns the advance width of @text for the current font. """
+        return self.cumulative_widths(ctx, font_key(ctx), text)[-1]
+
+    def crop(self, ctx, key, text, width):
+        """
+        Crops @text so that it fits in @width pixels, appending an ellipsis
+        when something had to be cut. The cut point is found by binary search
+        on the cumulative glyph widths.
+
+        @return text: string, the (possibly) cropped text.
+        """
+        widths = self.cumulative_widths(ctx, key, text)
+        if widths[-1] <= width:
+            return text
+        available = width - self.cumulative_widths(ctx, key, ELLIPSIS)[-1]
+        crop_at = bisect.bisect_right(widths, available) - 1
+        return text[:max(crop_at, 0)] + ELLIPSIS
+
+    def layout(self, ctx, text, width, crop=False):
+        """
+        Computes how @text should be laid out inside a box @width pixels wide.
+        Results are memoized by (text, font, width, crop).
+
+        @return text, w, h: the text to draw and its ink width and height.
+        """
+        key = font_key(ctx)
+        cache_key = (text, key, width, crop)
+        try:
+            result = self.layouts[cache_key]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            return result
+
+        if crop:
+            text = self.crop(ctx, key, text, width)
+        (x, y, w, h, dx, dy) = ctx.text_extents(text)
+        result = (text, w, h)
+
+        if len(self.layouts) >= self.max_layouts:
+            self.layouts.clear()
+        self.layouts[cache_key] = result
+        return result
+
+
+# shared by every drawing area: measurements only depend on the font
+metrics = TextMetrics()
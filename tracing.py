@@ -0,0 +1,153 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+# name of the environment variable holding the file traces are written to
+TRACE_ENV = 'CALENDAR_TRACE'
+# beyond this number of events, new ones are dropped (and counted)
+MAX_EVENTS = 1000000
+
+
+class _NullSpan(object):
+    """ Context manager used in place of a Span when tracing is off. """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    """ Times the block it wraps and records it as one trace event. """
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add_event(self.name, self.category, self.start,
+                              time.perf_counter() - self.start, self.args)
+        return False
+
+
+class Tracer(object):
+    """
+    Collects timed spans and exports them in the Chrome trace event format,
+    which can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, path=None, max_events=MAX_EVENTS):
+        """
+        @param path: string, file the trace is written to at exit. Tracing is
+                     disabled if it is None.
+        @param max_events: integer, the maximum number of events kept.
+        """
+        self.path = path
+        self.enabled = path is not None
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def span(self, name, category='calendar', **args):
+        """
+        Returns a context manager that records the time spent inside of it.
+
+        @param name: string, shown as the span label.
+        @param category: string, used to filter spans in the viewer.
+        @param args: shown along with the span in the viewer.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, args)
+
+    def add_event(self, name, category, start, duration, args=None):
+        """ Records a complete ('X') event, times given in seconds. """
+        event = {'name': name,
+                 'cat': category,
+                 'ph': 'X',
+                 'ts': (start - self.origin) * 1e6,
+                 'dur': duration * 1e6,
+                 'pid': self.pid,
+                 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        with self.lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+            else:
+                self.events.append(event)
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+            self.dropped = 0
+
+    def to_json(self):
+        with self.lock:
+            events = list(self.events)
+        return {'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'dropped_events': self.dropped}}
+
+    def save(self, path=None):
+        """ Writes the trace to @path, or to the path given at creation. """
+        path = path or self.path
+        if path is None:
+            return
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f)
+
+
+tracer = Tracer(os.environ.get(TRACE_ENV) or None)
+if tracer.enabled:
+    atexit.register(tracer.save)
+
+
+def span(name, category='calendar', **args):
+    """ Shortcut for tracer.span(), see Tracer.span(). """
+    return tracer.span(name, category, **args)
+
+
+def traced(category='calendar', name=None):
+    """
+    Decorator recording every call to the decorated function as a span.
+    Whether tracing is enabled is checked once, when the function is
+    decorated: if it is not, the function is returned untouched, so that
+    traced code costs nothing unless CALENDAR_TRACE was set at start up.
+
+    @param category: string, category of the spans.
+    @param name: string, label of the spans. Defaults to the function's
+                 qualified name.
+    """
+    def decorator(func):
+        if not tracer.enabled:
+            return func
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.add_event(label, category, start,
+                                 time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -1,7 +1,8 @@
-import cairo
 import datetime
 import random
 
+from text_metrics import metrics
+
 random.seed(7)  # to generate same colors/dates every time
 
 
@@ -33,6 +34,7 @@ def date_generator(start, numdays):
 
 
 def create_vertical_gradient(x, y, h, color, alpha):
+    import cairo
     grad = cairo.LinearGradient(x, y, x, y+h)
     c = [c + 0.1 for c in color]
     grad.add_color_stop_rgba(0, c[0], c[1], c[2], alpha)
@@ -73,6 +75,17 @@ def convert_grid_to_screen_coord(col_width, line_height, x, y, w, h,
     return base_x, base_y, width, height
 
 
+def rect_intersects_extents(rect, extents):
+    """
+    Returns True if @rect, a (x, y, w, h) tuple, overlaps the area given by
+    @extents, a (x1, y1, x2, y2) tuple such as the one returned by
+    cairo.Context.clip_extents().
+    """
+    x, y, w, h = rect
+    x1, y1, x2, y2 = extents
+    return x < x2 and x + w > x1 and y < y2 and y + h > y1
+
+
 def date_to_row_coord(date, start):
     # date is in previous month than start
     if date.month + 1 == start.month:
@@ -105,13 +118,14 @@ def date_to_grid_coord(date, start):
 
 
 def center_text_on_rect(ctx, text, base_x, base_y, width, height, crop=False):
-    (x, y, w, h, dx, dy) = ctx.text_extents(text)
-    if crop:
-        letter_w = ctx.text_extents('m')[2]
-        if len(text)*letter_w > width:
-            crop_at = int(width/letter_w) - 3
-            text = text[:crop_at] + "..."
-            (x, y, w, h, dx, dy) = ctx.text_extents(text)
+    """
+    Centers @text inside the rectangle given by @base_x, @base_y, @width and
+    @height, cropping it first to fit @width if @crop is set. Measurements
+    are cached by text_metrics, so redrawing the same labels is cheap.
+
+    @return text, base_x, base_y: the text to draw and where to move to.
+    """
+    text, w, h = metrics.layout(ctx, text, width, crop)
     base_x = base_x + width/2.0 - w/2.0
     base_y = base_y + height/2.0 + h/2.0
     return text, base_x, base_y
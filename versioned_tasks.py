@@ -0,0 +1,164 @@
+import collections.abc
+import copy
+import itertools
+import random
+
+# number of dictionaries the tasks are spread over; writing to a task after
+# a snapshot copies only the one holding it
+SHARDS = 256
+
+
+def _copy_task(task):
+    """ Returns a copy of @task that can be changed without affecting it. """
+    clone = copy.copy(task)
+    clone.tags = list(task.tags)
+    return clone
+
+
+class TasksView(collections.abc.Mapping):
+    """
+    An immutable dictionary of id -> Task, as the tasks of a DataStore were
+    at some version. It shares its storage with the DataStore (and with
+    other views) instead of copying it, and can be read from any thread
+    while the DataStore keeps changing.
+    """
+
+    def __init__(self, shards, version, count):
+        self._shards = shards
+        self.version = version
+        self._count = count
+
+    @classmethod
+    def copy_of(cls, tasks, version=0):
+        """ Makes a view of any dictionary of tasks, by copying it. """
+        shards = [{} for i in range(SHARDS)]
+        for tid in tasks:
+            shards[hash(tid) % SHARDS][tid] = _copy_task(tasks[tid])
+        return cls(tuple(shards), version, sum(len(s) for s in shards))
+
+    def __getitem__(self, tid):
+        return self._shards[hash(tid) % SHARDS][tid]
+
+    def __contains__(self, tid):
+        return tid in self._shards[hash(tid) % SHARDS]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._shards)
+
+    def __len__(self):
+        return self._count
+
+    def get_task(self, tid):
+        return self._shards[hash(tid) % SHARDS].get(tid)
+
+
+class VersionedTasks(collections.abc.MutableMapping):
+    """
+    The dictionary of id -> Task of a DataStore, from which cheap immutable
+    views can be taken with snapshot().
+
+    Tasks are spread over SHARDS dictionaries. Taking a snapshot only
+    marks them all as shared; the first change to a shared dictionary
+    copies it, so snapshots never see later changes. Tasks themselves are
+    changed in place, so the ones to be changed must be fetched with
+    get_for_write(), which copies them if a snapshot may hold them.
+
+    Snapshots must be taken from the thread changing the tasks; they can
+    then be handed over to any other thread.
+    """
+
+    def __init__(self, tasks=None):
+        self._shards = [{} for i in range(SHARDS)]
+        self._shared = [False] * SHARDS
+        # ids of the tasks added or copied since the last snapshot, which
+        # can be changed in place; None if no snapshot was ever taken
+        self._owned = None
+        self._count = 0
+        self.version = 0
+        # every id, in no particular order, and where it is in that list,
+        # so that random_id() needs no copy of the keys
+        self._ids = []
+        self._positions = {}
+        if tasks:
+            self.update(tasks)
+
+    def _writable_shard(self, tid):
+        i = hash(tid) % SHARDS
+        if self._shared[i]:
+            self._shards[i] = dict(self._shards[i])
+            self._shared[i] = False
+        return self._shards[i]
+
+    def __getitem__(self, tid):
+        return self._shards[hash(tid) % SHARDS][tid]
+
+    def __contains__(self, tid):
+        return tid in self._shards[hash(tid) % SHARDS]
+
+    def get(self, tid, default=None):
+        return self._shards[hash(tid) % SHARDS].get(tid, default)
+
+    def __setitem__(self, tid, task):
+        shard = self._writable_shard(tid)
+        if tid not in shard:
+            self._count += 1
+            self._positions[tid] = len(self._ids)
+            self._ids.append(tid)
+        shard[tid] = task
+        if self._owned is not None:
+            self._owned.add(tid)
+        self.version += 1
+
+    def __delitem__(self, tid):
+        shard = self._writable_shard(tid)
+        del shard[tid]
+        self._count -= 1
+        # move the last id in the place of the deleted one
+        position = self._positions.pop(tid)
+        last = self._ids.pop()
+        if last != tid:
+            self._ids[position] = last
+            self._positions[last] = position
+        if self._owned is not None:
+            self._owned.discard(tid)
+        self.version += 1
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._shards)
+
+    def __len__(self):
+        return self._count
+
+    def iter_values(self):
+        """ Iterates over the tasks, without looking them up by id. """
+        return itertools.chain.from_iterable(
+            shard.values() for shard in self._shards)
+
+    def random_id(self):
+        """ Returns the id of a task picked at random, or None. """
+        if not self._ids:
+            return None
+        return random.choice(self._ids)
+
+    def get_for_write(self, tid):
+        """
+        Returns the task @tid, ready to be changed in place: if a snapshot
+        may hold it, it is replaced by a copy first.
+
+        @return task: a Task object, or None if there is no task @tid.
+        """
+        task = self.get(tid)
+        if task is None:
+            return None
+        if self._owned is not None and tid not in self._owned:
+            task = _copy_task(task)
+            self._writable_shard(tid)[tid] = task
+            self._owned.add(tid)
+        self.version += 1
+        return task
+
+    def snapshot(self):
+        """ Returns a TasksView of the tasks as they are now. """
+        self._shared = [True] * SHARDS
+        self._owned = set()
+        return TasksView(tuple(self._shards), self.version, self._count)
@@ -15,6 +15,22 @@ class ViewBase:
 
         self.numdays = None
         self.selected_task = None
+        # other tasks selected along with selected_task; shared with the
+        # AllDayTasks widget, so it is only ever changed in place
+        self.selected_tasks = set()
+        self.motion = None
+        self.all_day_tasks = None
+
+        # cell where a drag of the selected tasks started, by how many days
+        # they were dragged so far, and whether they are moved ("move") or
+        # resized ("expand_left" or "expand_right")
+        self.group_drag = None
+        self.group_drag_days = 0
+        self.group_drag_action = None
+        # where the pointer was pressed to start a rubber band selection
+        self.rubber_band_origin = None
+
+        requester.add_batch_observer(self.on_batch_done)
 
     def get_selected_task(self):
         """ Returns which task is being selected. """
@@ -23,6 +39,181 @@ class ViewBase:
     def unselect_task(self):
         """ Unselects the task that was selected before. """
         self.selected_task = None
+        self.selected_tasks.clear()
+
+    def get_selected_tasks(self):
+        """ Returns the set of ids of all the tasks being selected. """
+        selected = set(self.selected_tasks)
+        if self.selected_task:
+            selected.add(self.selected_task)
+        return selected
+
+    def toggle_task_selection(self, tid):
+        """ Adds the task @tid to the selection, or removes it from it. """
+        if tid in self.get_selected_tasks():
+            self.selected_tasks.discard(tid)
+            if self.selected_task == tid:
+                self.selected_task = None
+        else:
+            self.selected_tasks.add(tid)
+        self.all_day_tasks.selected_task = self.selected_task
+        self.all_day_tasks.queue_draw_changes()
+
+    @abc.abstractmethod
+    def get_cell_at(self, x, y):
+        """ Returns the (row, col) of the grid cell at position (@x, @y). """
+        return
+
+    @abc.abstractmethod
+    def days_between_cells(self, cell_a, cell_b):
+        """ Returns how many days are between two (row, col) cells. """
+        return
+
+    def selection_press(self, widget, event):
+        """
+        Handles the button presses dealing with several tasks: Ctrl or
+        Shift click on a task adds or removes it from the selection, and on
+        an empty spot starts a rubber band; a click on one of several
+        selected tasks starts dragging all of them, or resizing all of them
+        if it is on the edge of the task.
+
+        @return bool: True if @event was handled.
+        """
+        adt = self.all_day_tasks
+        tid, action, cursor = adt.identify_pointed_object(event, clicked=True)
+        if adt.is_extending_selection(event):
+            if tid is None:
+                self.rubber_band_origin = (event.x, event.y)
+            else:
+                self.toggle_task_selection(tid)
+            return True
+        selected = self.get_selected_tasks()
+        if tid in selected and len(selected) > 1:
+            self.group_drag = self.get_cell_at(event.x, event.y)
+            self.group_drag_days = 0
+            if action in ("expand_left", "expand_right"):
+                self.group_drag_action = action
+            else:
+                self.group_drag_action = "move"
+            widget.get_window().set_cursor(cursor)
+            return True
+        if self.selected_tasks:
+            self.selected_tasks.clear()
+            adt.queue_draw_changes()
+        return False
+
+    def selection_motion(self, event):
+        """
+        Follows the pointer while dragging a rubber band or the selected
+        tasks. Moved or resized tasks are only previewed: nothing is
+        relayouted until they are dropped.
+
+        @return bool: True if @event was handled.
+        """
+        if self.rubber_band_origin is not None:
+            x0, y0 = self.rubber_band_origin
+            self.all_day_tasks.set_rubber_band(
+                (min(x0, event.x), min(y0, event.y),
+                 abs(event.x - x0), abs(event.y - y0)))
+            return True
+        if self.group_drag is None:
+            return False
+        cell = self.get_cell_at(event.x, event.y)
+        days = self.days_between_cells(self.group_drag, cell)
+        if days != self.group_drag_days:
+            self.group_drag_days = days
+            adt = self.all_day_tasks
+            if self.group_drag_action == "move":
+                row, col = self.group_drag
+                adt.set_drag_preview(((cell[1] - col) * adt.get_day_width(),
+                                      (cell[0] - row) * adt.get_week_height()))
+            else:
+                adt.set_resize_preview((self.group_drag_action,
+                                        days * adt.get_day_width()))
+        return True
+
+    def selection_release(self, event):
+        """
+        Finishes a rubber band selection, or drops the selected tasks,
+        moving or resizing all of them by the same number of days.
+
+        @return bool: True if @event was handled.
+        """
+        adt = self.all_day_tasks
+        if self.rubber_band_origin is not None:
+            self.rubber_band_origin = None
+            if adt.rubber_band is not None:
+                self.selected_tasks.update(
+                    adt.find_tasks_in_rect(adt.rubber_band))
+                adt.set_rubber_band(None)
+                adt.queue_draw_changes()
+            return True
+        if self.group_drag is None:
+            return False
+        days = self.group_drag_days
+        action = self.group_drag_action
+        self.group_drag = None
+        self.group_drag_days = 0
+        self.group_drag_action = None
+        if action == "move":
+            adt.set_drag_preview(None)
+            if days:
+                self.move_selected_tasks(days)
+        else:
+            adt.set_resize_preview(None)
+            if days:
+                self.resize_selected_tasks(
+                    days, 'start' if action == "expand_left" else 'due')
+        return True
+
+    def move_selected_tasks(self, days):
+        """
+        Moves all the selected tasks by @days, in a single batch of changes
+        (see Requester.batch): the view is relayouted once for all of them.
+        """
+        delta = datetime.timedelta(days=days)
+        with self.req.batch():
+            for tid in self.get_selected_tasks():
+                task = self.req.get_task(tid)
+                if task is None:
+                    continue
+                self.req.update_task(
+                    tid, start=task.get_start_date().date() + delta,
+                    due=task.get_due_date().date() + delta)
+
+    def resize_selected_tasks(self, days, edge):
+        """
+        Moves the start (if @edge is 'start') or the due date (if it is
+        'due') of all the selected tasks by @days, in a single batch. A
+        task never ends before it starts: its dates may then become equal.
+        """
+        delta = datetime.timedelta(days=days)
+        with self.req.batch():
+            for tid in self.get_selected_tasks():
+                task = self.req.get_task(tid)
+                if task is None:
+                    continue
+                start = task.get_start_date().date()
+                due = task.get_due_date().date()
+                if edge == 'start':
+                    self.req.update_task(tid, start=min(start + delta, due))
+                else:
+                    self.req.update_task(tid, due=max(due + delta, start))
+
+    def set_selected_tasks_status(self, status):
+        """ Sets the status of all the selected tasks, in a single batch. """
+        with self.req.batch():
+            for tid in self.get_selected_tasks():
+                self.req.update_task(tid, status=status)
+
+    def get_motion_stats(self):
+        """
+        Returns how many pointer motion events were received, applied and
+        dropped (coalesced into a later one) by this view.
+        """
+        if self.motion is None:
+            return {}
+        return self.motion.get_stats()
 
     @abc.abstractmethod
     def first_day(self):
@@ -39,6 +230,24 @@ class ViewBase:
         """ Updates all the content whenever a change is required. """
         return
 
+    def refresh(self):
+        """
+        Updates the content after tasks were changed, unless the changes are
+        being batched (see Requester.batch): the view is then updated once,
+        at the end of the batch.
+        """
+        if not self.req.in_batch():
+            self.update()
+
+    def is_shown(self):
+        """ Returns True if the view is on screen. """
+        return True
+
+    def on_batch_done(self, changes):
+        """ Relayouts once after a batch of changes, if on screen. """
+        if changes and self.is_shown():
+            self.update()
+
     @abc.abstractmethod
     def next(self, days=None):
         """
@@ -112,30 +321,56 @@ class ViewBase:
 
     def add_new_task(self, title, start_date, due_date, color):
         new_task = self.req.new_task()
-        new_task.set_title(title)
-        new_task.set_start_date(start_date)
-        new_task.set_due_date(due_date)
-        new_task.set_color(color)
+        self.req.update_task(new_task.get_id(), title=title, start=start_date,
+                             due=due_date, color=color)
         self.selected_task = new_task.get_id()
-        self.update()
+        self.refresh()
 
     def edit_task(self, tid, new_title=None, new_start_date=None,
                   new_due_date=None, is_done=False):
-        task = self.req.get_task(tid)
+        fields = {}
         if new_title:
-            task.set_title(new_title)
+            fields['title'] = new_title
         if new_start_date:
-            task.set_start_date(new_start_date)
+            fields['start'] = new_start_date
         if new_due_date:
-            task.set_due_date(new_due_date)
+            fields['due'] = new_due_date
         if is_done is not None:
             if is_done:
-                task.set_status(Task.STA_DONE)
+                fields['status'] = Task.STA_DONE
             else:
-                task.set_status(Task.STA_ACTIVE)
-        self.update()
+                fields['status'] = Task.STA_ACTIVE
+        self.req.update_task(tid, **fields)
+        self.refresh()
+
+    def set_dragged_dates(self, tid, start=None, due=None):
+        """
+        Moves the task @tid being dragged to the given @start and/or @due
+        dates, changing them directly on the Task, with the write lock held
+        (see DataStore.writing). Nothing is notified until
+        commit_dragged_task().
+        """
+        with self.req.writing():
+            task = self.req.get_task_for_write(tid)
+            if task is None:
+                return
+            if start is not None:
+                task.set_start_date(start)
+            if due is not None:
+                task.set_due_date(due)
+
+    def commit_dragged_task(self, tid):
+        """
+        Records the dates a task was dragged to. While dragging, dates are
+        changed directly on the Task to keep motion cheap; this reports the
+        final ones once, through the requester.
+        """
+        task = self.req.get_task(tid)
+        if task is not None:
+            self.req.update_task(tid, start=task.get_start_date(),
+                                 due=task.get_due_date())
 
     def delete_task(self, tid):
         self.req.delete_task(tid)
         self.unselect_task()
-        self.update()
+        self.refresh()
@@ -2,12 +2,17 @@ from gi.repository import Gtk, Gdk, GObject
 import datetime
 
 from week import WeekSpan
-from drawtask import DrawTask, TASK_HEIGHT
+from drawtask import TASK_HEIGHT
 from all_day_tasks import AllDayTasks
 from header import Header
 from grid import Grid
 import utils
+import layout
 from view import ViewBase
+from motion import MotionCoalescer
+from perf import counters
+import tracing
+from tracing import traced
 
 
 class WeekView(ViewBase, Gtk.VBox):
@@ -46,6 +51,7 @@ class WeekView(ViewBase, Gtk.VBox):
         # AllDayTasks widget
         self.all_day_tasks = AllDayTasks(self, cols=self.numdays)
         self.scroll.add_with_viewport(self.all_day_tasks)
+        self.all_day_tasks.selected_tasks = self.selected_tasks
 
         # drag-and-drop support
         self.drag_offset = None
@@ -54,10 +60,11 @@ class WeekView(ViewBase, Gtk.VBox):
 
         # handle the AllDayTasks DnD events
         self.all_day_tasks.connect("button-press-event", self.dnd_start)
-        self.all_day_tasks.connect("motion-notify-event", self.motion_notify)
+        self.motion = MotionCoalescer(self.all_day_tasks, self.motion_notify)
+        self.all_day_tasks.connect("motion-notify-event",
+                                   self.motion.on_motion_event)
         self.all_day_tasks.connect("button-release-event", self.dnd_stop)
-
-        self.connect("size-allocate", self.on_size_allocate)
+        self.all_day_tasks.set_relayout_callback(self.on_size_allocate)
 
     def on_scroll(self, widget, event):
         """
@@ -80,8 +87,22 @@ class WeekView(ViewBase, Gtk.VBox):
     def unselect_task(self):
         """ Unselects the task that was selected before. """
         self.selected_task = None
+        self.selected_tasks.clear()
         self.all_day_tasks.selected_task = None
 
+    def is_shown(self):
+        """ Returns True if the view is on screen. """
+        return self.get_mapped()
+
+    def get_cell_at(self, x, y):
+        """ Returns the (row, col) of the grid cell at position (@x, @y). """
+        col = utils.convert_coordinates_to_col(x, self.get_day_width())
+        return 0, min(max(col, 0), self.numdays - 1)
+
+    def days_between_cells(self, cell_a, cell_b):
+        """ Returns how many days are between two (row, col) cells. """
+        return cell_b[1] - cell_a[1]
+
     def first_day(self):
         """ Returns the first day of the view being displayed """
         return self.week.start_date
@@ -102,9 +123,13 @@ class WeekView(ViewBase, Gtk.VBox):
         self.week.week_containing_day(datetime.date.today())
         self.update()
 
-    def on_size_allocate(self, widget=None, event=None):
-        """ Calculates new day_width when window is resized """
-        pass
+    def on_size_allocate(self):
+        """
+        Called once resizing settled down. Task positions are kept in grid
+        coordinates, so only the redraw bookkeeping must catch up with the
+        new day width.
+        """
+        self.all_day_tasks.queue_draw_changes()
 
     def on_vadjustment_changed(self, a):
         """ Verify if the scrollbar is needed, and notifies header of that """
@@ -113,6 +138,7 @@ class WeekView(ViewBase, Gtk.VBox):
         else:
             self.header.set_sidebar_size(15)
 
+    @traced('view')
     def compute_size(self):
         """ Computes and requests the size needed to draw everything. """
         width = self.min_day_width * self.numdays
@@ -127,6 +153,7 @@ class WeekView(ViewBase, Gtk.VBox):
         """
         self.week.set_week_starting_on(start)
 
+    @traced('view')
     def update_header(self, format="%a %m/%d"):
         """
         Updates the header label of the days to be drawn given a specific
@@ -142,7 +169,8 @@ class WeekView(ViewBase, Gtk.VBox):
         days = [d.split() for d in days]
         self.header.set_labels(days)
         self.header.queue_draw()
-        self.emit('dates-changed')
+        with tracing.span('dates-changed', 'view'):
+            self.emit('dates-changed')
 
     def set_task_drawing_position(self, dtask):
         """
@@ -150,26 +178,16 @@ class WeekView(ViewBase, Gtk.VBox):
 
         @param dtask: a DrawingTask object.
         """
-        task = self.req.get_task(dtask.get_id())
-
-        start = max(task.get_start_date().date(), self.first_day())
-        end = min(task.get_due_date().date(), self.last_day())
-        duration = (end - start).days + 1
-
-        x = utils.date_to_col_coord(start, self.first_day())
-        w = duration
-        x, y, w, h = self.grid.add_to_grid(x, w, id=dtask.get_label()[4])
-
-        dtask.set_position(x, y, w, h)
-        dtask.set_overflowing_L(self.first_day())
-        dtask.set_overflowing_R(self.last_day())
+        layout.place_task(dtask, self.grid, self.first_day(), self.last_day())
 
+    @traced('view')
     def update_tasks(self):
         """ Updates and redraws everything related to the tasks """
         self.update_drawtasks()
         self.compute_size()
-        self.all_day_tasks.queue_draw()
+        self.all_day_tasks.queue_draw_changes()
 
+    @traced('view')
     def update_drawtasks(self, tasks=None):
         """
         Updates the drawtasks and calculates the position of where each one of
@@ -179,12 +197,10 @@ class WeekView(ViewBase, Gtk.VBox):
          If none is given, the tasks will be retrieved from the requester.
         """
         if not tasks:
-            tasks = [self.req.get_task(t) for t in self.req.get_tasks_tree()]
-        self.tasks = [DrawTask(t) for t in tasks if self.is_in_days_range(t)]
-
-        self.grid.clear_rows()
-        for t in self.tasks:
-            self.set_task_drawing_position(t)
+            tasks = self.req.iter_tasks_in_range(self.first_day(),
+                                                 self.last_day())
+        self.tasks = layout.layout_week(tasks, self.first_day(),
+                                        self.last_day(), self.grid)
         self.all_day_tasks.set_tasks_to_draw(self.tasks)
 
         # clears selected_task if it is not being showed
@@ -194,6 +210,7 @@ class WeekView(ViewBase, Gtk.VBox):
                 self.unselect_task()
         self.all_day_tasks.selected_task = self.selected_task
 
+    @traced('view')
     def highlight_today_cell(self):
         """ Highlights the cell equivalent to today."""
         row = 0
@@ -201,17 +218,21 @@ class WeekView(ViewBase, Gtk.VBox):
         self.all_day_tasks.set_today_cell(row, col)
         self.header.set_highlight_cell(0, col)
 
+    @traced('view')
     def update(self):
         """
         Updates the header, the content to be drawn (tasks), recalculates the
         size needed and then redraws everything.
         """
+        counters.begin_update()
         self.update_drawtasks()
         self.compute_size()
         self.highlight_today_cell()
         self.update_header()
-        self.all_day_tasks.queue_draw()
+        counters.end_update()
+        self.all_day_tasks.queue_draw_changes()
 
+    @traced('view')
     def next(self, days=None):
         """
         Advances the dates being displayed by a given number of @days.
@@ -228,6 +249,7 @@ class WeekView(ViewBase, Gtk.VBox):
         self.week.adjust(days)
         self.update()
 
+    @traced('view')
     def previous(self, days=None):
         """
         Regresses the dates being displayed by a given number of @days.
@@ -246,6 +268,9 @@ class WeekView(ViewBase, Gtk.VBox):
 
     def dnd_start(self, widget, event):
         """ User clicked the mouse button, starting drag and drop """
+        self.motion.flush()
+        if self.selection_press(widget, event):
+            return
         # find which task was clicked, if any
         self.selected_task, self.drag_action, cursor = \
             self.all_day_tasks.identify_pointed_object(event, clicked=True)
@@ -279,6 +304,8 @@ class WeekView(ViewBase, Gtk.VBox):
 
     def motion_notify(self, widget, event):
         """ User moved mouse over widget """
+        if self.selection_motion(event):
+            return
         # dragging with no task selected: new task will be created
         if not self.selected_task and self.drag_offset:
             self.is_dragging = True
@@ -295,8 +322,7 @@ class WeekView(ViewBase, Gtk.VBox):
                 row = 0
                 col = start_col + i
                 cells.append((row, col))
-            self.all_day_tasks.cells = cells
-            self.all_day_tasks.queue_draw()
+            self.all_day_tasks.set_cells(cells)
             return
 
         if self.selected_task and self.drag_offset:  # a task was clicked
@@ -317,22 +343,22 @@ class WeekView(ViewBase, Gtk.VBox):
                 diff = start_date - day
                 new_start_day = start_date - diff
                 if new_start_day <= end_date:
-                    task.set_start_date(new_start_day)
+                    self.set_dragged_dates(task.get_id(), start=new_start_day)
                 pass
 
             elif self.drag_action == "expand_right":
                 diff = end_date - day
                 new_due_day = end_date - diff
                 if new_due_day >= start_date:
-                    task.set_due_date(new_due_day)
+                    self.set_dragged_dates(task.get_id(), due=new_due_day)
                 pass
 
             else:
                 new_start_day = self.first_day() + \
                     datetime.timedelta(days=weekday)
                 new_due_day = new_start_day + datetime.timedelta(days=duration)
-                task.set_start_date(new_start_day)
-                task.set_due_date(new_due_day)
+                self.set_dragged_dates(task.get_id(), new_start_day,
+                                       new_due_day)
 
             self.update()
 
@@ -346,6 +372,11 @@ class WeekView(ViewBase, Gtk.VBox):
         User released a button, stopping drag and drop.
         Selected task, if any, will still have the focus.
         """
+        self.motion.flush()
+        if self.selection_release(event):
+            widget.get_window().set_cursor(
+                Gdk.Cursor.new(Gdk.CursorType.ARROW))
+            return
         # dragging with no task selected: new task will be created
         if not self.selected_task and self.is_dragging:
             day_width = self.get_day_width()
@@ -362,13 +393,12 @@ class WeekView(ViewBase, Gtk.VBox):
             due_date = self.first_day() + datetime.timedelta(days=end)
 
             GObject.idle_add(self.emit, 'on_add_task', start_date, due_date)
-            self.all_day_tasks.queue_draw()
-            self.all_day_tasks.cells = []
+            self.all_day_tasks.set_cells([])
 
         # user didn't click on a task - redraw to 'unselect' task
         elif not self.selected_task:
             self.unselect_task()
-            self.all_day_tasks.queue_draw()
+            self.all_day_tasks.queue_draw_changes()
 
         # only changes selected task if any form of dragging ocurred
         elif self.is_dragging:
@@ -390,10 +420,11 @@ class WeekView(ViewBase, Gtk.VBox):
 
             if not self.drag_action == "expand_right" \
                and new_start_day <= end:
-                task.set_start_date(new_start_day)
+                self.set_dragged_dates(task.get_id(), start=new_start_day)
             if not self.drag_action == "expand_left" \
                and new_due_day >= start:
-                task.set_due_date(new_due_day)
+                self.set_dragged_dates(task.get_id(), due=new_due_day)
+            self.commit_dragged_task(task.get_id())
             self.unselect_task()
             self.update_tasks()
 